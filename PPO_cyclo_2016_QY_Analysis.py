@@ -1,14 +1,13 @@
 import copy
 import itertools
-import matplotlib.pyplot as plt
 import numpy as np
-import scipy as sp
-import statsmodels.api as sm
 
 
 import PTI.Corrections as PTICorr
-from PTI.ReadDataFiles import PTIData
 import PTI.QuantumYield as PTIQY
+import PTI.Loader as PTILoad
+import PTI.QYGrid as PTIGrid
+import PTI.PeakFitting as PTIPeaks
 
 # <editor-fold desc="Importing">
 # The file paths for the blank cyclohexane measurements
@@ -20,14 +19,12 @@ PPO_cyclo_paths = ["Henry/Emission/PPOcyclo/Jul7/pt04mMPPOcyclo2pt5g.txt",
                    "Henry/Emission/PPOcyclo/Jul7/4pt3mMPPOcyclo2pt5g.txt"]
 
 
-def convert_paths_to_PTIData_objs(list_of_paths):
-    list_of_PTIData = list()
-    for path in list_of_paths:
-        list_of_PTIData.append(PTIData(path))
-    return list_of_PTIData
+cyclo = PTILoad.load(cyclo_paths)[0]
+PPO_cyclo = PTILoad.load(PPO_cyclo_paths)[0]
 
-cyclo = convert_paths_to_PTIData_objs(cyclo_paths)
-PPO_cyclo = convert_paths_to_PTIData_objs(PPO_cyclo_paths)
+# Fit the excitation peaks of every spectrum together, once, up front; every
+# shift_LUT=True correction below reuses these fits
+PTIPeaks.cached_excitation_peaks(cyclo + PPO_cyclo)
 # </editor-fold>
 
 DEFAULT_EX_MONOCHROMATOR_SHIFT = 2.5
@@ -62,36 +59,16 @@ def QY_analysis(correction_region_start = DEFAULT_CORRECTION_REGION_START,
                                                      const_diode = const_diode,
                                                      use_baseline_se=use_baseline_se)
                       for i in range(len(PPO_cyclo))]
-    QYs = list()
-    correction_ratios = list()
-    for blank, fluor in zip(3*corrected_cyclo, corrected_PPO_cyclo):
-        # Define the emission region used for the quantum yield calculation
-        ex_wavelength = blank.ex_range[0]
-        ex_delta = 10
-        ex_int_range = [ex_wavelength - ex_delta, ex_wavelength + ex_delta]
-
-        em_int_range = [325, 600]
-        correction_int_range = [correction_region_start, 600]
-
-        # QY
-        num_absorbed = PTIQY.integrate_between(blank, fluor, ex_int_range)
-        num_emitted = PTIQY.integrate_between(fluor, blank, em_int_range)
-        correction_area = PTIQY.integrate_between(fluor, blank, correction_int_range)
-
-        QYs.append(num_emitted / num_absorbed)
-        correction_ratios.append(correction_area / num_emitted)
-
-    correction_ratios = np.array(correction_ratios)
-    first_ratio = correction_ratios[0]
-    ratio_accepted_error = 0.1
-    similar_ratios = correction_ratios[np.where(abs(correction_ratios - first_ratio) < ratio_accepted_error)]
-
-    corrected_QYs = [QYs[i] * correction_ratios[i] / np.mean(similar_ratios)
-                                 for i in range(len(QYs))]
-    return corrected_QYs, correction_ratios
+    # Absorption within ex_delta of each excitation wavelength, emission over em_int_range
+    result = PTIQY.pair_quantum_yields(3*corrected_cyclo, corrected_PPO_cyclo, ex_delta=10,
+                                       em_int_range=[325, 600],
+                                       correction_int_range=[correction_region_start, 600],
+                                       ratio_accepted_error=0.1)
+    corrected_QYs = list(result['corrected_QY'])
+    correction_ratios = result['correction_ratio']
 
+    return corrected_QYs, correction_ratios
 
-QYs = list()
 
 LUT_interpolation_options = [(a,b) for a in ['linear', 'slinear', 'quadratic', 'cubic'] for b in ['linear', 'slinear', 'quadratic', 'cubic']]
 LUT_splitting_options = [(a,b) for a in ['none', 'even', 'odd'] for b in ['none', 'even', 'odd']]
@@ -179,32 +156,18 @@ def run_correction_region_options():
 
 
 def run_all_options():
-    f = open("QY Uncertainty Data/PPO_cyclo/all_options.txt", 'w+')
-    f.write("Shift LUT?,Intercept SE, Slope SE, Ex LUT Interpolation, Em LUT Interpolation," +
-            "Ex LUT Split, Em LUT Split, Constant Diode, Start of Correction Region, 0.04 mM, 0.43 mM, 4.3 mM\n")
-    for start in correction_region_initial_wavelengths_long_step:
-        for shift_LUT in LUT_shifting_options:
-            for use_baseline_se in baseline_se_options:
-                for ex_LUT_interpolation, em_LUT_interpolation in LUT_interpolation_options:
-                    for ex_LUT_split, em_LUT_split in LUT_splitting_options:
-                        for const_diode in const_diode_options:
-                            f.write(str(shift_LUT) + ',')
-                            f.write(use_baseline_se[0] + ',' + use_baseline_se[0] + ',')
-                            f.write(ex_LUT_interpolation + ',' + em_LUT_interpolation + ',')
-                            f.write(ex_LUT_split + ',' + em_LUT_split + ',')
-                            f.write(str(const_diode) + ',')
-                            f.write(str(start))
-
-                            for item in QY_analysis(correction_region_start=start,
-                                                    ex_LUT_interpolation= ex_LUT_interpolation,
-                                                    em_LUT_interpolation=em_LUT_interpolation,
-                                                    shift_LUT=shift_LUT,
-                                                    ex_LUT_split=ex_LUT_split,
-                                                    em_LUT_split=em_LUT_split,
-                                                    const_diode=const_diode)[0]:
-                                f.write(',' + str(item))
-                            f.write('\n')
-    f.close()
+    grid = [('correction_region_start', correction_region_initial_wavelengths_long_step),
+            ('shift_LUT', LUT_shifting_options),
+            ('use_baseline_se', baseline_se_options),
+            (('ex_LUT_interpolation', 'em_LUT_interpolation'), LUT_interpolation_options),
+            (('ex_LUT_split', 'em_LUT_split'), LUT_splitting_options),
+            ('const_diode', const_diode_options)]
+    PTIGrid.write_QY_grid(3*cyclo, PPO_cyclo, grid, "QY Uncertainty Data/PPO_cyclo/all_options.txt",
+                          baseline_fit_ranges=3 * [[[300, 305], [320, 600]]],
+                          fluor_baseline_fit_ranges=3 * [[[300, 305], [450, 600]]],
+                          ex_delta=10, em_int_range=[325, 600], correction_region_end=600,
+                          ex_shift=DEFAULT_EX_MONOCHROMATOR_SHIFT, em_shift=DEFAULT_EM_MONOCHROMATOR_SHIFT,
+                          result_headers=['0.04 mM', '0.43 mM', '4.3 mM'])
 
 # print QY_analysis()[0]
 
@@ -2,13 +2,12 @@ import copy
 import itertools
 import matplotlib.pyplot as plt
 import numpy as np
-import scipy as sp
-import statsmodels.api as sm
 
 
 import PTI.Corrections as PTICorr
-from PTI.ReadDataFiles import PTIData
 import PTI.QuantumYield as PTIQY
+import PTI.Loader as PTILoad
+import PTI.ParameterSweep as PTISweep
 
 # <editor-fold desc="Importing">
 # The file paths for the blank cyclohexane measurements
@@ -20,14 +19,8 @@ PPO_cyclo_paths = ["Henry/Emission/PPOcyclo/Jul7/pt04mMPPOcyclo2pt5g.txt",
                    "Henry/Emission/PPOcyclo/Jul7/4pt3mMPPOcyclo2pt5g.txt"]
 
 
-def convert_paths_to_PTIData_objs(list_of_paths):
-    list_of_PTIData = list()
-    for path in list_of_paths:
-        list_of_PTIData.append(PTIData(path))
-    return list_of_PTIData
-
-cyclo = convert_paths_to_PTIData_objs(cyclo_paths)
-PPO_cyclo = convert_paths_to_PTIData_objs(PPO_cyclo_paths)
+cyclo = PTILoad.load(cyclo_paths)[0]
+PPO_cyclo = PTILoad.load(PPO_cyclo_paths)[0]
 # </editor-fold>
 
 DEFAULT_EX_MONOCHROMATOR_SHIFT = 2.5
@@ -220,68 +213,57 @@ def run_correction_region_options():
     print "Finished running correction region options"
 
 
-def run_all_options():
-    f = open("QY Uncertainty Data/PPO_cyclo/all_options.txt",'w+')
-    f.write("Shift LUT?,Intercept SE,Slope SE,Ex LUT Interpolation,Em LUT Interpolation," +
-            "Ex LUT Split,Em LUT Split,Constant Diode,Start of Correction Region,0.04 mM,0.43 mM,4.3 mM\n")
-    for start in correction_region_initial_wavelengths:
-        for shift_LUT in LUT_shifting_options:
-            for use_baseline_se in baseline_se_options:
-                for ex_LUT_interpolation, em_LUT_interpolation in LUT_interpolation_options:
-                    for ex_LUT_split, em_LUT_split in LUT_splitting_options:
-                        for const_diode in const_diode_options:
-                            f.write(str(shift_LUT) + ',')
-                            f.write(use_baseline_se[0] + ',' + use_baseline_se[0] + ',')
-                            f.write(ex_LUT_interpolation + ',' + em_LUT_interpolation + ',')
-                            f.write(ex_LUT_split + ',' + em_LUT_split + ',')
-                            f.write(str(const_diode) + ',')
-                            f.write(str(start))
-
-                            for item in QY_analysis(correction_region_start=start,
-                                                    ex_LUT_interpolation= ex_LUT_interpolation,
-                                                    em_LUT_interpolation=em_LUT_interpolation,
-                                                    shift_LUT=shift_LUT,
-                                                    ex_LUT_split=ex_LUT_split,
-                                                    em_LUT_split=em_LUT_split,
-                                                    const_diode=const_diode)[0]:
-                                f.write(',' + str(item))
-                            f.write('\n')
-    f.close()
+def all_options_QYs(**options):
+    return QY_analysis(**options)[0]
 
-print QY_analysis()[0]
-
-run_baseline_options()
-run_const_diode_options()
-run_LUT_interpolation_options()
-run_LUT_splitting_options()
-run_LUT_shifting_options()
-run_correction_region_options()
-run_all_options()
-
-fig = plt.figure(figsize=(16,20))
-axl = plt.subplot2grid((2,2), (0,0))
-axr = plt.subplot2grid((2,2), (0,1), sharey=axl)
-axb = plt.subplot2grid((2,2), (1,0), colspan=2)
-fig.suptitle("Effect of Difference between Blank Baseline and Fluor Baseline\n(27 points - 9 error variations for each concentration", fontsize=20)
-
-
-axl.scatter(baseline_diffs[::3], number_absorbed[::3], c='r', label='0.04 mM')
-axl.scatter(baseline_diffs[1::3], number_absorbed[1::3], c='g', label='0.43 mM')
-axl.scatter(baseline_diffs[2::3], number_absorbed[2::3], c='b', label='4.3 mM')
-axl.set_title("Number of Photons Absorbed")
-axl.legend()
-
-axr.scatter(baseline_diffs[::3], number_emitted[::3], c='r', label='0.04 mM')
-axr.scatter(baseline_diffs[1::3], number_emitted[1::3], c='g', label='0.43 mM')
-axr.scatter(baseline_diffs[2::3], number_emitted[2::3], c='b', label='4.3 mM')
-axr.set_title("Number of Photons Emitted")
-axr.legend()
-
-axb.scatter(baseline_diffs[::3], qys[::3], c='r', label='0.04 mM')
-axb.scatter(baseline_diffs[1::3], qys[1::3], c='g', label='0.43 mM')
-axb.scatter(baseline_diffs[2::3], qys[2::3], c='b', label='4.3 mM')
-axb.set_xlabel("Average Difference between Blank Baseline and Fluor Baselines")
-axb.set_title("Calculated Quantum Yield")
-axb.legend()
-
-plt.show()
+
+def run_all_options():
+    grid = [('correction_region_start', correction_region_initial_wavelengths),
+            ('shift_LUT', LUT_shifting_options),
+            ('use_baseline_se', baseline_se_options),
+            (('ex_LUT_interpolation', 'em_LUT_interpolation'), LUT_interpolation_options),
+            (('ex_LUT_split', 'em_LUT_split'), LUT_splitting_options),
+            ('const_diode', const_diode_options)]
+    PTISweep.run_sweep(all_options_QYs, grid, "QY Uncertainty Data/PPO_cyclo/all_options.txt",
+                       result_headers=['0.04 mM', '0.43 mM', '4.3 mM'])
+
+# The sweep's worker processes import this script; under the spawn start
+# method they must not run it again
+if __name__ == '__main__':
+    print QY_analysis()[0]
+
+    run_baseline_options()
+    run_const_diode_options()
+    run_LUT_interpolation_options()
+    run_LUT_splitting_options()
+    run_LUT_shifting_options()
+    run_correction_region_options()
+    run_all_options()
+
+    fig = plt.figure(figsize=(16,20))
+    axl = plt.subplot2grid((2,2), (0,0))
+    axr = plt.subplot2grid((2,2), (0,1), sharey=axl)
+    axb = plt.subplot2grid((2,2), (1,0), colspan=2)
+    fig.suptitle("Effect of Difference between Blank Baseline and Fluor Baseline\n(27 points - 9 error variations for each concentration", fontsize=20)
+
+
+    axl.scatter(baseline_diffs[::3], number_absorbed[::3], c='r', label='0.04 mM')
+    axl.scatter(baseline_diffs[1::3], number_absorbed[1::3], c='g', label='0.43 mM')
+    axl.scatter(baseline_diffs[2::3], number_absorbed[2::3], c='b', label='4.3 mM')
+    axl.set_title("Number of Photons Absorbed")
+    axl.legend()
+
+    axr.scatter(baseline_diffs[::3], number_emitted[::3], c='r', label='0.04 mM')
+    axr.scatter(baseline_diffs[1::3], number_emitted[1::3], c='g', label='0.43 mM')
+    axr.scatter(baseline_diffs[2::3], number_emitted[2::3], c='b', label='4.3 mM')
+    axr.set_title("Number of Photons Emitted")
+    axr.legend()
+
+    axb.scatter(baseline_diffs[::3], qys[::3], c='r', label='0.04 mM')
+    axb.scatter(baseline_diffs[1::3], qys[1::3], c='g', label='0.43 mM')
+    axb.scatter(baseline_diffs[2::3], qys[2::3], c='b', label='4.3 mM')
+    axb.set_xlabel("Average Difference between Blank Baseline and Fluor Baselines")
+    axb.set_title("Calculated Quantum Yield")
+    axb.legend()
+
+    plt.show()
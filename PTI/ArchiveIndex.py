@@ -0,0 +1,176 @@
+'''
+A persistent, header-only index of PTI data files.
+
+The header of every file under a directory is read (without parsing any
+data) and stored in an SQLite table, so experiments can be selected without
+loading the archive:
+
+    from PTI.ArchiveIndex import ArchiveIndex
+
+    index = ArchiveIndex("spectra_index.sqlite")
+    index.update("Henry")
+    paths = index.query(run_type='Emission', ex_wavelength=310,
+                        acquired_after='2016-08-01', acquired_before='2016-09-01')
+    for data in index.load(run_type='Emission', ex_wavelength=310):
+        # data are parsed here, on first use
+        ...
+
+Rescans are incremental: a file is only re-read when its modification time
+or size has changed, and rows for files that have disappeared are dropped.
+'''
+import os
+import sqlite3
+import time
+
+from PTI.Loader import find_data_files
+from PTI.ReadDataFiles import PTIData
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS spectra (
+    path        TEXT PRIMARY KEY,
+    mtime       REAL,
+    size        INTEGER,
+    read_ok     INTEGER,
+    file_type   TEXT,
+    run_type    TEXT,
+    ex_start    REAL,
+    ex_end      REAL,
+    em_start    REAL,
+    em_end      REAL,
+    num_samples INTEGER,
+    step_size   REAL,
+    pmt_mode    TEXT,
+    acq_start   TEXT
+)'''
+
+COLUMNS = ['path', 'mtime', 'size', 'read_ok', 'file_type', 'run_type',
+           'ex_start', 'ex_end', 'em_start', 'em_end',
+           'num_samples', 'step_size', 'pmt_mode', 'acq_start']
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def read_header_row(path):
+    '''Read the header of one file into a row of the spectra table.'''
+    stat = os.stat(path)
+    row = dict.fromkeys(COLUMNS)
+    row.update(path=path, mtime=stat.st_mtime, size=stat.st_size, read_ok=0)
+
+    try:
+        data = PTIData(path, header_only=True)
+    except Exception as exc:
+        print("ERROR!! Could not read the header of %s (%s: %s)" % (path, type(exc).__name__, exc))
+        return row
+    if not data.read_success:
+        return row
+
+    ex_range = [val for val in data.ex_range if val >= 0]
+    em_range = [val for val in data.em_range if val >= 0]
+    row.update(read_ok=1,
+               file_type=data.file_type.name,
+               run_type=data.RunType.name,
+               num_samples=data.num_samples,
+               pmt_mode=data.PMT_mode,
+               acq_start=time.strftime(TIME_FORMAT, data.acq_start))
+    if ex_range:
+        row.update(ex_start=min(ex_range), ex_end=max(ex_range))
+    if em_range:
+        row.update(em_start=min(em_range), em_end=max(em_range))
+
+    # The step is not in the header; infer it from whichever range is scanned
+    scanned = ex_range if data.RunType == data.run_types.Excitation else em_range
+    if len(scanned) > 1 and data.num_samples > 1:
+        row['step_size'] = (scanned[-1] - scanned[0]) / float(data.num_samples - 1)
+    return row
+
+
+class ArchiveIndex(object):
+    '''SQLite-backed header index of a PTI data archive.'''
+    def __init__(self, db_path='spectra_index.sqlite'):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def update(self, path_or_paths):
+        '''
+        Bring the index up to date for a directory (or glob pattern, or list
+        of files). Returns the number of (added or changed, removed) files.
+        '''
+        if isinstance(path_or_paths, (str, type(u''))):
+            paths = find_data_files(path_or_paths)
+        else:
+            paths = sorted(path_or_paths)
+        paths = [os.path.normpath(path) for path in paths]
+
+        known = dict((row[0], (row[1], row[2])) for row in
+                     self.connection.execute('SELECT path, mtime, size FROM spectra'))
+
+        changed = list()
+        for path in paths:
+            stat = os.stat(path)
+            if known.get(path) != (stat.st_mtime, stat.st_size):
+                changed.append(read_header_row(path))
+
+        # Files that were under a rescanned directory but are now gone
+        removed = list()
+        if isinstance(path_or_paths, (str, type(u''))) and os.path.isdir(path_or_paths):
+            root = os.path.normpath(path_or_paths) + os.sep
+            present = set(paths)
+            removed = [path for path in known if path.startswith(root) and path not in present]
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO spectra (%s) VALUES (%s)' % (
+                    ', '.join(COLUMNS), ', '.join(':' + col for col in COLUMNS)),
+                changed)
+            self.connection.executemany('DELETE FROM spectra WHERE path = ?',
+                                        [(path,) for path in removed])
+        return len(changed), len(removed)
+
+    def query(self, run_type=None, file_type=None, pmt_mode=None,
+              ex_wavelength=None, em_wavelength=None,
+              acquired_after=None, acquired_before=None,
+              path_contains=None, min_samples=None):
+        '''
+        Returns the sorted paths of readable files matching every given filter.
+        - run_type/file_type: names from PTIData.run_types/file_types, e.g. 'Emission'.
+        - ex_wavelength/em_wavelength: a wavelength inside the file's ex/em range.
+        - acquired_after/acquired_before: 'YYYY-mm-dd[ HH:MM:SS]' (after is
+          inclusive, before is exclusive).
+        '''
+        clauses = ['read_ok = 1']
+        args = list()
+        for column, value in [('run_type', run_type), ('file_type', file_type),
+                              ('pmt_mode', pmt_mode)]:
+            if value is not None:
+                clauses.append('%s = ?' % column)
+                args.append(value)
+        for prefix, value in [('ex', ex_wavelength), ('em', em_wavelength)]:
+            if value is not None:
+                clauses.append('%s_start <= ? AND %s_end >= ?' % (prefix, prefix))
+                args += [value, value]
+        if acquired_after is not None:
+            clauses.append('acq_start >= ?')
+            args.append(acquired_after)
+        if acquired_before is not None:
+            clauses.append('acq_start < ?')
+            args.append(acquired_before)
+        if path_contains is not None:
+            clauses.append('instr(path, ?) > 0')
+            args.append(path_contains)
+        if min_samples is not None:
+            clauses.append('num_samples >= ?')
+            args.append(min_samples)
+
+        cursor = self.connection.execute(
+            'SELECT path FROM spectra WHERE %s ORDER BY path' % ' AND '.join(clauses), args)
+        return [row[0] for row in cursor]
+
+    def load(self, **filters):
+        '''List of lazy PTIData objects for the files matching query(**filters);
+        only the headers are read until the data of an object are used.'''
+        return [PTIData(path, lazy=True) for path in self.query(**filters)]
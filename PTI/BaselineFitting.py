@@ -12,11 +12,11 @@ def polynomial_baseline_params(PTIData, poly_degree, list_of_ranges):
     for arange in list_of_ranges:
         start = arange[0]
         end = arange[1]
-        x = numpy.append(x, numpy.arange(start, end+PTIData.step_size, PTIData.step_size))
-        
+
         select_by_wavelength = numpy.where((PTIData.wavelengths >= start) &
                                            (PTIData.wavelengths <= end))
 
+        x = numpy.append(x, PTIData.wavelengths[select_by_wavelength])
         y = numpy.append(y, PTIData.raw_data[select_by_wavelength])
 
     fit_params =  numpy.polyfit(x, y, deg=poly_degree)
@@ -0,0 +1,134 @@
+'''
+Process-wide registry of the correction look-up tables in PTI/correction_data.
+
+Each table is read from disk once, and the interpolators built over it are
+kept keyed by (table, interpolation kind, split), so repeated corrections
+only evaluate an existing interpolator:
+
+    import PTI.CorrectionLUTs as PTILUT
+
+    wavelengths, values = PTILUT.table('excorr', split='even')
+    excorr_at_310 = PTILUT.interpolator('excorr', 'cubic', 'even')(310)
+
+At most max_interpolators interpolators are kept; the least recently used
+one is dropped when a new one is built. Call invalidate() after a
+calibration file has been replaced so it is read again.
+'''
+import collections
+import os
+import numpy
+
+import PTI.Profiling as PTIProf
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'correction_data')
+
+# name: (file, first wavelength, last wavelength, step, fill outside the table)
+# 'edge' holds the first/last value; 'extrapolate' extends the interpolant
+TABLES = {'excorr': ('excorr.txt', 250, 750, 1, 'edge'),
+          'emcorr-sphere-quanta': ('emcorr-sphere-quanta.txt', 300, 848, 2, 'extrapolate'),
+          'emcorri': ('emcorri.txt', 250, 850, 2, 'extrapolate')}
+
+# Every value, or every other value starting from the first/second
+SPLITS = ('none', 'even', 'odd')
+
+max_interpolators = 64
+
+# Incremented by invalidate(); results derived from the tables can include it
+# in their cache keys to notice that the tables were reloaded
+generation = 0
+
+_values = dict()
+_tables = dict()
+_interpolators = collections.OrderedDict()
+cache_info = {'hits': 0, 'misses': 0}
+
+
+def _read_values(name):
+    if name not in _values:
+        with PTIProf.stage('CorrectionLUTs.read'):
+            values = numpy.genfromtxt(os.path.join(DATA_DIR, TABLES[name][0]),
+                                      skip_header = 6,
+                                      skip_footer = 1,
+                                      usecols = 1)
+        values.flags.writeable = False
+        _values[name] = values
+    return _values[name]
+
+
+def table(name, split='none'):
+    '''
+    (wavelengths, values) of a correction table, read on first use.
+    The arrays are shared between callers and are read-only.
+    '''
+    split = split.lower()
+    key = (name, split)
+    if key in _tables:
+        return _tables[key]
+
+    if name not in TABLES:
+        raise KeyError("Unknown correction table %s; expected one of %s" % (name, sorted(TABLES)))
+    _, LUT_start, LUT_end, LUT_step, _ = TABLES[name]
+    values = _read_values(name)
+
+    if split == 'none':
+        pass
+    elif split == 'even':
+        values = values[::2]
+        LUT_step *= 2
+    elif split == 'odd':
+        values = values[1::2]
+        LUT_start += LUT_step
+        LUT_end -= LUT_step
+        LUT_step *= 2
+    else:
+        raise ValueError("Not a valid method for splitting LUT: %s" % split)
+
+    wavelengths = numpy.arange(LUT_start, LUT_end + LUT_step, LUT_step)
+    wavelengths.flags.writeable = False
+    _tables[key] = (wavelengths, values)
+    return _tables[key]
+
+
+def interpolator(name, kind='cubic', split='none'):
+    '''The interp1d of kind over table(name, split), built on first use.'''
+    key = (name, kind, split.lower())
+    if key in _interpolators:
+        cache_info['hits'] += 1
+        # Mark as most recently used
+        _interpolators[key] = _interpolators.pop(key)
+        return _interpolators[key]
+
+    cache_info['misses'] += 1
+    from scipy.interpolate import interp1d
+
+    wavelengths, values = table(name, split)
+    if TABLES[name][4] == 'edge':
+        fill_value = (values[0], values[-1])
+        bounds_error = False
+    else:
+        fill_value = 'extrapolate'
+        bounds_error = None
+    with PTIProf.stage('CorrectionLUTs.build'):
+        function = interp1d(x=wavelengths,
+                            y=values,
+                            kind=kind,
+                            bounds_error=bounds_error,
+                            fill_value=fill_value)
+
+    _interpolators[key] = function
+    while len(_interpolators) > max_interpolators:
+        _interpolators.popitem(last=False)
+    return function
+
+
+def invalidate(name=None):
+    '''
+    Forget a table (or every table when name is None) and the interpolators
+    built over it, so the file is read again on next use.
+    '''
+    global generation
+    generation += 1
+    for cache in [_values, _tables, _interpolators]:
+        for key in list(cache):
+            if name is None or key == name or key[0] == name:
+                del cache[key]
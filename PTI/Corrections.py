@@ -1,34 +1,91 @@
 import copy
-from scipy.interpolate import interp1d
-from scipy.optimize import curve_fit
+import weakref
 import numpy
-import matplotlib.pyplot as plt
+
+import PTI.CorrectionLUTs as PTILUT
+import PTI.PeakFitting as PTIPeaks
+import PTI.Profiling as PTIProf
+
+
+# Standard-error options for the baseline parameters
+SE_OPTIONS = ('none', 'minus', 'plus')
+SE_SIGNS = {'none': 0, 'minus': -1, 'plus': 1}
 
 
 def linear_func(x, b, m):
     return m * x + b
 
 
+def linear_fit_masked(x, Y, mask):
+    """ Exact least-squares fit of y = m * x + b to every row of Y, using only
+        the points where the corresponding row of mask is True. x is shared by
+        all rows; mask may be a single row used for all of them.
+        Returns (params, cov_matrices): params[i] is (b, m) for row i and
+        cov_matrices[i] its 2x2 covariance matrix, scaled by the residual
+        variance as curve_fit does."""
+    x = numpy.asarray(x, dtype=float)
+    Y = numpy.atleast_2d(numpy.asarray(Y, dtype=float))
+    mask = numpy.broadcast_to(mask, Y.shape)
+
+    n = mask.sum(axis=1)
+    x_mean = numpy.where(mask, x, 0).sum(axis=1) / n
+    y_mean = numpy.where(mask, Y, 0).sum(axis=1) / n
+    dx = numpy.where(mask, x - x_mean[:, None], 0)
+    dy = numpy.where(mask, Y - y_mean[:, None], 0)
+
+    Sxx = (dx * dx).sum(axis=1)
+    slope = (dx * dy).sum(axis=1) / Sxx
+    incpt = y_mean - slope * x_mean
+
+    residuals = dy - slope[:, None] * dx
+    variance = (residuals * residuals).sum(axis=1) / (n - 2)
+
+    params = numpy.column_stack([incpt, slope])
+    cov_matrices = numpy.empty((Y.shape[0], 2, 2))
+    cov_matrices[:, 0, 0] = variance * (1. / n + x_mean ** 2 / Sxx)
+    cov_matrices[:, 1, 1] = variance / Sxx
+    cov_matrices[:, 0, 1] = cov_matrices[:, 1, 0] = -variance * x_mean / Sxx
+    return params, cov_matrices
+
+
+def _ranges_mask(wavelengths, list_of_ranges, num_rows):
+    """ (num_rows x W) mask of the wavelengths inside any of the ranges.
+        list_of_ranges is either one list of [start, end] pairs for all rows,
+        or one such list per row (each with the same number of pairs)."""
+    ranges = numpy.asarray(list_of_ranges, dtype=float)
+    if ranges.ndim == 2:
+        ranges = numpy.broadcast_to(ranges, (num_rows,) + ranges.shape)
+    starts = ranges[:, :, 0, None]
+    ends = ranges[:, :, 1, None]
+    return ((wavelengths >= starts) & (wavelengths <= ends)).any(axis=1)
+
+
 def linear_baseline_params(PTIData, list_of_ranges):
-    """ Uses a least-squared routine to fit  data to a linear function.
+    """ Uses a linear least-squares solve to fit data to a linear function.
         The fit is performed over the given wavelength ranges.
-        Returns a tuple containing: ("""
+        Returns a tuple containing: (params (intercept, slope), cov_matrix)"""
 
-    X = numpy.array([])
-    Y = numpy.array([])
+    X = list()
+    Y = list()
     for arange in list_of_ranges:
         start = arange[0]
         end = arange[1]
 
-        X = numpy.append(X, numpy.arange(start, end+PTIData.step_size, PTIData.step_size))
-
         select_by_wavelength = numpy.where((PTIData.wavelengths >= start) &
                                            (PTIData.wavelengths <= end))
-        Y = numpy.append(Y, PTIData.raw_data[select_by_wavelength])
+        X.append(PTIData.wavelengths[select_by_wavelength])
+        Y.append(PTIData.raw_data[select_by_wavelength])
+
+    params, cov_matrices = linear_fit_masked(numpy.concatenate(X), numpy.concatenate(Y), True)
+
+    return(params[0], cov_matrices[0])
 
-    params, cov_matrix = curve_fit(linear_func, X, Y)
 
-    return(params, cov_matrix)
+def _se_adjusted(fit_params, errors, use_incpt_se, use_slope_se):
+    """ (intercept, slope) moved by one standard error as requested.
+        Works on scalars or on arrays of parameters."""
+    return (fit_params[0] + SE_SIGNS[use_incpt_se] * errors[0],
+            fit_params[1] + SE_SIGNS[use_slope_se] * errors[1])
 
 
 def linear_baseline(PTIData, list_of_ranges,
@@ -45,192 +102,127 @@ def linear_baseline(PTIData, list_of_ranges,
     errors = [numpy.sqrt(cov_matrix[0][0]), numpy.sqrt(cov_matrix[1][1])]
 
     # Use the standard errors to modify either parameter
-    incpt ={'none': fit_params[0],
-            'minus': fit_params[0] - errors[0],
-            'plus': fit_params[0] + errors[0]}
+    incpt, slope = _se_adjusted(fit_params, errors, use_incpt_se, use_slope_se)
 
-    slope ={'none': fit_params[1],
-            'minus': fit_params[1] - errors[1],
-            'plus': fit_params[1] + errors[1]}
-
-    baseline = linear_func(x=PTIData.wavelengths, m=slope[use_slope_se],b=incpt[use_incpt_se])
+    baseline = linear_func(x=PTIData.wavelengths, m=slope, b=incpt)
 
     # Return the baseline array as well as the fit parameters and errors.
     return baseline, fit_params, errors
 
 
+def linear_baseline_batch(wavelengths, raw_data, list_of_ranges):
+    """ Fits a linear baseline to every row of an (N x W) stack of spectra on
+        a shared wavelength grid in one solve. list_of_ranges is one list of
+        [start, end] ranges for all spectra, or one list per spectrum.
+        Returns (params, errors): (N x 2) arrays of (intercept, slope) and
+        their standard errors."""
+    wavelengths = numpy.asarray(wavelengths, dtype=float)
+    raw_data = numpy.atleast_2d(raw_data)
+    mask = _ranges_mask(wavelengths, list_of_ranges, raw_data.shape[0])
+    params, cov_matrices = linear_fit_masked(wavelengths, raw_data, mask)
+    errors = numpy.sqrt(numpy.column_stack([cov_matrices[:, 0, 0], cov_matrices[:, 1, 1]]))
+    return params, errors
+
+
+def baseline_se_variants(wavelengths, params, errors):
+    """ The baselines for all nine (use_incpt_se, use_slope_se) combinations
+        at once, from the output of linear_baseline_batch (or a single
+        spectrum's fit_params and errors from linear_baseline).
+        Returns a dict keyed by (use_incpt_se, use_slope_se) of (N x W)
+        arrays, or W arrays for a single spectrum."""
+    wavelengths = numpy.asarray(wavelengths, dtype=float)
+    params = numpy.asarray(params, dtype=float)
+    errors = numpy.asarray(errors, dtype=float)
+    signs = numpy.array([SE_SIGNS[option] for option in SE_OPTIONS], dtype=float)
+
+    # (incpt option, slope option, ..., W)
+    incpts = params[..., 0] + signs.reshape((3,) + (1,) * (params.ndim - 1)) * errors[..., 0]
+    slopes = params[..., 1] + signs.reshape((3,) + (1,) * (params.ndim - 1)) * errors[..., 1]
+    baselines = (slopes[None, ..., None] * wavelengths + incpts[:, None, ..., None])
+
+    return dict(((incpt_se, slope_se), baselines[i, j])
+                for i, incpt_se in enumerate(SE_OPTIONS)
+                for j, slope_se in enumerate(SE_OPTIONS))
+
+
+def baseline_variants(PTIData, list_of_ranges, raw_data = None):
+    """ The linear baseline of a spectrum for all nine (use_incpt_se,
+        use_slope_se) options, as correct_raw_to_cor subtracts them: one fit
+        over the given wavelength ranges of raw_data (default:
+        PTIData.raw_data).
+        Returns (baselines, fit_params, errors): a dict of read-only arrays
+        keyed as in baseline_se_variants, the fit's (intercept, slope) and
+        their standard errors."""
+    data = PTIData
+    if raw_data is not None:
+        data = copy.copy(PTIData)
+        data.raw_data = raw_data
+    fit_params, cov_matrix = linear_baseline_params(data, list_of_ranges)
+    fit_params = list(fit_params)
+    errors = [numpy.sqrt(cov_matrix[0][0]), numpy.sqrt(cov_matrix[1][1])]
+    baselines = baseline_se_variants(data.wavelengths, fit_params, errors)
+    for baseline in baselines.values():
+        baseline.flags.writeable = False
+    return baselines, fit_params, errors
+
+
 def gaussian_func(x, a, b, c, d):
     return a * numpy.exp((-(x - b) ** 2) / (2 * c)) + d
 
 
 def gaussian_fit(x_data, y_data, guess=(1, 1, 1, 0)):
+    from scipy.optimize import curve_fit
+
     params, cov_matrix = curve_fit(gaussian_func, x_data, y_data, p0=guess)
     return params, cov_matrix
 
 
 def get_true_excitation_wavelength_from_secondary_peak(PTIData, dx_around_peak = 5):
-    global_peak = numpy.max(PTIData.raw_data)
-    peak_wavelength = PTIData.wavelengths[numpy.where(PTIData.raw_data == global_peak)][0]
-
-    peak_range = numpy.where((PTIData.wavelengths >= peak_wavelength - dx_around_peak) &
-                             (PTIData.wavelengths <= peak_wavelength + dx_around_peak))
-    peak_range2 = numpy.where((PTIData.wavelengths >= 2*peak_wavelength - dx_around_peak) &
-                              (PTIData.wavelengths <= 2*peak_wavelength + dx_around_peak))
-
-    x_data = PTIData.wavelengths[peak_range]
-    y_data = PTIData.raw_data[peak_range]
-    x_data2 = PTIData.wavelengths[peak_range2]
-    y_data2 = PTIData.raw_data[peak_range2]
-
-    secondary_peak = numpy.max(y_data2)
-
-    guess = (global_peak, peak_wavelength, 2*dx_around_peak/2.35482, 0)
-    guess2 = (secondary_peak, 2*peak_wavelength, 2*dx_around_peak/2.35482, 0)
-
-    params, cov_matrix = gaussian_fit(x_data, y_data, guess)
-    params2, cov_matrix2 = gaussian_fit(x_data2, y_data2, guess2)
-
-    # x = numpy.arange(peak_wavelength - dx_around_peak, peak_wavelength + dx_around_peak, 0.1)
-    # x2 = numpy.arange(2*peak_wavelength - dx_around_peak, 2*peak_wavelength + dx_around_peak, 0.1)
-    # y = gaussian_func(x, params[0], params[1], params[2], params[3])
-    # y2 = gaussian_func(x2, params2[0], params2[1], params2[2], params2[3])
-    #
-    # plt.plot(PTIData.wavelengths, PTIData.raw_data)
-    # plt.plot(x, y)
-    # plt.plot(x2, y2)
-    # plt.show()
-    return params2[1] - params[1]
+    """ Distance between the second-order and the primary excitation peak,
+        from the (cached) Gaussian fits of PTI.PeakFitting."""
+    primary, secondary = PTIPeaks.cached_excitation_peaks([PTIData], dx_around_peak)
+    return _checked_peak_value(PTIData, secondary[0, 1] - primary[0, 1])
 
 
 def get_excitation_monochromator_offset(PTIData, dx_around_peak = 5):
-    theoretical_excitation= PTIData.ex_range[0]
-
-    actual_excitation = get_true_excitation_wavelength_from_secondary_peak(PTIData=PTIData,
-                                                                           dx_around_peak=dx_around_peak)
-    # print actual_excitation, theoretical_excitation,
-    offset = actual_excitation - theoretical_excitation
-
-    return offset
+    ex_offsets, _ = PTIPeaks.monochromator_offsets([PTIData], dx_around_peak)
+    return _checked_peak_value(PTIData, ex_offsets[0])
 
 
 def get_emission_monochromator_shift(PTIData, dx_around_peak = 5):
-    global_peak = numpy.max(PTIData.raw_data)
-    peak_wavelength = PTIData.wavelengths[numpy.where(PTIData.raw_data == global_peak)][0]
-    peak_range = numpy.where((PTIData.wavelengths >= peak_wavelength - dx_around_peak) &
-                             (PTIData.wavelengths <= peak_wavelength + dx_around_peak))
-    guess = (global_peak, peak_wavelength, 2 * dx_around_peak / 2.35482, 0)
+    _, em_shifts = PTIPeaks.monochromator_offsets([PTIData], dx_around_peak)
+    return _checked_peak_value(PTIData, em_shifts[0])
 
-    gaussian_params, _ = gaussian_fit(x_data=PTIData.wavelengths[peak_range],
-                                      y_data=PTIData.raw_data[peak_range],
-                                      guess=guess)
 
-    actual_excitation = get_true_excitation_wavelength_from_secondary_peak(PTIData=PTIData,
-                                                                           dx_around_peak=dx_around_peak)
-    # print gaussian_params[1]
-    offset = actual_excitation - gaussian_params[1]
-
-    return offset
+def _checked_peak_value(PTIData, value):
+    if not numpy.isfinite(value):
+        raise RuntimeError("The Gaussian fits of the excitation peaks of %s failed"
+                           % PTIData.file_path)
+    return value
 
 
+@PTIProf.timed('load_excorr_file')
 def load_excorr_file(PTIData_instance, interp_method = 'cubic', split = 'none', shift = 0):
     
-    excorr = numpy.genfromtxt('PTI/correction_data/excorr.txt',
-                           skip_header = 6,
-                           skip_footer = 1,
-                           usecols = 1)
-    LUT_start = 250
-    LUT_end = 750
-    LUT_step = 1
-
-    if split.lower() == 'none':
-        pass
-    elif split.lower() == 'even':
-        excorr =  excorr[::2]
-        LUT_step *= 2
-    elif split.lower() == 'odd':
-        excorr =  excorr[1::2]
-        LUT_step *= 2
-        LUT_start += 1
-        LUT_end -= 1
-    else:  
-        print "ERROR: Not a valid method for splitting LUT"
+    if split.lower() not in PTILUT.SPLITS:
+        print("ERROR: Not a valid method for splitting LUT")
         return None
-    excorr_range = numpy.arange(LUT_start, LUT_end + LUT_step, LUT_step)
     ex_wavelength = PTIData_instance.ex_range[0]
 
-    left_fill_value = excorr[0]
-    right_fill_value = excorr[-1]
-    fill_value = (left_fill_value, right_fill_value)
-
-    excorr = interp1d(x=excorr_range,
-                      y=excorr,
-                      kind=interp_method,
-                      bounds_error=False,
-                      fill_value=fill_value)(ex_wavelength + shift)
+    excorr = PTILUT.interpolator('excorr', interp_method, split)(ex_wavelength + shift)
 
     return excorr
 
 
+@PTIProf.timed('load_emcorr_file')
 def load_emcorr_file(PTIData_instance, interp_method = 'cubic', FS = False, split = 'none', shift = 0):
 
-    if FS:
-        fname = 'PTI/correction_data/emcorri.txt'
-        LUT_start = 250
-        LUT_end = 850
-
-    if not FS:
-        fname = 'PTI/correction_data/emcorr-sphere-quanta.txt'
-        LUT_start = 300
-        LUT_end = 848
-    LUT_step = 2
-
-    emcorr = numpy.genfromtxt(fname,
-                              skip_header = 6,
-                              skip_footer = 1,
-                              usecols = 1)
-
-    if split.lower() == 'none':
-        pass
-    elif split.lower() == 'even':
-        emcorr = emcorr[::2]
-        LUT_step *= 2
-    elif split.lower() == 'odd':
-        emcorr = emcorr[1::2]
-        LUT_step *= 2
-        LUT_start += 2
-        LUT_end -= 2
-    else:
-        print "ERROR: Not a valid method for splitting LUT"
+    if split.lower() not in PTILUT.SPLITS:
+        print("ERROR: Not a valid method for splitting LUT")
         return None
+    return emcorr_on_grid(PTIData_instance.wavelengths, PTIData_instance.step_size,
+                           interp_method, FS, split, shift)
 
-    step = PTIData_instance.step_size
-    emcorr_wavelengths = numpy.arange(LUT_start, LUT_end + LUT_step, LUT_step)
-
-    xvals = numpy.arange(LUT_start, LUT_end + step, step)
-    emcorr = interp1d(x=emcorr_wavelengths,
-                      y=emcorr,
-                      kind=interp_method,
-                      fill_value='extrapolate')(xvals + shift)
-
-    min_data_wavelength = PTIData_instance.wavelengths[0]
-    max_data_wavelength = PTIData_instance.wavelengths[-1]
-    
-    needed_wavelengths = numpy.where((xvals >= min_data_wavelength) & 
-                                     (xvals <= max_data_wavelength))
-
-    emcorr = emcorr[needed_wavelengths]
-    
-    if min_data_wavelength < LUT_start:
-        extra_x = numpy.arange(min_data_wavelength, LUT_start, step)
-        left_interp = emcorr[0]*numpy.ones(extra_x.size)
-        emcorr = numpy.append(left_interp, emcorr)
-    if max_data_wavelength > LUT_end:
-        extra_x = numpy.arange(LUT_end, max_data_wavelength, step)
-        right_interp = emcorr[-1]*numpy.ones(extra_x.size)
-        emcorr = numpy.append(emcorr, right_interp)
-    
-    return emcorr
-    
 
 def get_corrections(PTIData_instance,
                     ex_interp_method = 'cubic', em_interp_method = 'cubic', FS = False,
@@ -266,22 +258,119 @@ def get_corrections(PTIData_instance,
     return corrections
 
 
+@PTIProf.timed('result_view')
+def result_view(PTIData):
+    """ A lightweight copy of a spectrum to hold a correction result. The
+        header is copied, but the arrays are read-only views sharing memory
+        with PTIData; the correction replaces the arrays it computes."""
+    data = copy.copy(PTIData)
+    for name in ('wavelengths', 'raw_data', 'cor_data', 'diode', 'baseline'):
+        array = getattr(data, name, None)
+        if isinstance(array, numpy.ndarray):
+            setattr(data, name, _readonly(array.view()))
+    data.ex_range = list(data.ex_range)
+    data.em_range = list(data.em_range)
+    return data
+
+
 def decorrect_cor_to_raw(PTIData = None,
                          ex_LUT_interpolation = 'cubic', em_LUT_interpolation = 'cubic', FS = False,
-                         undo_diode = True, undo_ex_LUT = True, undo_em_LUT = True):
-    
-    data = copy.deepcopy(PTIData)
+                         undo_diode = True, undo_ex_LUT = True, undo_em_LUT = True,
+                         inplace = False):
+    """ Recovers the raw data from the corrected data, returning a result_view
+        of the spectrum, or changing PTIData itself if inplace."""
 
-    corrections = get_corrections(PTIData_instance=data,
+    corrections = get_corrections(PTIData_instance=PTIData,
                                   ex_interp_method=ex_LUT_interpolation, em_interp_method=em_LUT_interpolation,
                                   FS=FS,
                                   diode=undo_diode, excorr=undo_ex_LUT, emcorr=undo_em_LUT)
 
+    if inplace:
+        data = PTIData
+        clear_stage_cache(PTIData)
+    else:
+        data = result_view(PTIData)
     data.raw_data = data.cor_data / corrections
     
     return data
 
 
+# Outputs of the correct_raw_to_cor stages for each input spectrum, keyed by
+# (stage, stage inputs). An entry lives as long as its spectrum.
+_stage_cache = weakref.WeakKeyDictionary()
+stage_cache_info = dict()
+
+
+def _cached_stage(PTIData, stage, key, compute):
+    cache = _stage_cache.setdefault(PTIData, dict())
+    info = stage_cache_info.setdefault(stage, {'hits': 0, 'misses': 0})
+    key = (stage,) + key
+    if key in cache:
+        info['hits'] += 1
+        return cache[key]
+    info['misses'] += 1
+    with PTIProf.stage('correct_raw_to_cor.' + stage):
+        cache[key] = compute()
+    return cache[key]
+
+
+def clear_stage_cache(PTIData = None):
+    """ Forget the cached correct_raw_to_cor stages of one spectrum, or of all
+        spectra, and their peak fits (see PTI.PeakFitting). Needed only if
+        the data of a spectrum are changed in place."""
+    if PTIData is None:
+        _stage_cache.clear()
+    else:
+        _stage_cache.pop(PTIData, None)
+    PTIPeaks.clear_cache(PTIData)
+
+
+def _forget_decorrected(PTIData):
+    """ Drop the cached stages computed from the corrected data of a spectrum."""
+    cache = _stage_cache.get(PTIData, dict())
+    for key in list(cache):
+        if key[0] == 'decorrect' or key[1:2] == ('decorrected',):
+            del cache[key]
+
+
+def _readonly(array):
+    array = numpy.asarray(array)
+    array.flags.writeable = False
+    return array
+
+
+def _decorrect_stage(PTIData, ex_LUT_interpolation, em_LUT_interpolation, FS,
+                     undo_diode, undo_ex_LUT, undo_em_LUT):
+    data = decorrect_cor_to_raw(PTIData,
+                                ex_LUT_interpolation, em_LUT_interpolation, FS,
+                                undo_diode, undo_ex_LUT, undo_em_LUT)
+    return _readonly(data.raw_data)
+
+
+def _offsets_stage(PTIData):
+    ex_offsets, em_shifts = PTIPeaks.monochromator_offsets([PTIData], dx_around_peak = 5)
+    return (_checked_peak_value(PTIData, ex_offsets[0]),
+            _checked_peak_value(PTIData, em_shifts[0]))
+
+
+def monochromator_shifts(PTIData, shift_LUT, ex_shift = 0, em_shift = 0):
+    """ The (ex_shift, em_shift) correct_raw_to_cor applies to the LUTs for
+        a value of shift_LUT: none if False, the offsets fitted to the
+        spectrum's peaks if True (ex_shift and em_shift when the spectrum
+        does not reach the second-order peak), the calibration table's if
+        'calibration'."""
+    if not shift_LUT:
+        return 0, 0
+    if shift_LUT == 'calibration':
+        import PTI.MonochromatorCalibration as PTICal
+        with PTIProf.stage('correct_raw_to_cor.calibration'):
+            return PTICal.offsets_at(PTIData.acq_start, PTIData.ex_range[0])
+    if 2 * PTIData.ex_range[0] < PTIData.em_range[1]:
+        return _cached_stage(PTIData, 'offsets', (), lambda: _offsets_stage(PTIData))
+    return ex_shift, em_shift
+
+
+@PTIProf.timed('correct_raw_to_cor')
 def correct_raw_to_cor(PTIData = None, use_decorrected_as_raw = False,
                        baseline_fit_ranges = None, baseline_polynomial_degree = 1,
                        use_baseline_se = ('none', 'none'), gaussian_fit_dx_around_peak = 10,
@@ -290,21 +379,81 @@ def correct_raw_to_cor(PTIData = None, use_decorrected_as_raw = False,
                        shift_LUT = False, ex_shift=0, em_shift=0,
                        undo_diode = True, undo_ex_LUT = True, undo_em_LUT = True,
                        apply_diode = True, apply_ex_LUT = True, apply_em_LUT = True,
-                       const_diode=False):
-    
-    data = copy.deepcopy(PTIData)
-    
+                       const_diode=False, inplace=False):
+    """ Baseline subtracts and corrects the raw data of a spectrum, returning a
+        corrected result_view of it, or correcting PTIData itself if inplace.
+        The work is split into stages (decorrect, baseline, offsets, excorr,
+        emcorr, diode, apply) and the output of every stage but the last is
+        cached per input spectrum by the options it depends on. Repeating the
+        correction with a different option only recomputes the stages that
+        option feeds into; e.g. changing const_diode reuses the baseline fit
+        and both LUT corrections. shift_LUT=True fits the monochromator
+        offsets to the spectrum's own peaks (when it reaches the second-order
+        peak; ex_shift and em_shift otherwise), shift_LUT='calibration' looks
+        them up in the calibration table by acquisition time (see
+        PTI.MonochromatorCalibration). The input spectrum must not be modified in
+        place afterwards (see clear_stage_cache), except by inplace
+        corrections, which drop the cached stages they make stale."""
+
+    # Stage 1: the raw data, measured or recovered from the corrected data
     if use_decorrected_as_raw:
-        # Changes the .raw_data member variable and sets it to the decorrected spectrum
-        data = decorrect_cor_to_raw(data,
-                                    ex_LUT_interpolation, em_LUT_interpolation, FS,
-                                    undo_diode, undo_ex_LUT, undo_em_LUT)
-        
-    # Baseline subtract from the raw data
-    baseline, params, errors = linear_baseline(PTIData = data,
-                                               list_of_ranges = baseline_fit_ranges,
-                                               use_incpt_se = use_baseline_se[0],
-                                               use_slope_se=use_baseline_se[1])
+        raw_data = _cached_stage(PTIData, 'decorrect',
+                                 (ex_LUT_interpolation, em_LUT_interpolation, FS,
+                                  undo_diode, undo_ex_LUT, undo_em_LUT, PTILUT.generation),
+                                 lambda: _decorrect_stage(PTIData,
+                                                          ex_LUT_interpolation, em_LUT_interpolation, FS,
+                                                          undo_diode, undo_ex_LUT, undo_em_LUT))
+        raw_key = ('decorrected', ex_LUT_interpolation, em_LUT_interpolation, FS,
+                   undo_diode, undo_ex_LUT, undo_em_LUT, PTILUT.generation)
+    else:
+        raw_data = PTIData.raw_data
+        raw_key = ('raw',)
+
+    # Stage 2: baseline fit of the raw data
+    ranges_key = tuple(tuple(arange) for arange in baseline_fit_ranges)
+    baselines, params, errors = _cached_stage(PTIData, 'baseline', raw_key + (ranges_key,),
+                                              lambda: baseline_variants(PTIData, baseline_fit_ranges,
+                                                                        raw_data))
+    baseline = baselines[tuple(use_baseline_se)]
+
+    # Stage 3: monochromator offsets from the Gaussian fits of the peaks,
+    # or from the calibration scans
+    ex_shift, em_shift = monochromator_shifts(PTIData, shift_LUT, ex_shift, em_shift)
+
+    # Stages 4-6: the correction factors, combined as in get_corrections
+    corrections = numpy.ones(PTIData.wavelengths.size)
+    if apply_diode:
+        if const_diode:
+            corrections /= _cached_stage(PTIData, 'diode', (),
+                                         lambda: numpy.mean(PTIData.diode))
+        else:
+            corrections /= PTIData.diode
+    if apply_ex_LUT:
+        corrections /= _cached_stage(PTIData, 'excorr',
+                                     (ex_LUT_interpolation, ex_LUT_split, ex_shift, PTILUT.generation),
+                                     lambda: load_excorr_file(PTIData_instance=PTIData,
+                                                              interp_method=ex_LUT_interpolation,
+                                                              split=ex_LUT_split,
+                                                              shift=ex_shift))
+    if apply_em_LUT:
+        corrections *= _cached_stage(PTIData, 'emcorr',
+                                     (em_LUT_interpolation, FS, em_LUT_split, em_shift, PTILUT.generation),
+                                     lambda: _readonly(load_emcorr_file(PTIData_instance=PTIData,
+                                                                        interp_method=em_LUT_interpolation,
+                                                                        FS=FS,
+                                                                        split=em_LUT_split,
+                                                                        shift=em_shift)))
+
+    # Stage 7: apply, to a view of the spectrum or to the spectrum itself
+    if inplace:
+        data = PTIData
+        if use_decorrected_as_raw:
+            # Every cached stage depends on the raw data being replaced
+            clear_stage_cache(PTIData)
+        else:
+            _forget_decorrected(PTIData)
+    else:
+        data = result_view(PTIData)
 
     data.baseline = baseline
     data.baseline_incpt = params[0]
@@ -312,30 +461,97 @@ def correct_raw_to_cor(PTIData = None, use_decorrected_as_raw = False,
     data.baseline_incpt_se = errors[0]
     data.baseline_slope_se = errors[1]
 
-    data.raw_data = data.raw_data - baseline
-
-    if not shift_LUT:
-        ex_shift = 0
-        em_shift = 0
-    else:
-        if 2 * PTIData.ex_range[0] < PTIData.em_range[1]:
-            ex_shift = get_excitation_monochromator_offset(PTIData, dx_around_peak = 5)
-            em_shift = get_emission_monochromator_shift(PTIData, dx_around_peak = 5)
-        else:
-            pass
     data.ex_monochromator_offset = ex_shift
     data.em_monochromator_offset = em_shift
 
-    corrections = get_corrections(PTIData_instance=data,
-                                  ex_interp_method=ex_LUT_interpolation, em_interp_method=em_LUT_interpolation, FS=FS,
-                                  ex_split=ex_LUT_split, em_split=em_LUT_split,
-                                  ex_shift=ex_shift, em_shift=em_shift,
-                                  diode=apply_diode, excorr=apply_ex_LUT, emcorr=apply_em_LUT,
-                                  const_diode=const_diode)
-
-
-
-    data.cor_data = data.raw_data * corrections
-    data.raw_data += baseline
+    if use_decorrected_as_raw:
+        data.raw_data = raw_data
+    data.cor_data = (raw_data - baseline) * corrections
     
     return data
+
+
+def emcorr_on_grid(wavelengths, step, interp_method, FS, split, shift):
+    """ The emission LUT correction (interp_method, FS and split as in
+        load_emcorr_file) over the wavelengths (a spectrum's grid, with its
+        step), the table's first/last value held outside it. shift is a
+        scalar, giving one row, or one value per spectrum, giving one row
+        each."""
+    table_name = 'emcorri' if FS else 'emcorr-sphere-quanta'
+    emcorr_wavelengths, _ = PTILUT.table(table_name, split)
+    # The last point of the LUT's range on a grid of this step (counted
+    # rather than from arange, whose end overshoots for steps like 0.1 nm)
+    LUT_start = emcorr_wavelengths[0]
+    LUT_last = LUT_start + step * numpy.floor((emcorr_wavelengths[-1] - LUT_start) / step + 1e-6)
+
+    # Outside the LUT the first/last value is held
+    x = numpy.clip(wavelengths, LUT_start, LUT_last)
+    shift = numpy.asarray(shift, dtype=float)
+    if shift.ndim:
+        x = x[None, :] + shift[:, None]
+    else:
+        x = x + shift
+    return PTILUT.interpolator(table_name, interp_method, split)(x)
+
+
+def stack_spectra(list_of_PTIData):
+    """ Stacks spectra measured on the same wavelength grid for
+        correct_raw_to_cor_batch.
+        Returns (wavelengths, raw_data, diode, ex_wavelengths) with raw_data
+        and diode of shape (N x W)."""
+    wavelengths = list_of_PTIData[0].wavelengths
+    for data in list_of_PTIData[1:]:
+        if not numpy.array_equal(data.wavelengths, wavelengths):
+            raise ValueError("%s is not on the same wavelength grid as %s"
+                             % (data.file_path, list_of_PTIData[0].file_path))
+    raw_data = numpy.vstack([data.raw_data for data in list_of_PTIData])
+    diode = numpy.vstack([data.diode for data in list_of_PTIData])
+    ex_wavelengths = numpy.array([data.ex_range[0] for data in list_of_PTIData], dtype=float)
+    return numpy.asarray(wavelengths), raw_data, diode, ex_wavelengths
+
+
+@PTIProf.timed('correct_raw_to_cor_batch')
+def correct_raw_to_cor_batch(wavelengths, raw_data, diode, ex_wavelengths, baseline_fit_ranges,
+                             use_baseline_se = ('none', 'none'),
+                             ex_LUT_split='none', em_LUT_split='none',
+                             ex_LUT_interpolation = 'cubic', em_LUT_interpolation = 'cubic', FS = False,
+                             ex_shift=0, em_shift=0,
+                             apply_diode = True, apply_ex_LUT = True, apply_em_LUT = True,
+                             const_diode=False):
+    """ correct_raw_to_cor for a stack of N spectra on a shared wavelength grid
+        (see stack_spectra), vectorized over the spectra.
+        - raw_data, diode: (N x W) arrays; ex_wavelengths: (N,) array.
+        - baseline_fit_ranges: one list of [start, end] ranges for all spectra
+          or one list per spectrum.
+        - ex_shift, em_shift: monochromator offsets, a scalar or one per spectrum.
+        Baselines are fitted over the wavelengths themselves.
+        Returns (cor_data, baselines, params, errors): (N x W) corrected
+        spectra and baselines, and (N x 2) arrays of the baseline
+        (intercept, slope) and their standard errors."""
+    wavelengths = numpy.asarray(wavelengths, dtype=float)
+    raw_data = numpy.atleast_2d(numpy.asarray(raw_data, dtype=float))
+    ex_wavelengths = numpy.asarray(ex_wavelengths, dtype=float)
+    num_spectra = raw_data.shape[0]
+    step = wavelengths[1] - wavelengths[0]
+
+    # Baseline fits of every spectrum in one solve
+    params, errors = linear_baseline_batch(wavelengths, raw_data, baseline_fit_ranges)
+    incpt, slope = _se_adjusted(params.T, errors.T, use_baseline_se[0], use_baseline_se[1])
+    baselines = linear_func(x=wavelengths[None, :], m=slope[:, None], b=incpt[:, None])
+
+    # Correction factors, combined as in get_corrections
+    corrections = numpy.ones(raw_data.shape)
+    if apply_diode:
+        diode = numpy.atleast_2d(numpy.asarray(diode, dtype=float))
+        if const_diode:
+            corrections /= numpy.mean(diode, axis=1)[:, None]
+        else:
+            corrections /= diode
+    if apply_ex_LUT:
+        excorr = PTILUT.interpolator('excorr', ex_LUT_interpolation, ex_LUT_split)(ex_wavelengths + ex_shift)
+        corrections /= excorr[:, None]
+    if apply_em_LUT:
+        corrections *= emcorr_on_grid(wavelengths, step, em_LUT_interpolation, FS, em_LUT_split, em_shift)
+
+    cor_data = (raw_data - baselines) * corrections
+    return cor_data, baselines, params, errors
@@ -0,0 +1,185 @@
+'''
+On-disk cache of parsed PTIData objects.
+
+Each source file gets two entries in the cache directory, named by a hash of
+its absolute path:
+- <key>.f64   the data channels as one raw little-endian float64 array of
+              shape (channels x samples)
+- <key>.json  the header fields, the channel names and the source file's
+              modification time, size and content hash
+
+An entry is current when the source's modification time and size are
+unchanged, or when only the modification time changed and the content hash
+still matches. Anything else is stale and is rewritten once the file has been
+parsed again. The arrays are memory mapped copy-on-write on load, so a warm
+load costs a stat, a small JSON read and an mmap.
+
+The cache directory is ~/.cache/PTI unless PTI_CACHE_DIR is set.
+'''
+import errno
+import glob
+import hashlib
+import json
+import os
+import time
+import numpy
+
+import PTI.Profiling as PTIProf
+
+# Bump when the parser or the entry layout changes so old entries are ignored:
+# 2: the channels are stored as the packed PTIData buffer
+# 3: session, trace and group files are parsed by the block tokenizer
+CACHE_VERSION = 3
+
+cache_dir = os.environ.get('PTI_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'PTI'))
+
+DTYPE = numpy.dtype('<f8')
+CHANNELS = ['wavelengths', 'raw_data', 'cor_data', 'diode']
+HEADER_FIELDS = ['num_samples', 'step_size', 'PMT_mode', 'ex_range', 'em_range']
+
+
+def _entry_paths(file_path):
+    abs_path = os.path.abspath(file_path)
+    if not isinstance(abs_path, bytes):
+        abs_path = abs_path.encode('utf-8')
+    key = os.path.join(cache_dir, hashlib.sha1(abs_path).hexdigest())
+    return key + '.json', key + '.f64'
+
+
+def _content_hash(contents):
+    return hashlib.sha1(contents).hexdigest()
+
+
+def _make_dirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as exc: # Guard against race condition
+        if exc.errno != errno.EEXIST:
+            raise
+
+
+def replace_file(source, destination):
+    '''
+    Rename source to destination, replacing destination if it exists. This is
+    os.replace, which Python 2 lacks; its os.rename fails on Windows when
+    the destination exists.
+    '''
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+        return
+    if os.name == 'nt' and os.path.exists(destination):
+        os.remove(destination)
+    os.rename(source, destination)
+
+
+def _write_atomic(path, write):
+    '''Write through a temporary file so concurrent readers never see a partial entry.'''
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as thefile:
+        write(thefile)
+    replace_file(tmp_path, path)
+
+
+def _write_json(path, entry):
+    _write_atomic(path, lambda thefile: thefile.write(json.dumps(entry).encode('utf-8')))
+
+
+def header_to_dict(data):
+    '''The header fields of a PTIData instance as a JSON-serialisable dict.'''
+    header = {'file_type': data.file_type.name,
+              'RunType': data.RunType.name,
+              'acq_start': list(data.acq_start)}
+    for name in HEADER_FIELDS:
+        header[name] = getattr(data, name)
+    header['step_size'] = float(header['step_size'])
+    return header
+
+
+def header_from_dict(data, header):
+    '''Set the header fields of a PTIData instance from header_to_dict output.'''
+    data.file_type = data.file_types[header['file_type']]
+    data.RunType = data.run_types[header['RunType']]
+    data.acq_start = time.struct_time(header['acq_start'])
+    for name in HEADER_FIELDS:
+        setattr(data, name, header[name])
+
+
+@PTIProf.timed('DataCache.load')
+def load(data):
+    '''
+    Fill the header fields and data arrays of a PTIData instance from its
+    cache entry. Returns True on a hit and False when the entry is missing
+    or stale, in which case the instance is left untouched.
+    '''
+    json_path, array_path = _entry_paths(data.file_path)
+    try:
+        with open(json_path, 'r') as thefile:
+            entry = json.load(thefile)
+    except (IOError, OSError, ValueError):
+        return False
+
+    if entry.get('version') != CACHE_VERSION:
+        return False
+
+    stat = os.stat(data.file_path)
+    if stat.st_size != entry['size']:
+        return False
+    if stat.st_mtime != entry['mtime']:
+        with open(data.file_path, 'rb') as thefile:
+            if _content_hash(thefile.read()) != entry['sha1']:
+                return False
+        # Touched but unchanged; record the new time so the hash is skipped next run
+        entry['mtime'] = stat.st_mtime
+        try:
+            _write_json(json_path, entry)
+        except (IOError, OSError):
+            pass
+
+    try:
+        channels = numpy.memmap(array_path, dtype=DTYPE, mode='c',
+                                shape=(len(entry['channels']), entry['num_samples']))
+    except (IOError, OSError, ValueError):
+        return False
+
+    header_from_dict(data, entry)
+    data._SetBuffer(entry['channels'], channels)
+    data.read_success = True
+    return True
+
+
+@PTIProf.timed('DataCache.store')
+def store(data, contents):
+    '''
+    Write the cache entry for a successfully parsed PTIData instance.
+    contents are the raw bytes the instance was parsed from.
+    '''
+    arrays = [getattr(data, name) for name in CHANNELS if getattr(data, name) is not None]
+    if set(array.size for array in arrays) != set([data.num_samples]):
+        return
+    names, buffer = data.pack()
+
+    stat = os.stat(data.file_path)
+    entry = {'version': CACHE_VERSION,
+             'file_path': os.path.abspath(data.file_path),
+             'mtime': stat.st_mtime,
+             'size': stat.st_size,
+             'sha1': _content_hash(contents),
+             'channels': names}
+    entry.update(header_to_dict(data))
+
+    json_path, array_path = _entry_paths(data.file_path)
+    try:
+        _make_dirs(cache_dir)
+        # The arrays go first; the JSON file marks the entry as complete
+        _write_atomic(array_path,
+                      lambda thefile: numpy.asarray(buffer, dtype=DTYPE).tofile(thefile))
+        _write_json(json_path, entry)
+    except (IOError, OSError) as exc:
+        print("WARNING!! Could not write cache entry for %s: %s" % (data.file_path, exc))
+
+
+def clear():
+    '''Remove every entry from the cache directory.'''
+    for path in glob.glob(os.path.join(cache_dir, '*.json')) + glob.glob(os.path.join(cache_dir, '*.f64')):
+        os.remove(path)
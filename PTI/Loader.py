@@ -0,0 +1,149 @@
+'''
+Bulk loading of PTI data files on a process pool.
+
+    import PTI.Loader as PTILoad
+
+    paths = PTILoad.find_data_files("Henry/Sphere")
+    data, failures = PTILoad.load(paths)
+
+    for path, data, error in PTILoad.iter_load(paths):
+        ...   # results arrive in input order while the rest are still loading
+
+Files that cannot be read are reported (path and reason) rather than
+silently skipped; their slot in the results holds None.
+'''
+import collections
+import glob
+import itertools
+import multiprocessing
+import os
+
+import PTI.Profiling as PTIProf
+from PTI.ReadDataFiles import PTIData
+
+# By default a pool is only started with at least this many files per
+# process; fewer files (e.g. the handful of scans a QY script loads) are
+# parsed in this process, which is faster than starting a pool and does
+# not need the caller to be guarded by if __name__ == '__main__'
+MIN_FILES_PER_PROCESS = 8
+
+
+def find_data_files(path_or_pattern, extension='.txt'):
+    '''
+    Returns a sorted list of data file paths.
+    A directory is walked recursively for files with the given extension;
+    anything else is treated as a glob pattern.
+    '''
+    if os.path.isdir(path_or_pattern):
+        all_paths = list()
+        for root, dirs, files in os.walk(path_or_pattern):
+            for f in files:
+                if os.path.splitext(f)[1] == extension:
+                    all_paths.append(os.path.join(root, f))
+        return sorted(all_paths)
+    return sorted(glob.glob(path_or_pattern))
+
+
+def _load_one(path):
+    '''Worker: returns (path, PTIData or None, error message or None).'''
+    try:
+        data = PTIData(path)
+    except Exception as exc:
+        return path, None, "%s: %s" % (type(exc).__name__, exc)
+    if not data.read_success:
+        return path, None, "PTIData could not read the file"
+    return path, data, None
+
+
+def _load_chunk(paths):
+    return [_load_one(path) for path in paths]
+
+
+def _as_paths(paths):
+    if isinstance(paths, (str, type(u''))):
+        return find_data_files(paths)
+    return list(paths)
+
+
+def imap_chunks(function, chunks, processes):
+    '''
+    Generator over function(chunk) for each chunk, in order, computed on a
+    pool of processes. Only two chunks per process are in flight at once so
+    that a slow consumer does not pile up results in memory.
+    When PTI.Profiling is enabled, the workers' stage figures are added to
+    this process's.
+    '''
+    chunks = iter(chunks)
+    pool = multiprocessing.Pool(processes)
+    pending = collections.deque()
+    profiled = PTIProf.settings['enabled']
+
+    def submit(chunk):
+        if profiled:
+            return pool.apply_async(PTIProf.run_profiled, (function, chunk, dict(PTIProf.settings)))
+        return pool.apply_async(function, (chunk,))
+
+    try:
+        for chunk in itertools.islice(chunks, 2 * processes):
+            pending.append(submit(chunk))
+        while pending:
+            results = pending.popleft().get()
+            if profiled:
+                results, worker_stats = results
+                PTIProf.merge(worker_stats)
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(submit(chunk))
+            yield results
+    finally:
+        # Let the chunks in flight finish rather than terminate(), which can
+        # deadlock on Python 2 while results are waiting in the pipe
+        pool.close()
+        pool.join()
+
+
+def iter_load(paths, processes=None, chunksize=None):
+    '''
+    Generator over (path, data, error) tuples in the order of paths.
+    paths may be a list of file paths, or a directory/glob pattern passed to
+    find_data_files. Exactly one of data and error is None for each file.
+
+    Files are parsed on a pool of processes (default: one per core, capped
+    so each has MIN_FILES_PER_PROCESS files); processes=1 parses in this
+    process, as does the default for fewer files than that. Paths are
+    handed to the workers in chunks (default: about four per process), and
+    only two chunks per process are in flight at once so that a slow
+    consumer does not pile up parsed files in memory.
+    '''
+    paths = _as_paths(paths)
+    if processes is None:
+        processes = min(multiprocessing.cpu_count(), len(paths) // MIN_FILES_PER_PROCESS)
+    processes = min(processes, len(paths))
+
+    if processes <= 1:
+        for path in paths:
+            yield _load_one(path)
+        return
+
+    if chunksize is None:
+        chunksize = max(1, len(paths) // (4 * processes))
+    chunks = (paths[i:i + chunksize] for i in range(0, len(paths), chunksize))
+
+    for results in imap_chunks(_load_chunk, chunks, processes):
+        for result in results:
+            yield result
+
+
+def load(paths, processes=None, chunksize=None):
+    '''
+    Load every file and return (list_of_data, failures).
+    list_of_data is in input order with None for files that failed.
+    failures is a list of (path, error message) tuples; each is also printed.
+    '''
+    list_of_data = list()
+    failures = list()
+    for path, data, error in iter_load(paths, processes, chunksize):
+        list_of_data.append(data)
+        if error is not None:
+            print("ERROR!! Could not load %s (%s)" % (path, error))
+            failures.append((path, error))
+    return list_of_data, failures
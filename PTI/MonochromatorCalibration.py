@@ -0,0 +1,223 @@
+'''
+A table of the monochromator offsets measured by the calibration scans, so
+corrections can look them up by the time a spectrum was taken instead of
+fitting its peaks.
+
+Two kinds of scan calibrate the instrument:
+- room-light emission scans (EM_CALIBRATION_FILES) calibrate the emission
+  monochromator: em_shift is the mean distance from the fitted mercury
+  lines of the fluorescent lights to their true wavelengths,
+- emission scans across the excitation wavelength (EX_CALIBRATION_FILES)
+  calibrate the excitation monochromator: the fitted peak plus the
+  em_shift in effect at the time is the true excitation wavelength. Scans
+  that reach the second-order peak give both offsets directly, as
+  PTI.PeakFitting.monochromator_offsets.
+
+The table lists one entry per scan, ordered by acquisition time, and is
+written to correction_data/monochromator_offsets.json:
+
+    python -m PTI.MonochromatorCalibration
+
+    import PTI.MonochromatorCalibration as PTICal
+
+    ex_offset, em_shift = PTICal.offsets_at(data.acq_start, data.ex_range[0])
+
+An offset in effect at a time is the one of the latest scan measuring it
+at or before that time (or of the earliest scan, for spectra taken before
+any calibration); excitation offsets are kept per calibrated wavelength
+and interpolated between them. Excitation scans taken before any emission
+calibration cannot be converted and only record their fitted peak.
+'''
+import argparse
+import bisect
+import glob
+import json
+import os
+import time
+import numpy
+
+from PTI import DataCache
+from PTI.ArchiveIndex import TIME_FORMAT
+from PTI.CorrectionLUTs import DATA_DIR
+import PTI.Loader as PTILoad
+import PTI.PeakFitting as PTIPeaks
+
+TABLE_VERSION = 1
+TABLE_PATH = os.path.join(DATA_DIR, 'monochromator_offsets.json')
+
+# Calibration scans, relative to the repository root
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EM_CALIBRATION_FILES = ['Henry/Sphere/WLcalib/RoomLights*.txt']
+EX_CALIBRATION_FILES = ['Henry/Sphere/WLcalib/ExCal_*.txt',
+                        'Henry/CalCheck*.txt',
+                        'Henry/calCheck*.txt',
+                        'Henry/PostCalCheck*.txt']
+
+# Mercury lines of fluorescent lights in nm, those clear of the phosphor lines
+MERCURY_LINES = (404.656, 435.833)
+# A line is looked for within LINE_SEARCH nm of its true wavelength and
+# fitted over LINE_DX nm around the highest point found
+LINE_SEARCH = 8
+LINE_DX = 3
+DX_AROUND_PEAK = 5
+
+_tables = dict()
+
+
+def _find(patterns):
+    paths = list()
+    for pattern in patterns:
+        paths += sorted(glob.glob(os.path.join(REPOSITORY_DIR, pattern)))
+    return [os.path.relpath(path, REPOSITORY_DIR) for path in paths]
+
+
+def _timestamp(acq_start):
+    if isinstance(acq_start, (str, type(u''))):
+        return acq_start
+    return time.strftime(TIME_FORMAT, acq_start)
+
+
+def _value(value):
+    '''A float for the table, None for NaN.'''
+    return float(value) if numpy.isfinite(value) else None
+
+
+def fit_emission_shifts(list_of_PTIData, lines = MERCURY_LINES):
+    '''
+    em_shift of each room-light scan: the mean of true minus fitted
+    wavelength over the lines it covers, NaN if it covers none.
+    '''
+    shifts = numpy.full((len(list_of_PTIData), len(lines)), numpy.nan)
+    for j, line in enumerate(lines):
+        wavelengths, values, centres, rows = list(), list(), list(), list()
+        for i, data in enumerate(list_of_PTIData):
+            wl = numpy.asarray(data.wavelengths, dtype=float)
+            raw = numpy.asarray(data.raw_data, dtype=float)
+            near = numpy.where(numpy.abs(wl - line) <= LINE_SEARCH)[0]
+            if near.size:
+                wavelengths.append(wl)
+                values.append(raw)
+                centres.append(wl[near[numpy.argmax(raw[near])]])
+                rows.append(i)
+        if rows:
+            params = PTIPeaks.fit_peaks(wavelengths, values, centres, LINE_DX)
+            shifts[rows, j] = line - params[:, 1]
+    with numpy.errstate(invalid='ignore'):
+        counted = numpy.isfinite(shifts).sum(axis=1)
+        return numpy.where(counted > 0, numpy.nansum(shifts, axis=1) / numpy.maximum(counted, 1), numpy.nan)
+
+
+def build_table(em_paths = None, ex_paths = None):
+    '''
+    Fit the calibration scans (default: EM_CALIBRATION_FILES and
+    EX_CALIBRATION_FILES) and return the table of their offsets, entries
+    ordered by acquisition time.
+    '''
+    if em_paths is None:
+        em_paths = _find(EM_CALIBRATION_FILES)
+    if ex_paths is None:
+        ex_paths = _find(EX_CALIBRATION_FILES)
+
+    def loaded(paths):
+        data, _ = PTILoad.load([os.path.join(REPOSITORY_DIR, path) for path in paths], processes=1)
+        return [(path, d) for path, d in zip(paths, data) if d is not None]
+
+    entries = list()
+    em_scans = loaded(em_paths)
+    em_shifts = fit_emission_shifts([data for path, data in em_scans])
+    for (path, data), em_shift in zip(em_scans, em_shifts):
+        entries.append({'acq_start': _timestamp(data.acq_start), 'path': path,
+                        'ex_offset': None, 'em_shift': _value(em_shift)})
+    entries.sort(key=lambda entry: entry['acq_start'])
+
+    ex_scans = loaded(ex_paths)
+    primary, secondary = PTIPeaks.cached_excitation_peaks([data for path, data in ex_scans],
+                                                          DX_AROUND_PEAK)
+    ex_entries = list()
+    for (path, data), first, second in zip(ex_scans, primary, secondary):
+        entry = {'acq_start': _timestamp(data.acq_start), 'path': path,
+                 'ex_wavelength': float(data.ex_range[0]), 'peak': _value(first[1]),
+                 'ex_offset': None, 'em_shift': None}
+        if 2 * data.ex_range[0] + DX_AROUND_PEAK <= data.em_range[-1]:
+            true_excitation = second[1] - first[1]
+            entry['em_shift'] = _value(true_excitation - first[1])
+        else:
+            em_shift = _in_effect(entries, 'em_shift', entry['acq_start'], earlier_only=True)
+            true_excitation = first[1] + em_shift if em_shift is not None else numpy.nan
+        entry['ex_offset'] = _value(true_excitation - data.ex_range[0])
+        ex_entries.append(entry)
+
+    entries = sorted(entries + ex_entries, key=lambda entry: entry['acq_start'])
+    return {'version': TABLE_VERSION,
+            'created': time.strftime(TIME_FORMAT),
+            'lines': list(MERCURY_LINES),
+            'entries': entries}
+
+
+def write_table(table, path = TABLE_PATH):
+    DataCache._write_json(path, table)
+    _tables.pop(path, None)
+
+
+def load_table(path = TABLE_PATH):
+    '''The table in path, read once per process.'''
+    if path not in _tables:
+        with open(path, 'r') as thefile:
+            table = json.load(thefile)
+        if table.get('version') != TABLE_VERSION:
+            raise ValueError("%s was written by a different version of MonochromatorCalibration; "
+                             "build the table again" % path)
+        _tables[path] = table
+    return _tables[path]
+
+
+def invalidate():
+    '''Forget the tables read, so they are read again on next use.'''
+    _tables.clear()
+
+
+def _in_effect(entries, name, timestamp, earlier_only = False):
+    measured = [entry for entry in entries if entry[name] is not None]
+    if not measured:
+        return None
+    position = bisect.bisect_right([entry['acq_start'] for entry in measured], timestamp)
+    if position == 0:
+        return None if earlier_only else measured[0][name]
+    return measured[position - 1][name]
+
+
+def offsets_at(acq_start, ex_wavelength, path = TABLE_PATH):
+    '''
+    (ex_offset, em_shift) in effect at acq_start (a time.struct_time or a
+    TIME_FORMAT string) for the excitation wavelength ex_wavelength, as the
+    ex_shift and em_shift of correct_raw_to_cor. The excitation offset is
+    interpolated between the wavelengths calibrated (and held beyond them),
+    each taken from its latest scan.
+    '''
+    entries = load_table(path)['entries']
+    timestamp = _timestamp(acq_start)
+    calibrated = sorted(set(entry['ex_wavelength'] for entry in entries
+                            if entry.get('ex_offset') is not None))
+    ex_offsets = [_in_effect([entry for entry in entries if entry.get('ex_wavelength') == wavelength],
+                             'ex_offset', timestamp)
+                  for wavelength in calibrated]
+    em_shift = _in_effect(entries, 'em_shift', timestamp)
+    if not calibrated or em_shift is None:
+        raise ValueError("%s has no calibration of both monochromators" % path)
+    return float(numpy.interp(ex_wavelength, calibrated, ex_offsets)), em_shift
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fit the calibration scans and write the table "
+                                                 "of monochromator offsets.")
+    parser.add_argument('--output', default=TABLE_PATH, help="table to write (default: %(default)s)")
+    args = parser.parse_args()
+
+    table = build_table()
+    write_table(table, args.output)
+    for entry in table['entries']:
+        print("%s  %-55s ex_offset %s  em_shift %s"
+              % (entry['acq_start'], entry['path'],
+                 '%7.3f' % entry['ex_offset'] if entry['ex_offset'] is not None else '      -',
+                 '%7.3f' % entry['em_shift'] if entry['em_shift'] is not None else '      -'))
+    print("Wrote %d entries to %s" % (len(table['entries']), args.output))
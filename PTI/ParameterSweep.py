@@ -0,0 +1,210 @@
+'''
+Parallel, resumable sweeps of an analysis over a grid of options.
+
+A grid is a list of (name, values) axes, outermost first, as the nested
+loops of the QY scripts' run_all_options were. name is a keyword of the
+analysis function, or a tuple of keywords whose values are varied
+together:
+
+    import PTI.ParameterSweep as PTISweep
+
+    grid = [('correction_region_start', range(360, 372, 2)),
+            ('shift_LUT', [False, True]),
+            ('use_baseline_se', baseline_se_options),
+            (('ex_LUT_interpolation', 'em_LUT_interpolation'), LUT_interpolation_options),
+            (('ex_LUT_split', 'em_LUT_split'), LUT_splitting_options),
+            ('const_diode', [False, True])]
+
+    PTISweep.run_sweep(all_options_QYs, grid, "QY Uncertainty Data/PPO_0x31/all_options.txt",
+                       result_headers=['310 nm', '320 nm', '330 nm', '340 nm'])
+
+analysis(**options) returns the list of values for one row. The option
+combinations are spread over a pool of processes in contiguous chunks (so
+each worker's correction stage cache stays useful), and every finished
+chunk is appended to <output>.partial straight away. If the sweep is
+interrupted, running it again skips the combinations already in the
+.partial file. Once every combination is done, the output is written as
+a CSV file in grid order and the .partial file is removed.
+
+The analysis function must be picklable, i.e. defined at the top level of
+a module (the running script counts). To see where the time of a sweep
+goes, run it inside PTI.Profiling.profiling() (or with PTI_PROFILE=1 set);
+the stages of every worker are counted.
+'''
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import traceback
+
+import PTI.Profiling as PTIProf
+from PTI.DataCache import replace_file
+from PTI.Loader import imap_chunks
+
+# Columns of the QY scripts' all_options.txt files:
+# (header, option name) or (header, option name, index into the option's value)
+ALL_OPTIONS_COLUMNS = [('Shift LUT?', 'shift_LUT'),
+                       ('Intercept SE', 'use_baseline_se', 0),
+                       ('Slope SE', 'use_baseline_se', 1),
+                       ('Ex LUT Interpolation', 'ex_LUT_interpolation'),
+                       ('Em LUT Interpolation', 'em_LUT_interpolation'),
+                       ('Ex LUT Split', 'ex_LUT_split'),
+                       ('Em LUT Split', 'em_LUT_split'),
+                       ('Constant Diode', 'const_diode'),
+                       ('Start of Correction Region', 'correction_region_start')]
+
+
+def format_value(value):
+    '''
+    A CSV field as the scripts write it. Their QYs are numpy floats, whose
+    str is the shortest repr that round-trips since numpy 1.14 (under
+    Python 2 too), so floats are written as repr(float(value)). The files
+    in "QY Uncertainty Data" predate that and have 12 significant digits.
+    '''
+    if isinstance(value, float) or hasattr(value, 'dtype') and value.dtype.kind == 'f':
+        return repr(float(value))
+    return str(value)
+
+
+def iter_combinations(grid):
+    '''Dicts of keyword arguments for every combination of the grid, in loop order.'''
+    axes = list()
+    for names, values in grid:
+        if isinstance(names, (str, type(u''))):
+            axes.append([{names: value} for value in values])
+        else:
+            axes.append([dict(zip(names, value)) for value in values])
+    for combination in itertools.product(*axes):
+        options = dict()
+        for part in combination:
+            options.update(part)
+        yield options
+
+
+def option_fields(options, columns):
+    '''The CSV fields of the option columns ((header, option name[, index])) of a row.'''
+    fields = list()
+    for column in columns:
+        value = options[column[1]]
+        if len(column) > 2:
+            value = value[column[2]]
+        fields.append(format_value(value))
+    return fields
+
+
+def _fingerprint(grid, columns, result_headers):
+    '''Identifies the sweep, so a .partial file of a different sweep is not resumed.'''
+    description = json.dumps([[list(names) if not isinstance(names, (str, type(u''))) else names,
+                               [list(v) if isinstance(v, (list, tuple)) else v for v in values]]
+                              for names, values in grid] +
+                             [list(column) for column in columns] + list(result_headers),
+                             default=str, sort_keys=True)
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+def _run_chunk(task):
+    '''Worker: returns [(index, result values or None, error or None)].'''
+    analysis, chunk = task
+    results = list()
+    for index, options in chunk:
+        try:
+            with PTIProf.stage('ParameterSweep.analysis'):
+                values = list(analysis(**options))
+            results.append((index, values, None))
+        except Exception as exc:
+            results.append((index, None, "%s: %s\n%s" % (type(exc).__name__, exc,
+                                                         traceback.format_exc())))
+    return results
+
+
+def _read_partial(partial_path, fingerprint):
+    '''{index: CSV row} of the combinations completed by an earlier run.'''
+    done = dict()
+    if not os.path.exists(partial_path):
+        return done
+    with open(partial_path, 'rb') as thefile:
+        contents = thefile.read().decode('utf-8')
+
+    # A row cut short by a crash has no newline; drop it so it is redone
+    complete = contents.rfind('\n') + 1
+    if complete < len(contents):
+        with open(partial_path, 'rb+') as thefile:
+            thefile.truncate(len(contents[:complete].encode('utf-8')))
+
+    lines = contents[:complete].splitlines()
+    if not lines or lines[0] != fingerprint:
+        raise ValueError("%s belongs to a different sweep; remove it to start again"
+                         % partial_path)
+    for line in lines[1:]:
+        index, row = line.split(',', 1)
+        done[int(index)] = row
+    return done
+
+
+def run_sweep(analysis, grid, output_path, columns=ALL_OPTIONS_COLUMNS, result_headers=(),
+              processes=None, chunksize=None):
+    '''
+    Evaluate analysis(**options) for every combination of the grid and write
+    the CSV file output_path: one row per combination with the option
+    columns followed by the analysis results.
+    - columns: (header, option name[, index]) for the option fields of a row.
+    - result_headers: headers of the analysis results.
+    - processes: size of the process pool (default: one per core);
+      processes=1 runs in this process.
+    - chunksize: combinations per task (default: about four tasks per process).
+    Returns the list of (option dict, error message) for combinations whose
+    analysis raised; those are printed, left out of the output and retried on
+    the next run.
+    '''
+    combinations = list(iter_combinations(grid))
+    fingerprint = _fingerprint(grid, columns, result_headers)
+    partial_path = output_path + '.partial'
+
+    done = _read_partial(partial_path, fingerprint)
+    todo = [(index, options) for index, options in enumerate(combinations) if index not in done]
+    if done:
+        print("Resuming %s: %d of %d combinations already done"
+              % (output_path, len(done), len(combinations)))
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(todo)))
+    if chunksize is None:
+        chunksize = max(1, len(todo) // (4 * processes))
+    chunks = ((analysis, todo[i:i + chunksize]) for i in range(0, len(todo), chunksize))
+    if processes == 1:
+        chunk_results = (_run_chunk(task) for task in chunks)
+    else:
+        chunk_results = imap_chunks(_run_chunk, chunks, processes)
+
+    failures = list()
+    new_partial = not os.path.exists(partial_path)
+    with open(partial_path, 'a') as partial:
+        if new_partial:
+            partial.write(fingerprint + '\n')
+        for results in chunk_results:
+            for index, values, error in results:
+                if error is not None:
+                    print("ERROR!! Analysis failed for %s (%s)" % (combinations[index], error))
+                    failures.append((combinations[index], error))
+                    continue
+                row = ','.join(option_fields(combinations[index], columns) +
+                               [format_value(value) for value in values])
+                partial.write('%d,%s\n' % (index, row))
+                done[index] = row
+            partial.flush()
+
+    if failures:
+        print("%d of %d combinations failed; run the sweep again to retry them. "
+              "Completed rows are kept in %s" % (len(failures), len(combinations), partial_path))
+        return failures
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w') as thefile:
+        thefile.write(','.join([column[0] for column in columns] + list(result_headers)) + '\n')
+        for index in range(len(combinations)):
+            thefile.write(done[index] + '\n')
+    replace_file(tmp_path, output_path)
+    os.remove(partial_path)
+    return failures
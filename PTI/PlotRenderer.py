@@ -0,0 +1,186 @@
+'''
+Parallel, incremental rendering of PTIData.plot() figures to PNG files.
+
+A job names a data file, the PNG to draw it to and the axes (indices into
+the figure's axes) on which to mark the excitation wavelength:
+
+    import PTI.Loader as PTILoad
+    import PTI.PlotRenderer as PTIPlots
+
+    jobs = [PTIPlots.PlotJob(path, PTIPlots.mirror_path(path, "Henry", "All_Henry_Plots"), (0, -1))
+            for path in PTILoad.find_data_files("Henry")]
+    failures = PTIPlots.render(jobs)
+
+Every PNG records the RENDERER_VERSION it was drawn by. A job is skipped
+when its PNG is newer than the data file and was drawn by this version,
+so after a data drop only the new and changed files are drawn (bump
+RENDERER_VERSION when the figures change). The rest are drawn on a pool of
+processes, each of which builds the figure once (SpectrumFigure) and
+redraws it for every spectrum on an Agg canvas. Each file that cannot be
+drawn is reported rather than skipped silently.
+'''
+import collections
+import multiprocessing
+import os
+import traceback
+
+from PTI import DataCache
+from PTI.Loader import imap_chunks
+from PTI.ReadDataFiles import PTIData
+
+RENDERER_VERSION = 3
+# Written into the PNG's text chunks, which come before the image data
+_STAMP = ('PTI.PlotRenderer %d' % RENDERER_VERSION)
+_STAMP_BYTES = 4096
+# zlib level of the PNG files; encoding at the default (6) takes as long as
+# drawing the figure, for files only about 15% smaller
+PNG_COMPRESS_LEVEL = 1
+
+PlotJob = collections.namedtuple('PlotJob', ['source', 'output', 'mark_excitation'])
+
+
+def mirror_path(path, source_root, output_root, extension='.png'):
+    '''The path under output_root of a file under source_root, with the extension replaced.'''
+    relative = os.path.relpath(path, source_root)
+    return os.path.join(output_root, os.path.splitext(relative)[0] + extension)
+
+
+def is_up_to_date(job):
+    '''Whether the job's PNG is newer than its data file and drawn by this RENDERER_VERSION.'''
+    try:
+        if os.path.getmtime(job.output) < os.path.getmtime(job.source):
+            return False
+        with open(job.output, 'rb') as thefile:
+            head = thefile.read(_STAMP_BYTES)
+    except (IOError, OSError):
+        return False
+    return (b'Software\x00' + _STAMP.encode('latin-1')) in head
+
+
+class SpectrumFigure(object):
+    '''
+    The figure of PTIData.plot (raw data, diode signal and corrected data),
+    built once and redrawn for each spectrum: only the line data, the axis
+    limits, the title and the excitation markers change. It has its own Agg
+    canvas, so it does not go through pyplot.
+    '''
+    def __init__(self, fig_size = (10,10)):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        from matplotlib.gridspec import GridSpec
+
+        self.figure = Figure(figsize = fig_size)
+        FigureCanvasAgg(self.figure)
+        grid = GridSpec(2, 2)
+        self.axes = [self.figure.add_subplot(grid[0, 0]),
+                     self.figure.add_subplot(grid[0, 1]),
+                     self.figure.add_subplot(grid[1, :])]
+        self.lines = [ax.plot([], [])[0] for ax in self.axes]
+        self.markers = [ax.axvline(x=0, color='r', ls='--', visible=False) for ax in self.axes]
+        self.title = self.figure.suptitle('')
+        for ax, title in zip(self.axes, ["Raw Data", "Diode Signal", "Fully Corrected Data"]):
+            ax.set_title(title, fontsize = 15)
+            ax.grid()
+
+    def draw(self, data, mark_excitation = ()):
+        '''Show data, marking its excitation wavelength on the axes listed in mark_excitation.'''
+        for ax, line, marker, values in zip(self.axes, self.lines, self.markers,
+                                            [data.raw_data, data.diode, data.cor_data]):
+            if values is None:
+                line.set_data([], [])
+                # No data to scale to: the limits of an empty plot, not the last spectrum's
+                ax.set_ylim(0, 1, auto=True)
+            else:
+                line.set_data(data.wavelengths, values)
+                ax.relim(visible_only=True)
+                ax.autoscale_view(scalex=False)
+            marker.set_visible(False)
+            ax.set_xlim([data.wavelengths[0], data.wavelengths[-1]])
+        for index in mark_excitation:
+            self.markers[index].set_xdata([data.ex_range[0]] * 2)
+            self.markers[index].set_visible(True)
+        self.title.set_text(data.file_path + '\n' + data.get_date())
+        return self.figure
+
+    def save(self, path):
+        '''
+        Write the figure to the PNG file path. The Agg buffer is encoded by
+        PIL at PNG_COMPRESS_LEVEL when PIL is installed (the same pixels as
+        savefig, in less time), and by savefig otherwise.
+        '''
+        try:
+            from PIL import Image
+            from PIL.PngImagePlugin import PngInfo
+        except ImportError:
+            self.figure.savefig(path, metadata={'Software': _STAMP})
+            return
+
+        canvas = self.figure.canvas
+        canvas.draw()
+        image = Image.frombuffer('RGBA', canvas.get_width_height(), canvas.buffer_rgba(),
+                                 'raw', 'RGBA', 0, 1)
+        info = PngInfo()
+        info.add_text('Software', _STAMP)
+        image.save(path, format='png', pnginfo=info, compress_level=PNG_COMPRESS_LEVEL,
+                   dpi=(self.figure.dpi, self.figure.dpi))
+
+
+# The SpectrumFigure of this process
+_figures = list()
+
+
+def _render_one(job):
+    '''Worker: returns (job, error message or None).'''
+    try:
+        data = PTIData(job.source)
+        if not data.read_success:
+            return job, "PTIData could not read the file"
+        if not _figures:
+            _figures.append(SpectrumFigure())
+        _figures[0].draw(data, job.mark_excitation)
+        DataCache._make_dirs(os.path.dirname(job.output) or '.')
+        _figures[0].save(job.output)
+    except Exception as exc:
+        return job, "%s: %s\n%s" % (type(exc).__name__, exc, traceback.format_exc())
+    return job, None
+
+
+def _render_chunk(jobs):
+    return [_render_one(job) for job in jobs]
+
+
+def render(jobs, processes=None, chunksize=None, force=False):
+    '''
+    Draw the PNG of every job that is not up to date (every job if force).
+    - processes: size of the process pool (default: one per core, capped at
+      the number of jobs); processes=1 draws in this process.
+    - chunksize: jobs per task (default: about four tasks per process).
+    Returns the list of (job, error message) for the files that could not be
+    drawn; each is also printed.
+    '''
+    jobs = [PlotJob(*job) for job in jobs]
+    todo = [job for job in jobs if force or not is_up_to_date(job)]
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(todo)))
+    if chunksize is None:
+        chunksize = max(1, len(todo) // (4 * processes))
+    chunks = (todo[i:i + chunksize] for i in range(0, len(todo), chunksize))
+    if processes == 1:
+        chunk_results = (_render_chunk(chunk) for chunk in chunks)
+    else:
+        chunk_results = imap_chunks(_render_chunk, chunks, processes)
+
+    failures = list()
+    for results in chunk_results:
+        for job, error in results:
+            if error is None:
+                print(job.output)
+            else:
+                print("ERROR!! Could not plot %s (%s)" % (job.source, error))
+                failures.append((job, error))
+
+    print("Drew %d plots, %d up to date, %d failed"
+          % (len(todo) - len(failures), len(jobs) - len(todo), len(failures)))
+    return failures
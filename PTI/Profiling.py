@@ -0,0 +1,242 @@
+'''
+Opt-in profiling of the analysis stages: the wall time, number of calls
+and allocated memory of each named stage, summed over a run.
+
+    import PTI.Profiling as PTIProf
+
+    with PTIProf.profiling():
+        PTISweep.run_sweep(all_options_QYs, grid, output_path)
+    PTIProf.report()                          # table, slowest stage first
+    PTIProf.write_json("sweep_profile.json")
+
+Setting the environment variable PTI_PROFILE profiles a whole script
+without changing it: PTI_PROFILE=1 times the stages, PTI_PROFILE=memory
+also traces their allocations. The table is printed when the script exits,
+and written as JSON to $PTI_PROFILE_JSON when that is set.
+
+The stages are the blocks of the PTI modules marked with stage(name) or
+@timed(name); a stage nested in another is counted in both. Disabled, a
+stage costs well under a microsecond. Chunks run on a pool by
+PTI.Loader.imap_chunks (the loader, ParameterSweep, PlotRenderer) are
+profiled in their worker and the figures sent back with the results, so
+the totals cover every process.
+
+The allocated bytes of a call are the peak of the memory traced by
+tracemalloc during the call above the memory in use when it started (the
+growth over the call before Python 3.9, and nothing on Python 2). Tracing
+makes everything several times slower: compare the times of runs without it.
+'''
+import atexit
+import functools
+import json
+import os
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError: # Python 2
+    tracemalloc = None
+
+ENV_VARIABLE = 'PTI_PROFILE'
+JSON_ENV_VARIABLE = 'PTI_PROFILE_JSON'
+
+# Columns of a stage's figures
+FIELDS = ('calls', 'seconds', 'bytes', 'max_bytes')
+
+# Whether stages are profiled, and whether their allocations are traced
+settings = {'enabled': False, 'memory': False}
+
+# name: [calls, seconds, bytes, max_bytes]
+_stats = dict()
+# Peak traced memory seen so far by each open stage, innermost last
+_open_peaks = list()
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class _Stage(object):
+    __slots__ = ('name', 'start', 'memory_start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if settings['memory']:
+            current, peak = tracemalloc.get_traced_memory()
+            if hasattr(tracemalloc, 'reset_peak'):
+                if _open_peaks:
+                    _open_peaks[-1] = max(_open_peaks[-1], peak)
+                tracemalloc.reset_peak()
+            self.memory_start = current
+            _open_peaks.append(current)
+        else:
+            self.memory_start = None
+        self.start = _clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = _clock() - self.start
+        allocated = 0
+        if self.memory_start is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(_open_peaks.pop(), peak if hasattr(tracemalloc, 'reset_peak') else current)
+            if _open_peaks:
+                _open_peaks[-1] = max(_open_peaks[-1], peak)
+            allocated = peak - self.memory_start
+        record(self.name, 1, seconds, allocated, allocated)
+        return False
+
+
+class _NoStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    '''Context manager profiling its block as the stage name (when enabled).'''
+    if settings['enabled']:
+        return _Stage(name)
+    return _NO_STAGE
+
+
+def timed(name):
+    '''Decorator profiling every call of the function as the stage name.'''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not settings['enabled']:
+                return function(*args, **kwargs)
+            with _Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name, calls, seconds, allocated=0, max_allocated=0):
+    '''Add figures to a stage measured some other way.'''
+    figures = _stats.get(name)
+    if figures is None:
+        _stats[name] = [calls, seconds, allocated, max_allocated]
+    else:
+        figures[0] += calls
+        figures[1] += seconds
+        figures[2] += allocated
+        figures[3] = max(figures[3], max_allocated)
+
+
+def enable(memory=False):
+    '''Profile the stages from now on; memory also traces their allocations.'''
+    if memory and tracemalloc is None:
+        print("ERROR!! Allocations cannot be traced without tracemalloc (Python 3)")
+        memory = False
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    settings['enabled'] = True
+    settings['memory'] = memory
+
+
+def disable():
+    '''Stop profiling (and tracing allocations, if profiling started it).'''
+    if settings['memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    settings['enabled'] = False
+    settings['memory'] = False
+
+
+def reset():
+    '''Forget the figures recorded so far.'''
+    _stats.clear()
+
+
+class profiling(object):
+    '''
+    Context manager profiling its block, e.g. a sweep. The figures of
+    earlier runs are forgotten unless keep; the earlier settings are
+    restored afterwards.
+    '''
+    def __init__(self, memory=False, keep=False):
+        self.memory = memory
+        self.keep = keep
+
+    def __enter__(self):
+        self.previous = dict(settings)
+        if not self.keep:
+            reset()
+        enable(self.memory or self.previous['memory'])
+        return self
+
+    def __exit__(self, *exc_info):
+        if settings['memory'] and not self.previous['memory']:
+            tracemalloc.stop()
+        settings.update(self.previous)
+        return False
+
+
+def stats():
+    '''{stage: {'calls', 'seconds', 'bytes', 'max_bytes'}} of the figures recorded so far.'''
+    return dict((name, dict(zip(FIELDS, figures))) for name, figures in _stats.items())
+
+
+def merge(other_stats):
+    '''Add the stats() of another process (or run) to this one's.'''
+    for name, figures in other_stats.items():
+        record(name, *[figures[field] for field in FIELDS])
+
+
+def run_profiled(function, chunk, worker_settings):
+    '''
+    Worker: function(chunk) profiled with the settings of the process that
+    sent it. Returns (result, stats of the call) for merge().
+    '''
+    enable(worker_settings['memory'])
+    reset()
+    try:
+        result = function(chunk)
+        return result, stats()
+    finally:
+        reset()
+
+
+def report(thefile=None, sort='seconds'):
+    '''Print the figures as a table, sorted by the field sort (largest first).'''
+    thefile = sys.stdout if thefile is None else thefile
+    memory = any(figures[3] for figures in _stats.values())
+    index = FIELDS.index(sort)
+    header = "%-40s %9s %10s %11s" % ('stage', 'calls', 'total s', 'per call ms')
+    if memory:
+        header += " %12s %12s" % ('allocated MB', 'max call MB')
+    thefile.write(header + '\n')
+    for name, figures in sorted(_stats.items(), key=lambda item: (-item[1][index], item[0])):
+        calls, seconds, allocated, max_allocated = figures
+        line = "%-40s %9d %10.3f %11.3f" % (name, calls, seconds, 1e3 * seconds / max(calls, 1))
+        if memory:
+            line += " %12.1f %12.2f" % (allocated / 1e6, max_allocated / 1e6)
+        thefile.write(line + '\n')
+
+
+def write_json(path):
+    '''Write stats() to the JSON file path.'''
+    with open(path, 'w') as thefile:
+        json.dump(stats(), thefile, indent=1, sort_keys=True)
+
+
+def _report_at_exit():
+    if not _stats:
+        return
+    sys.stdout.write("\nPTI profile (%s=%s)\n" % (ENV_VARIABLE, os.environ.get(ENV_VARIABLE)))
+    report()
+    if os.environ.get(JSON_ENV_VARIABLE):
+        write_json(os.environ[JSON_ENV_VARIABLE])
+
+
+if os.environ.get(ENV_VARIABLE, '0').lower() not in ('', '0', 'false', 'no'):
+    enable(memory=os.environ[ENV_VARIABLE].lower() == 'memory')
+    atexit.register(_report_at_exit)
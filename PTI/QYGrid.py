@@ -0,0 +1,193 @@
+'''
+Quantum yields for every combination of an option grid at once, as the QY
+scripts' run_all_options computes them one QY_analysis at a time:
+
+    import PTI.QYGrid as PTIGrid
+
+    grid = [('correction_region_start', range(360, 372, 2)),
+            ('shift_LUT', [False, True]),
+            ('use_baseline_se', baseline_se_options),
+            (('ex_LUT_interpolation', 'em_LUT_interpolation'), LUT_interpolation_options),
+            (('ex_LUT_split', 'em_LUT_split'), LUT_splitting_options),
+            ('const_diode', [False, True])]
+
+    PTIGrid.write_QY_grid(ETOH, PPO_0x31, grid, "QY Uncertainty Data/PPO_0x31/all_options.txt",
+                          baseline_fit_ranges=[[[300, wl - 5], [450, 600]]
+                                               for wl in [310, 320, 330, 340]],
+                          ex_delta=5, em_int_range=[330, 450], correction_region_end=450,
+                          ex_shift=0.83, em_shift=0.64,
+                          result_headers=['310 nm', '320 nm', '330 nm', '340 nm'])
+
+writes the table PTISweep.run_sweep(all_options_QYs, grid, ...) writes.
+
+Most options change only part of the calculation: use_baseline_se the
+baseline subtracted, const_diode the diode divisor, the excitation LUT
+options one factor per spectrum and correction_region_start an
+integration window. These are array axes of the corrected spectra and of
+the integrals, over one baseline fit per spectrum. Only the emission LUT
+(its interpolation and split, and shift_LUT, which moves both LUTs) is
+looped over. Each value goes through the operations of correct_raw_to_cor
+and pair_quantum_yields, so the results equal the sweep's.
+'''
+import numpy
+
+import PTI.CorrectionLUTs as PTILUT
+import PTI.Corrections as PTICorr
+import PTI.ParameterSweep as PTISweep
+import PTI.Profiling as PTIProf
+from PTI.DataCache import replace_file
+from PTI.QuantumYield import CumulativeIntegral, normalize_QYs
+
+# The options a grid may vary, and their values where it does not
+# (those of correct_raw_to_cor; correction_region_start has none)
+OPTION_DEFAULTS = {'correction_region_start': None,
+                   'shift_LUT': False,
+                   'use_baseline_se': ('none', 'none'),
+                   'ex_LUT_interpolation': 'cubic',
+                   'em_LUT_interpolation': 'cubic',
+                   'ex_LUT_split': 'none',
+                   'em_LUT_split': 'none',
+                   'const_diode': False}
+
+# Axes of the table of results, outermost (looped over) first
+_AXES = ('shift_LUT', 'em_LUT_interpolation', 'em_LUT_split',
+         'use_baseline_se', 'const_diode', 'ex_LUT_interpolation', 'ex_LUT_split',
+         'correction_region_start')
+
+
+def _key(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+def _combinations(grid, defaults):
+    '''The option dicts of the grid completed with the defaults, and {option: distinct values}.'''
+    combinations = list()
+    values = dict((name, list()) for name in OPTION_DEFAULTS)
+    for options in PTISweep.iter_combinations(grid):
+        for name in options:
+            if name not in OPTION_DEFAULTS:
+                raise ValueError("QY_grid cannot vary %s; use PTI.ParameterSweep.run_sweep" % name)
+        completed = dict(defaults)
+        completed.update(options)
+        if completed['correction_region_start'] is None:
+            raise ValueError("correction_region_start must be in the grid or given")
+        for name, value in completed.items():
+            if _key(value) not in values[name]:
+                values[name].append(_key(value))
+        combinations.append(completed)
+    return combinations, values
+
+
+def _inverse_diode(data, const_diode):
+    '''The diode factor of correct_raw_to_cor's corrections.'''
+    corrections = numpy.ones(data.wavelengths.size)
+    if const_diode:
+        corrections /= numpy.mean(data.diode)
+    else:
+        corrections /= data.diode
+    return corrections
+
+
+@PTIProf.timed('QYGrid.QY_grid')
+def QY_grid(blanks, fluors, grid, baseline_fit_ranges, ex_delta, em_int_range,
+            correction_region_end=None, fluor_baseline_fit_ranges=None,
+            ex_shift=0, em_shift=0, FS=False, ratio_accepted_error=0.1, **defaults):
+    '''
+    Corrected quantum yields of (blank, fluor) pairs for every combination of
+    the grid (see PTI.ParameterSweep), as correct_raw_to_cor followed by
+    pair_quantum_yields.
+    - blanks, fluors: lists of PTIData objects, all on the same wavelength grid.
+    - baseline_fit_ranges: one list of baseline ranges per pair, used for the
+      fluors too unless fluor_baseline_fit_ranges is given.
+    - ex_delta, em_int_range, ratio_accepted_error: as pair_quantum_yields;
+      the correction region runs from correction_region_start to
+      correction_region_end (default: the end of em_int_range).
+    - ex_shift, em_shift, FS: as correct_raw_to_cor.
+    - defaults: values of the options of OPTION_DEFAULTS that the grid does
+      not vary.
+    Returns (combinations, QYs): the option dicts in grid order, completed
+    with the defaults, and the (combinations x pairs) corrected QYs.
+    A spectrum whose offsets cannot be fitted for shift_LUT=True raises
+    RuntimeError, as correct_raw_to_cor does.
+    '''
+    spectra = list(blanks) + list(fluors)
+    num_pairs = len(blanks)
+    wavelengths = numpy.asarray(blanks[0].wavelengths, dtype=float)
+    for data in spectra:
+        if data.wavelengths.size != wavelengths.size or numpy.any(data.wavelengths != wavelengths):
+            raise ValueError("Cannot stack %s: its wavelengths differ from %s"
+                             % (data.file_path, blanks[0].file_path))
+    step = blanks[0].step_size
+    if correction_region_end is None:
+        correction_region_end = em_int_range[1]
+    if fluor_baseline_fit_ranges is None:
+        fluor_baseline_fit_ranges = baseline_fit_ranges
+
+    options = dict(OPTION_DEFAULTS)
+    options.update(defaults)
+    combinations, values = _combinations(grid, options)
+    ex_wavelengths = numpy.array([data.ex_range[0] for data in spectra], dtype=float)
+    starts = numpy.asarray(values['correction_region_start'], dtype=float)
+
+    # (baseline SE options, spectra, W): the raw data less each baseline
+    fits = [PTICorr.baseline_variants(data, ranges)[0]
+            for data, ranges in zip(spectra, list(baseline_fit_ranges) + list(fluor_baseline_fit_ranges))]
+    raw_data = numpy.array([data.raw_data for data in spectra], dtype=float)
+    signal = raw_data - numpy.array([[baselines[se] for baselines in fits]
+                                     for se in values['use_baseline_se']])
+    # (diode options, 1, 1, spectra, W)
+    inverse_diode = numpy.array([[_inverse_diode(data, const_diode) for data in spectra]
+                                 for const_diode in values['const_diode']])[:, None, None]
+
+    table = numpy.empty([len(values[name]) for name in _AXES] + [num_pairs])
+    for h, shift_LUT in enumerate(values['shift_LUT']):
+        shifts = numpy.array([PTICorr.monochromator_shifts(data, shift_LUT, ex_shift, em_shift)
+                              for data in spectra], dtype=float)
+        # (ex interpolations, ex splits, spectra, 1)
+        excorr = numpy.array([[PTILUT.interpolator('excorr', kind, split)(ex_wavelengths + shifts[:, 0])
+                               for split in values['ex_LUT_split']]
+                              for kind in values['ex_LUT_interpolation']])[..., None]
+        for k, em_kind in enumerate(values['em_LUT_interpolation']):
+            for l, em_split in enumerate(values['em_LUT_split']):
+                emcorr = PTICorr.emcorr_on_grid(wavelengths, step, em_kind, FS, em_split, shifts[:, 1])
+                # (SE, diode, ex interpolation, ex split, spectra, W), as correct_raw_to_cor
+                corrections = inverse_diode / excorr * emcorr
+                cor_data = signal[:, None, None, None] * corrections[None]
+
+                shape = cor_data.shape[:4]
+                integral = CumulativeIntegral(cor_data[..., num_pairs:, :].reshape(-1, wavelengths.size),
+                                              cor_data[..., :num_pairs, :].reshape(-1, wavelengths.size),
+                                              wavelengths=wavelengths, step_size=step)
+                ex_lower = numpy.tile(ex_wavelengths[:num_pairs] - ex_delta, int(numpy.prod(shape)))
+                ex_upper = numpy.tile(ex_wavelengths[:num_pairs] + ex_delta, int(numpy.prod(shape)))
+                num_absorbed = -integral(ex_lower, ex_upper)
+                num_emitted = integral(em_int_range[0], em_int_range[1])
+                correction_area = integral(starts[None, :], correction_region_end)
+
+                QYs = (num_emitted / num_absorbed).reshape(shape + (1, num_pairs))
+                ratios = (correction_area / num_emitted[:, None]).reshape(shape + (num_pairs, starts.size))
+                table[h, k, l] = normalize_QYs(QYs, numpy.swapaxes(ratios, -1, -2), ratio_accepted_error)
+
+    indices = [list() for name in _AXES]
+    for options in combinations:
+        for index, name in zip(indices, _AXES):
+            index.append(values[name].index(_key(options[name])))
+    return combinations, table[tuple(indices)]
+
+
+def write_QY_grid(blanks, fluors, grid, output_path, columns=PTISweep.ALL_OPTIONS_COLUMNS,
+                  result_headers=(), **kwargs):
+    '''
+    QY_grid(blanks, fluors, grid, **kwargs) written to the CSV file
+    output_path as run_sweep writes it: one row per combination with the
+    option columns followed by the QYs. Returns the QYs.
+    '''
+    combinations, QYs = QY_grid(blanks, fluors, grid, **kwargs)
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w') as thefile:
+        thefile.write(','.join([column[0] for column in columns] + list(result_headers)) + '\n')
+        for options, values in zip(combinations, QYs):
+            thefile.write(','.join(PTISweep.option_fields(options, columns) +
+                                   [PTISweep.format_value(value) for value in values]) + '\n')
+    replace_file(tmp_path, output_path)
+    return QYs
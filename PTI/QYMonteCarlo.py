@@ -0,0 +1,231 @@
+'''
+Monte Carlo uncertainty of quantum yields.
+
+Instead of enumerating the discrete option grids of the QY scripts, every
+realization draws
+- the baseline (intercept, slope) of each spectrum from the covariance of
+  its least-squares fit,
+- the excitation and emission monochromator shifts (normal, shared by all
+  spectra of a realization),
+- the start of the correction region (uniform over candidate starts),
+- Poisson counting noise on the raw data,
+and the quantum yields are computed as in the QY scripts' QY_analysis.
+That runs with shift_LUT=False, i.e. unshifted LUTs, so the shifts are
+drawn around 0 here:
+
+    import PTI.QYMonteCarlo as PTIMC
+
+    result = PTIMC.simulate_QY(list(zip(ETOH, PPO_0x31)), em_int_range=[330, 450],
+                               baseline_fit_ranges=[[[300, wl - 5], [450, 600]]
+                                                    for wl in [310, 320, 330, 340]],
+                               correction_region_starts=range(360, 372, 2),
+                               ex_shift=(0., 0.3), em_shift=(0., 0.3),
+                               counts_per_unit=2., num_realizations=100000)
+    mean, std, lower, upper = PTIMC.confidence_interval(result['corrected_QY'])
+
+No spectrum is corrected per realization. Every integral the QY needs is
+linear in the data and the baseline, so it is
+    (Y(em_shift) + noise - b * A(em_shift) - m * X(em_shift)) / E(ex_shift)
+where Y, A and X are Simpson integrals of the emission-corrected data, of
+the correction and of wavelength times the correction, and E is the
+excitation correction. These are tabulated once per spectrum over a grid
+of shifts and interpolated for each realization. The noise on each
+integral is drawn from the exact covariance of the Poisson noise (as a
+normal, fine for the count rates of these scans), and the baseline draw
+is taken as independent of it.
+'''
+import numpy
+
+import PTI.CorrectionLUTs as PTILUT
+import PTI.Corrections as PTICorr
+from PTI.QuantumYield import normalize_QYs, simps
+
+# Points of the shift tables, spanning SHIFT_TABLE_SPAN standard deviations
+SHIFT_TABLE_POINTS = 65
+SHIFT_TABLE_SPAN = 6.
+
+
+def _simpson_weights(wavelengths, int_range, step):
+    '''Weights w with sum(w * y) == simps(y[in range], dx=step), as integrate_between.'''
+    limits = numpy.where((wavelengths >= int_range[0]) &
+                         (wavelengths <= int_range[1]))[0]
+    weights = numpy.zeros(wavelengths.size)
+    if limits.size:
+        weights[limits] = simps(y=numpy.eye(limits.size), dx=step)
+    return weights
+
+
+def _shift_grid(mean, std):
+    if std == 0:
+        return numpy.array([float(mean)])
+    return mean + std * numpy.linspace(-SHIFT_TABLE_SPAN, SHIFT_TABLE_SPAN, SHIFT_TABLE_POINTS)
+
+
+def _interp_rows(grid, table, values):
+    '''numpy.interp of every row of table (rows x len(grid)) at values, in one go.'''
+    if grid.size == 1:
+        return numpy.repeat(table, values.size, axis=1)
+    position = numpy.clip((values - grid[0]) / (grid[1] - grid[0]), 0, grid.size - 1)
+    lower = numpy.minimum(position.astype(int), grid.size - 2)
+    fraction = position - lower
+    return table[:, lower] * (1 - fraction) + table[:, lower + 1] * fraction
+
+
+def _normal_factor(cov):
+    '''F with F F^T == cov, for drawing correlated normals (cov may be singular).'''
+    eigenvalues, eigenvectors = numpy.linalg.eigh(cov)
+    return eigenvectors * numpy.sqrt(numpy.clip(eigenvalues, 0, None))
+
+
+def _spectrum_integrals(data, region_weights, baseline_fit_ranges,
+                        ex_grid, em_grid, counts_per_unit, options):
+    '''
+    The shift tables of one spectrum for the given integration regions
+    (rows of region_weights): Y, A, X over em_grid, E over ex_grid, and the
+    baseline fit and the noise covariance of the Y integrals.
+    '''
+    wavelengths = numpy.asarray(data.wavelengths, dtype=float)
+    raw_data = numpy.asarray(data.raw_data, dtype=float)
+
+    diode = numpy.ones(wavelengths.size)
+    if options['apply_diode']:
+        diode = numpy.mean(data.diode) * diode if options['const_diode'] else data.diode
+    if options['apply_em_LUT']:
+        emcorr = PTICorr.emcorr_on_grid(wavelengths, data.step_size, options['em_LUT_interpolation'],
+                                        options['FS'], options['em_LUT_split'], em_grid)
+    else:
+        emcorr = numpy.ones((em_grid.size, wavelengths.size))
+    if options['apply_ex_LUT']:
+        excorr = PTILUT.interpolator('excorr', options['ex_LUT_interpolation'],
+                                     options['ex_LUT_split'])(data.ex_range[0] + ex_grid)
+    else:
+        excorr = numpy.ones(ex_grid.size)
+
+    # (regions x shifts) tables
+    weighted = region_weights[:, None, :] * (emcorr / diode)[None, :, :]
+    tables = {'Y': (weighted * raw_data).sum(axis=2),
+              'A': weighted.sum(axis=2),
+              'X': (weighted * wavelengths).sum(axis=2),
+              'E': numpy.asarray(excorr, dtype=float)}
+
+    params, cov_matrix = PTICorr.linear_baseline_params(data, baseline_fit_ranges)
+    tables['baseline'] = numpy.asarray(params)
+    tables['baseline_factor'] = _normal_factor(numpy.asarray(cov_matrix))
+
+    if counts_per_unit:
+        # Poisson: var(raw) = raw / counts_per_unit, taken at the central shift
+        nominal = weighted[:, em_grid.size // 2, :]
+        variance = numpy.clip(raw_data, 0, None) / counts_per_unit
+        tables['noise_factor'] = _normal_factor((nominal * variance).dot(nominal.T))
+    return tables
+
+
+def simulate_QY(pairs, em_int_range, baseline_fit_ranges,
+                correction_region_starts, correction_region_end=None,
+                ex_delta=5, num_realizations=10000,
+                ex_shift=(0., 0.), em_shift=(0., 0.),
+                sample_baseline=True, counts_per_unit=None,
+                ex_LUT_split='none', em_LUT_split='none',
+                ex_LUT_interpolation='cubic', em_LUT_interpolation='cubic', FS=False,
+                apply_diode=True, apply_ex_LUT=True, apply_em_LUT=True,
+                const_diode=False, ratio_accepted_error=0.1, seed=None):
+    '''
+    Quantum yield distributions for a set of (blank, fluor) pairs measured at
+    different excitation wavelengths, as computed by the QY scripts'
+    QY_analysis with correct_raw_to_cor and integrate_between.
+    - pairs: list of (blank, fluor) PTIData objects.
+    - em_int_range: emission integration range; the absorption range is
+      ex_delta around each pair's excitation wavelength.
+    - baseline_fit_ranges: one list of baseline ranges per pair.
+    - correction_region_starts: candidate starts of the correction region,
+      drawn uniformly; the region ends at correction_region_end (default:
+      the end of em_int_range).
+    - ex_shift, em_shift: (mean, standard deviation) of the monochromator
+      shifts in nm. They are always applied to the LUTs, unlike the
+      ex_shift and em_shift of correct_raw_to_cor, which count only with
+      shift_LUT=True; means of 0 correspond to shift_LUT=False.
+    - sample_baseline: draw the baseline parameters from their covariance.
+    - counts_per_unit: detector counts per unit of raw_data for the Poisson
+      noise (e.g. the integration time in s for counts/s); None for no noise.
+    The remaining options are those of correct_raw_to_cor.
+    Returns a dict of (num_realizations x pairs) arrays: 'num_absorbed',
+    'num_emitted', 'correction_area', 'QY', 'correction_ratio' and
+    'corrected_QY', and the draws 'ex_shift', 'em_shift' and
+    'correction_region_start' (num_realizations,).
+    '''
+    rng = numpy.random.RandomState(seed)
+    options = dict(ex_LUT_split=ex_LUT_split, em_LUT_split=em_LUT_split,
+                   ex_LUT_interpolation=ex_LUT_interpolation,
+                   em_LUT_interpolation=em_LUT_interpolation, FS=FS,
+                   apply_diode=apply_diode, apply_ex_LUT=apply_ex_LUT, apply_em_LUT=apply_em_LUT,
+                   const_diode=const_diode)
+    if correction_region_end is None:
+        correction_region_end = em_int_range[1]
+    starts = numpy.sort(numpy.asarray(list(correction_region_starts), dtype=float))
+
+    ex_grid = _shift_grid(*ex_shift)
+    em_grid = _shift_grid(*em_shift)
+    draws = {'ex_shift': ex_shift[0] + ex_shift[1] * rng.standard_normal(num_realizations),
+             'em_shift': em_shift[0] + em_shift[1] * rng.standard_normal(num_realizations),
+             'correction_region_start': starts[rng.randint(starts.size, size=num_realizations)]}
+    start_index = numpy.searchsorted(starts, draws['correction_region_start'])
+
+    realization = numpy.arange(num_realizations)
+    names = ['num_absorbed', 'num_emitted', 'correction_area']
+    result = dict((name, numpy.empty((num_realizations, len(pairs)))) for name in names)
+
+    for j, (blank, fluor) in enumerate(pairs):
+        ex_wavelength = blank.ex_range[0]
+        wavelengths = numpy.asarray(blank.wavelengths, dtype=float)
+        # Regions: absorption, emission, then the correction region for each start
+        regions = [[ex_wavelength - ex_delta, ex_wavelength + ex_delta], em_int_range]
+        regions += [[start, correction_region_end] for start in starts]
+        region_weights = numpy.array([_simpson_weights(wavelengths, region, blank.step_size)
+                                      for region in regions])
+
+        integrals = list()
+        for data in (blank, fluor):
+            tables = _spectrum_integrals(data, region_weights, baseline_fit_ranges[j],
+                                         ex_grid, em_grid, counts_per_unit, options)
+            Y = _interp_rows(em_grid, tables['Y'], draws['em_shift'])
+            A = _interp_rows(em_grid, tables['A'], draws['em_shift'])
+            X = _interp_rows(em_grid, tables['X'], draws['em_shift'])
+            E = _interp_rows(ex_grid, tables['E'][None, :], draws['ex_shift'])[0]
+
+            baseline = numpy.repeat(tables['baseline'][:, None], num_realizations, axis=1)
+            if sample_baseline:
+                baseline = baseline + tables['baseline_factor'].dot(
+                    rng.standard_normal((2, num_realizations)))
+            if counts_per_unit:
+                Y = Y + tables['noise_factor'].dot(rng.standard_normal((len(regions), num_realizations)))
+
+            # (regions x realizations)
+            integrals.append((Y - baseline[0] * A - baseline[1] * X) / E)
+
+        blank_integrals, fluor_integrals = integrals
+        result['num_absorbed'][:, j] = blank_integrals[0] - fluor_integrals[0]
+        result['num_emitted'][:, j] = fluor_integrals[1] - blank_integrals[1]
+        result['correction_area'][:, j] = (fluor_integrals[2 + start_index, realization] -
+                                           blank_integrals[2 + start_index, realization])
+
+    result['QY'] = result['num_emitted'] / result['num_absorbed']
+    result['correction_ratio'] = result['correction_area'] / result['num_emitted']
+
+    # Normalised by the mean of the ratios close to the first pair's, as QY_analysis does
+    result['corrected_QY'] = normalize_QYs(result['QY'], result['correction_ratio'],
+                                           ratio_accepted_error)
+
+    result.update(draws)
+    return result
+
+
+def confidence_interval(values, level=0.6827):
+    '''
+    Summary of Monte Carlo draws along the first axis:
+    (mean, standard deviation, lower, upper) with [lower, upper] the central
+    interval containing the fraction level of the draws.
+    '''
+    values = numpy.asarray(values)
+    tail = 50. * (1 - level)
+    lower, upper = numpy.percentile(values, [tail, 100. - tail], axis=0)
+    return values.mean(axis=0), values.std(axis=0, ddof=1), lower, upper
@@ -1,7 +1,23 @@
 import copy
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy.integrate import simps
+
+import PTI.Profiling as PTIProf
+
+# scipy.integrate, imported on first use as it takes longer than the rest of the package
+_scipy = dict()
+
+
+@PTIProf.timed('QuantumYield.simps')
+def simps(y, x=None, dx=1., axis=-1):
+    '''scipy.integrate.simps (simpson in newer versions of SciPy).'''
+    if 'simps' not in _scipy:
+        try:
+            from scipy.integrate import simps as function
+        except ImportError: # Renamed in newer versions of SciPy
+            from scipy.integrate import simpson as function
+        _scipy['simps'] = function
+    return _scipy['simps'](y, x=x, dx=dx, axis=axis)
+
 
 def integrate_between(blank, fluor, int_range):
     difference = blank.cor_data - fluor.cor_data
@@ -24,3 +40,174 @@ def calculate_quantum_yield(blank, fluor, ex_int_range, em_int_range):
 def calculate_QY(blank, fluor, ex_int_range, em_int_range):
     return calculate_quantum_yield(blank, fluor, ex_int_range, em_int_range)
 
+
+
+def _simps_even_rule():
+    '''How simps treats an odd number of intervals: 'avg' (SciPy < 1.11, the
+    average of a trapezoid at either end) or 'cartwright' (later versions).'''
+    if 'even_rule' not in _scipy:
+        if abs(simps(y=np.array([0., 0., 1., 0.]), dx=1.) - 1.) < 1e-12:
+            _scipy['even_rule'] = 'cartwright'
+        else:
+            _scipy['even_rule'] = 'avg'
+    return _scipy['even_rule']
+
+
+class CumulativeIntegral(object):
+    '''
+    Integrals of blank.cor_data - fluor.cor_data over wavelength windows,
+    equal to integrate_between(blank, fluor, window) but each answered in
+    constant time from prefix sums of the Simpson panels:
+
+        integral = CumulativeIntegral(fluor, blank)
+        num_emitted = integral(330, 450)
+        correction_areas = integral(np.arange(360, 372, 2), 450)
+
+    The window ends may be arrays (broadcast together) for many windows in
+    one call. fluor may be None to integrate blank.cor_data alone.
+    The wavelengths must be increasing.
+
+    blank and fluor may also be (N x W) arrays of spectra on the grid given
+    by wavelengths and step_size; each row is then integrated separately and
+    the window ends broadcast against the rows, e.g. lower of shape (N,) for
+    one window per row or (N, k) for k windows per row.
+    '''
+    def __init__(self, blank, fluor=None, wavelengths=None, step_size=None):
+        if wavelengths is None:
+            wavelengths = blank.wavelengths
+            step_size = blank.step_size
+            blank = blank.cor_data
+            fluor = None if fluor is None else fluor.cor_data
+        self.wavelengths = np.asarray(wavelengths, dtype=float)
+        self.dx = step_size
+        if fluor is None:
+            self.y = np.asarray(blank, dtype=float)
+        else:
+            self.y = np.asarray(blank, dtype=float) - np.asarray(fluor, dtype=float)
+        self.stacked = self.y.ndim == 2
+        y = np.atleast_2d(self.y)
+        dx = self.dx
+
+        # Simpson panel k covers points k, k+1, k+2; panels of the same
+        # parity are summed separately so any run of them is a difference
+        panels = dx / 3. * (y[:, :-2] + 4 * y[:, 1:-1] + y[:, 2:])
+        self._panel_sums = np.zeros((y.shape[0], y.shape[1] + 1))
+        for parity in (0, 1):
+            index = np.arange(parity, panels.shape[1], 2)
+            self._panel_sums[:, index + 2] = np.cumsum(panels[:, index], axis=1)
+        self._trapezoids = dx / 2. * (y[:, :-1] + y[:, 1:])
+        self._y = y
+
+    def _simpson(self, rows, first, last):
+        '''Composite Simpson over points first..last (an even number of intervals).'''
+        return self._panel_sums[rows, last] - self._panel_sums[rows, first]
+
+    def __call__(self, lower, upper):
+        lower, upper = np.broadcast_arrays(np.asarray(lower, dtype=float),
+                                           np.asarray(upper, dtype=float))
+        if self.stacked:
+            if lower.ndim == 0:
+                lower, upper = lower[None], upper[None]
+            rows = np.arange(self._y.shape[0]).reshape((-1,) + (1,) * (lower.ndim - 1))
+            rows, lower, upper = np.broadcast_arrays(rows, lower, upper)
+        else:
+            rows = 0
+        first = np.searchsorted(self.wavelengths, lower, 'left')
+        last = np.searchsorted(self.wavelengths, upper, 'right') - 1
+        num_points = last - first + 1
+
+        # Indices kept in range for the branches that do not apply
+        top = self._y.shape[1] - 1
+        first = np.clip(first, 0, top)
+        last = np.clip(last, 0, top)
+        # Last point of the part with an even number of intervals
+        simpson_last = np.maximum(last - ((num_points + 1) % 2), first)
+
+        result = self._simpson(rows, first, simpson_last)
+        even = (num_points % 2 == 0) & (num_points >= 4)
+        if even.any():
+            y = self._y
+            last_2 = np.clip(last - 2, 0, top)
+            if _simps_even_rule() == 'avg':
+                ends = 0.5 * (self._simpson(rows, first, simpson_last) +
+                              self._trapezoids[rows, np.clip(last - 1, 0, top - 1)] +
+                              self._trapezoids[rows, np.clip(first, 0, top - 1)] +
+                              self._simpson(rows, np.clip(first + 1, 0, top), last))
+            else:
+                ends = self._simpson(rows, first, simpson_last) + self.dx * (
+                    5. / 12 * y[rows, last] + 8. / 12 * y[rows, np.clip(last - 1, 0, top)] -
+                    1. / 12 * y[rows, last_2])
+            result = np.where(even, ends, result)
+        result = np.where(num_points == 2, self._trapezoids[rows, np.clip(first, 0, top - 1)], result)
+        result = np.where(num_points < 2, 0., result)
+        return result[()] if result.ndim == 0 else result
+
+
+def normalize_QYs(QYs, correction_ratios, ratio_accepted_error=0.1):
+    '''
+    QYs * correction_ratios / (mean of the ratios within ratio_accepted_error
+    of the first), along the last axis, as the QY scripts normalise.
+    '''
+    QYs = np.asarray(QYs, dtype=float)
+    ratios = np.asarray(correction_ratios, dtype=float)
+    similar = abs(ratios - ratios[..., :1]) < ratio_accepted_error
+    mean_similar = (ratios * similar).sum(axis=-1) / similar.sum(axis=-1)
+    return QYs * ratios / mean_similar[..., None]
+
+
+@PTIProf.timed('QuantumYield.quantum_yields')
+def quantum_yields(wavelengths, step_size, blank_cor, fluor_cor,
+                   ex_int_ranges, em_int_ranges, correction_int_ranges=None,
+                   normalize=True, ratio_accepted_error=0.1):
+    '''
+    Quantum yields of N (blank, fluor) pairs in one pass.
+    - blank_cor, fluor_cor: (N x W) corrected spectra on the grid wavelengths.
+    - ex_int_ranges, em_int_ranges, correction_int_ranges: [lower, upper]
+      for every pair, or (N x 2) for one window per pair.
+    - normalize: include 'corrected_QY', see normalize_QYs (needs
+      correction_int_ranges).
+    Returns a dict of (N,) arrays: 'num_absorbed', 'num_emitted', 'QY' and,
+    with correction_int_ranges, 'correction_area', 'correction_ratio' and
+    'corrected_QY'.
+    '''
+    blank_cor = np.atleast_2d(blank_cor)
+    integral = CumulativeIntegral(np.atleast_2d(fluor_cor), blank_cor,
+                                  wavelengths=wavelengths, step_size=step_size)
+    num_rows = blank_cor.shape[0]
+
+    def window(int_ranges):
+        int_ranges = np.broadcast_to(np.asarray(int_ranges, dtype=float), (num_rows, 2))
+        return int_ranges[:, 0], int_ranges[:, 1]
+
+    result = dict()
+    result['num_absorbed'] = -integral(*window(ex_int_ranges))
+    result['num_emitted'] = integral(*window(em_int_ranges))
+    result['QY'] = result['num_emitted'] / result['num_absorbed']
+    if correction_int_ranges is not None:
+        result['correction_area'] = integral(*window(correction_int_ranges))
+        result['correction_ratio'] = result['correction_area'] / result['num_emitted']
+        if normalize:
+            result['corrected_QY'] = normalize_QYs(result['QY'], result['correction_ratio'],
+                                                   ratio_accepted_error)
+    return result
+
+
+def pair_quantum_yields(blanks, fluors, ex_delta, em_int_range, correction_int_range=None,
+                        normalize=True, ratio_accepted_error=0.1):
+    '''
+    quantum_yields for lists of corrected blank and fluor PTIData objects,
+    all on the same wavelength grid, with the absorption window ex_delta
+    around each blank's excitation wavelength.
+    '''
+    wavelengths = np.asarray(blanks[0].wavelengths, dtype=float)
+    for data in list(blanks) + list(fluors):
+        if data.wavelengths.size != wavelengths.size or np.any(data.wavelengths != wavelengths):
+            raise ValueError("Cannot stack %s: its wavelengths differ from %s"
+                             % (data.file_path, blanks[0].file_path))
+    ex_wavelengths = np.array([blank.ex_range[0] for blank in blanks], dtype=float)
+    ex_int_ranges = np.column_stack([ex_wavelengths - ex_delta, ex_wavelengths + ex_delta])
+    return quantum_yields(wavelengths, blanks[0].step_size,
+                          np.array([blank.cor_data for blank in blanks], dtype=float),
+                          np.array([fluor.cor_data for fluor in fluors], dtype=float),
+                          ex_int_ranges, em_int_range, correction_int_range,
+                          normalize=normalize, ratio_accepted_error=ratio_accepted_error)
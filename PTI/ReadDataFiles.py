@@ -3,22 +3,249 @@
 These classes handle data from the PTI spectrometer.
 TEXT data are assumed (not the .gx* nonsense).
 '''
+import collections
 import copy
+import io
 import os
 from enum import Enum
 import time
-import pandas
 import numpy
 
+from PTI import DataCache
+import PTI.Profiling as PTIProf
+
+
+# Bytes read from a file at a time by iter_groups
+CHUNK_SIZE = 1 << 20
+
+# One <Group> or <Trace> block of a PTI text file:
+# - kind: 'Group' or 'Trace'.
+# - name: the detector line of a group (None for a trace).
+# - labels: the label of each trace in the block.
+# - num_samples: the number of samples of each trace.
+# - acquisition: the last 'Acquisition ...' line before the block (sessions), or None.
+# - columns: (2 * traces x samples) float64 array of the X and Y columns of
+#   each trace in turn, NaN past the end of traces shorter than the longest.
+PTIGroup = collections.namedtuple('PTIGroup', ['kind', 'name', 'labels', 'num_samples',
+                                               'acquisition', 'columns'])
+
+
+class _Tokenizer(object):
+    '''
+    Lines and tagged data regions of PTI text, from bytes already read
+    (contents) or read from thefile in chunks, keeping only what has not
+    been consumed yet.
+    '''
+    def __init__(self, contents=b'', thefile=None, chunk_size=CHUNK_SIZE):
+        self._data = contents
+        self._pos = 0
+        self._file = thefile
+        self._chunk_size = chunk_size
+
+    def _Fill(self):
+        '''Read the next chunk (at least as much as is held, so growth is linear); False at the end.'''
+        if self._file is None:
+            return False
+        chunk = self._file.read(max(self._chunk_size, len(self._data) - self._pos))
+        if not chunk:
+            self._file = None
+            return False
+        self._data = self._data[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _Find(self, token):
+        position = self._data.find(token, self._pos)
+        while position < 0:
+            searched = max(self._pos, len(self._data) - len(token) + 1)
+            consumed = self._pos
+            if not self._Fill():
+                return -1
+            position = self._data.find(token, searched - consumed)
+        return position
+
+    def Line(self):
+        '''The next line, stripped of whitespace; None at the end.'''
+        end = self._Find(b'\n')
+        if end < 0:
+            if self._pos >= len(self._data):
+                return None
+            end = len(self._data)
+        line = self._data[self._pos:end].strip()
+        self._pos = end + 1
+        return line
+
+    def Until(self, tag):
+        '''The bytes up to tag, which is consumed with them.'''
+        end = self._Find(tag)
+        if end < 0:
+            raise ValueError("Missing %s" % tag.decode('latin-1'))
+        region = self._data[self._pos:end]
+        self._pos = end + len(tag)
+        return region
+
+
+def _Columns(region, num_samples, which=None):
+    '''
+    The columns of PTIGroup from the data rows of a block, or only the
+    columns listed in which (the others are not converted).
+    '''
+    num_columns = 2 * len(num_samples)
+    width = max(num_samples) if num_samples else 0
+    if which is None:
+        which = range(num_columns)
+    columns = numpy.empty((len(which), width), dtype=numpy.float64)
+    if len(set(num_samples)) <= 1:
+        tokens = region.split()
+        stop = num_columns * width
+        for row, j in zip(columns, which):
+            row[:] = tokens[j:stop:num_columns]
+        return columns
+
+    # Traces of different lengths leave empty fields in the rows
+    columns[:] = numpy.nan
+    for i, row in enumerate(row for row in region.splitlines() if row.strip()):
+        if i == width:
+            break
+        fields = row.split(b'\t')
+        for k, j in enumerate(which):
+            if j < len(fields) and fields[j].strip():
+                columns[k, i] = float(fields[j])
+    return columns
+
+
+def _IterBlocks(tokenizer):
+    '''
+    Walk the <Group> and <Trace> blocks of the tokenizer's text in order,
+    yielding the fields of PTIGroup with the unconverted data rows in place
+    of the columns.
+    '''
+    acquisition = None
+    while True:
+        line = tokenizer.Line()
+        if line is None:
+            return
+        if line.startswith(b'Acquisition'):
+            acquisition = line.decode('latin-1')
+        elif line == b'<Group>':
+            name = tokenizer.Line().decode('latin-1')
+            tokenizer.Line()    # number of traces
+            num_samples = [int(count) for count in tokenizer.Line().split()]
+            labels = [label.strip().decode('latin-1') for label in tokenizer.Line().split(b'\t')[::2]]
+            tokenizer.Line()    # X/Y column headings
+            yield 'Group', name, labels, num_samples, acquisition, tokenizer.Until(b'</Group>')
+        elif line == b'<Trace>':
+            num_samples = [int(tokenizer.Line())]
+            labels = [tokenizer.Line().decode('latin-1')]
+            tokenizer.Line()    # X/Y column headings
+            yield 'Trace', None, labels, num_samples, acquisition, tokenizer.Until(b'</Trace>')
+
+
+def iter_groups(fname, chunk_size=CHUNK_SIZE):
+    '''
+    Stream the <Group> and <Trace> blocks of a PTI text file (session, trace
+    or group) as PTIGroup tuples, in file order. The file is read in chunks,
+    so only about one block is held in memory at a time, however many
+    blocks (detectors, acquisitions) the file has.
+    '''
+    with open(fname, 'rb') as thefile:
+        for fields in _IterBlocks(_Tokenizer(thefile=thefile, chunk_size=chunk_size)):
+            yield PTIGroup(*(fields[:5] + (_Columns(fields[5], fields[3]),)))
+
+
+# Module level so that instances can be pickled (e.g. for process pools)
+RunType = Enum('RunType', 'Unknown Emission Excitation Synchronous')
+FileType = Enum('FileType', 'Unknown Session Trace Group')
+
+
 class PTIData(object):
-    '''PTI spectrometer data class.'''
-    run_types = Enum('RunType', 'Unknown Emission Excitation Synchronous')
-    file_types = Enum('FileType', 'Unknown Session Trace Group')
+    '''
+    PTI spectrometer data class.
+
+    The members are slots, so an instance has no __dict__ and no other
+    attributes can be set. The data channels (DataCache.CHANNELS) are
+    normally views of the rows of one contiguous (channels x samples)
+    float64 buffer; assigning a new array to a channel replaces only that
+    channel and pack() gathers them into one buffer again. Copies and
+    pickles move the buffer as one array.
+    '''
+    __slots__ = ('file_path', 'file_type', 'RunType', 'read_success',
+                 'acq_start', 'num_samples', 'step_size', 'PMT_mode', 'ex_range', 'em_range',
+                 'wavelengths', 'raw_data', 'cor_data', 'diode',
+                 'baseline', 'baseline_incpt', 'baseline_slope', 'baseline_incpt_se', 'baseline_slope_se',
+                 'ex_monochromator_offset', 'em_monochromator_offset',
+                 'SpecCorrected', 'USpecCorrected',
+                 '_lazy', '_buffer', '_buffer_rows', '__weakref__')
+    run_types = RunType
+    file_types = FileType
     print_initialize= False
-    def __init__(self, fname):
+    use_cache = True # Set to False to always parse the text file (see PTI.DataCache)
+    # Members that lazy instances fill in on first access
+    lazy_fields = ('wavelengths', 'raw_data', 'cor_data', 'diode', 'step_size')
+    @PTIProf.timed('PTIData')
+    def __init__(self, fname, header_only=False, lazy=False):
+        '''
+        Read the PTI text file fname.
+        - header_only: read the header fields only; the data stay None.
+        - lazy: read the header now and the data on first use of any of
+                lazy_fields.
+        '''
         if self.print_initialize:
             print("Initializing PTI_Data at {0}".format(time.asctime(time.localtime())))
         
+        self._InitMembers()
+
+        ## Reading in the file ##
+        # Take in the given parameter
+        self.file_path = fname
+        
+        # Checking for file's existence and opening if possible
+        if not os.path.exists(fname):
+            print("ERROR!! File does not exist.")
+            self.read_success = False            
+            return
+        
+
+        # Reuse the arrays parsed on an earlier run when the file is unchanged
+        from_cache = self.use_cache and not (header_only or lazy) and DataCache.load(self)
+
+        if not from_cache:
+            # The file is read once; the header and data parsers work on its contents
+            contents = self._ReadContents(header_only or lazy)
+            firstline = contents[:contents.find(b'\n')]
+            if b'<Session>' in firstline:
+                self.file_type = self.file_types.Session
+            elif b'<Trace>' in firstline:
+                self.file_type = self.file_types.Trace
+            elif b'<Group>' in firstline:
+                self.file_type = self.file_types.Group
+            else:
+                print("ERROR!! Unknown file format.")
+                self.file_type = self.file_types.Unknown
+                self.read_success = False
+                return
+
+            self.read_success = self.ReadHeaderInfo(contents)
+
+        # Only the header fields are wanted (e.g. for indexing an archive)
+        if header_only:
+            return
+
+        # Leave the data members unset so that __getattr__ reads them when used
+        if lazy:
+            for name in self.lazy_fields:
+                delattr(self, name)
+            self._lazy = True
+            return
+
+        if not from_cache:
+            self.ReadSpecData(contents)
+            if self.use_cache and self.read_success:
+                DataCache.store(self, contents)
+        return
+
+    def _InitMembers(self):
+        '''Set every member to its default (unread) value.'''
         ## Member variables for reference ##
         self.file_path = str() # The file name to be read in
         self.file_type = str() # Possibilities: Session, Trace, Group
@@ -34,7 +261,13 @@ class PTIData(object):
         self.raw_data = None
         self.cor_data = None
         self.diode   = None
-        
+        # The buffer the channels are rows of, and (name, row) for each of them
+        self._buffer = None
+        self._buffer_rows = ()
+        self._lazy = False
+        self.read_success = False
+
+        self.baseline = None
         self.baseline_incpt = None
         self.baseline_slope = None
         self.baseline_incpt_se = None
@@ -43,49 +276,32 @@ class PTIData(object):
         self.ex_monochromator_offset = -1
         self.em_monochromator_offset = -1
 
+        self.SpecCorrected = None
+        self.USpecCorrected = None
 
-        ## Reading in the file ##
-        # Take in the given parameter
-        self.file_path = fname
-        
-        # Checking for file's existence and opening if possible
-        if not os.path.exists(fname):
-            print("ERROR!! File does not exist.")
-            self.read_success = False            
-            return
-        
+    def __getattr__(self, name):
+        # Only called for members that are not set, i.e. the data of a lazy
+        # instance that have not been used yet
+        if name in self.lazy_fields and self._lazy:
+            self._ReadLazyData()
+            return getattr(self, name)
+        raise AttributeError(name)
 
-        with open(self.file_path, 'r') as target_file:
-            firstline = target_file.readline()
-            if '<Session>' in firstline:
-                self.file_type = self.file_types.Session
-            elif '<Trace>' in firstline:
-                self.file_type = self.file_types.Trace
-            elif '<Group>' in firstline:
-                self.file_type = self.file_types.Group
-            else:
-                print("ERROR!! Unknown file format.")
-                self.file_type = self.file_types.Unknown
-                self.read_success = False
-                return
+    def _ReadLazyData(self):
+        '''Read the data of a lazy instance, from the cache if possible.'''
+        self._lazy = False
+        self.wavelengths = None
+        self.raw_data = None
+        self.cor_data = None
+        self.diode = None
+        self.step_size = -1
 
-        self.read_success = self.ReadHeaderInfo()
-        self.WL = [0]*self.num_samples
-        if self.file_type == self.file_types.Session:
-            self.Spec = [0]*self.num_samples
-            self.SpecRaw = [0]*self.num_samples
-            self.USpecRaw = [0]*self.num_samples
-            self.ExCorr = [0]*self.num_samples #Note ExCorr here is the photodiode signal.
-            self.FileSpecCorrected = [0]*self.num_samples
-            self.UFileSpecCorrected = [0]*self.num_samples
-        elif self.file_type.value > 1:
-            self.Trace = [0]*self.num_samples
-            self.UTrace = [0]*self.num_samples
-        
-        self.ReadSpecData()
-        self.SpecCorrected = None
-        self.USpecCorrected = None
-        return
+        if self.use_cache and DataCache.load(self):
+            return
+        contents = self._ReadContents()
+        self.ReadSpecData(contents)
+        if self.use_cache and self.read_success:
+            DataCache.store(self, contents)
 
     def RegisterCorrSpec(self, CorrSpec, UCorrSpec):
         '''
@@ -95,7 +311,103 @@ class PTIData(object):
         self.USpecCorrected = UCorrSpec
         return
 
-    def ReadHeaderInfo(self):
+    def _Members(self):
+        '''{name: value} of every member that is set, without reading lazy data.'''
+        members = dict()
+        for name in _MEMBERS:
+            try:
+                members[name] = _GET_MEMBER(self, name)
+            except AttributeError:
+                pass
+        return members
+
+    def _SetBuffer(self, names, buffer):
+        '''Make the named channels the rows of buffer.'''
+        self._buffer = buffer
+        self._buffer_rows = tuple(zip(names, buffer))
+        for name, row in self._buffer_rows:
+            setattr(self, name, row)
+
+    def _Packing(self, members):
+        '''
+        (channels, packed) for the members: the (name, array) of the data
+        channels that are set and not None, and whether they are the rows
+        of members['_buffer'].
+        '''
+        channels = [(name, members[name]) for name in DataCache.CHANNELS
+                    if members.get(name) is not None]
+        rows = members.get('_buffer_rows', ())
+        packed = (len(channels) > 0 and len(rows) == len(channels) and
+                  all(name == row_name and array is row
+                      for (name, array), (row_name, row) in zip(channels, rows)))
+        return channels, packed
+
+    def pack(self):
+        '''
+        Make the data channels the rows of one contiguous float64 buffer,
+        copying them only if they are not already. Returns (channel names,
+        buffer). Raises ValueError when the channels differ in length.
+        '''
+        channels, packed = self._Packing(self._Members())
+        if not packed:
+            if len(set(numpy.shape(array) for name, array in channels)) > 1:
+                raise ValueError("Cannot pack channels of different lengths in %s" % self.file_path)
+            buffer = numpy.empty((len(channels),) + (numpy.shape(channels[0][1]) if channels else (0,)))
+            for row, (name, array) in zip(buffer, channels):
+                row[:] = array
+            self._SetBuffer([name for name, array in channels], buffer)
+        return [name for name, row in self._buffer_rows], self._buffer
+
+    def __copy__(self):
+        # Shares the arrays, like the default copy of an instance with a __dict__
+        new = PTIData.__new__(type(self))
+        for name, value in self._Members().items():
+            _SET_MEMBER(new, name, value)
+        return new
+
+    def __getstate__(self):
+        # The channels go as one buffer, or one by one if they cannot be packed
+        members = self._Members()
+        channels, packed = self._Packing(members)
+        state = dict((name, value) for name, value in members.items()
+                     if name not in _CHANNEL_MEMBERS)
+        if packed:
+            state['_buffer'] = ([name for name, array in channels], numpy.asarray(members['_buffer']))
+        elif len(set(numpy.shape(array) for name, array in channels)) == 1:
+            state['_buffer'] = ([name for name, array in channels],
+                                numpy.vstack([array for name, array in channels]))
+        else:
+            state.update(channels)
+        # Channels that are None (rather than unset, as in lazy instances)
+        state['_none_channels'] = [name for name in DataCache.CHANNELS
+                                   if name in members and members[name] is None]
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        for name in state.pop('_none_channels', ()):
+            _SET_MEMBER(self, name, None)
+        self._buffer, self._buffer_rows = None, ()
+        if '_buffer' in state:
+            self._SetBuffer(*state.pop('_buffer'))
+        for name, value in state.items():
+            _SET_MEMBER(self, name, value)
+
+    def _ReadContents(self, header_only=False):
+        '''
+        Read the raw bytes of the whole file in a single call.
+        With header_only, stop after the header lines (Group files are still
+        read to the end since their range comes from the last data line).
+        '''
+        with open(self.file_path, 'rb') as target_file:
+            if not header_only:
+                return target_file.read()
+            firstline = target_file.readline()
+            if b'<Group>' in firstline:
+                return firstline + target_file.read()
+            return firstline + b''.join([target_file.readline() for i in range(7)])
+
+    def ReadHeaderInfo(self, contents=None):
         '''
         Read the header (first 7 lines) and extract useful info.
         This is called in initialization.
@@ -106,15 +418,21 @@ class PTIData(object):
         - Excitation Wavelength range.
         - Emission Wavelength Range.
         - Run type (from run_types enum).
+
+        If the file contents have already been read they can be passed in
+        to avoid opening the file again.
         '''
+        if contents is None:
+            contents = self._ReadContents()
+
         #Read the header info to determine the run type
-        with open(self.file_path, 'r') as thefile:
-            if self.file_type == self.file_types.Session:
-                success = self._ReadHdrSession(thefile)
-            elif self.file_type == self.file_types.Trace:
-                success = self._ReadHdrTrace(thefile)
-            elif self.file_type == self.file_types.Group:
-                success = self._ReadHdrGroup(thefile)
+        thefile = io.TextIOWrapper(io.BytesIO(contents), encoding='latin-1')
+        if self.file_type == self.file_types.Session:
+            success = self._ReadHdrSession(thefile)
+        elif self.file_type == self.file_types.Trace:
+            success = self._ReadHdrTrace(thefile)
+        elif self.file_type == self.file_types.Group:
+            success = self._ReadHdrGroup(thefile)
         return success
         
     def _ReadHdrSession(self, thefile):
@@ -208,88 +526,80 @@ class PTIData(object):
             success = False
         return success
 
-    def ReadSpecData(self):
+    def ReadSpecData(self, contents=None):
         '''
         Read the data from the file.
         
-        If the file is a trace, this will read:
-        - WL (list of wavelengths)
-        - Trace (the trace - the caller is expected to know what it is)
-        If the file is a session, this will also read:
-        - Spec (the spectrum)
-        - SpecRaw (uncorrected for excitation/emission)
-        - ExCorr (the excitation correction data from the photodiode)
+        If the file is a session, this will read:
+        - wavelengths
+        - raw_data (uncorrected for excitation/emission)
+        - cor_data (the corrected spectrum, if it was recorded)
+        - diode (the excitation correction data from the photodiode)
+        If the file is a trace, this will read wavelengths and either raw_data
+        or cor_data, depending on whether the trace is labelled [COR].
+        If the file is a group (a correction table), the table is read into
+        wavelengths and raw_data.
         '''
         if self.file_type == self.file_types.Session:
-            self._ReadSessionData()
+            self._ReadSessionData(contents)
         elif self.file_type == self.file_types.Trace:
-            self._ReadTraceData()
+            self._ReadTraceData(contents)
         elif self.file_type == self.file_types.Group:
-            self._ReadGroupData()
+            self._ReadGroupData(contents)
         return
         
-    def _ReadSessionData(self):
-        NoCorr = False
-        
-        self.wavelengths = numpy.genfromtxt(self.file_path,
-                                      skip_header=8,
-                                      max_rows  = self.num_samples,
-                                      usecols = [0])
-
-        self.raw_data = numpy.genfromtxt(self.file_path,
-                                      skip_header=8,
-                                      max_rows  = self.num_samples,
-                                      usecols = [1])
-
-        self.cor_data = numpy.genfromtxt(self.file_path,
-                                      skip_header=8,
-                                      max_rows  = self.num_samples,
-                                      usecols = [3])
-        self.step_size = self.wavelengths[1] - self.wavelengths[0]
+    def _ReadSessionData(self, contents=None):
+        '''
+        Fill the data arrays from a session file in a single pass.
+
+        The first group holds the detector signals (raw and, when present,
+        corrected) and the group labelled ExCorr holds the photodiode signal.
+        The groups come from the same tokenizer as iter_groups.
+        '''
+        if contents is None:
+            contents = self._ReadContents()
 
-        excorr_header_line_num = -1
-        f = open(self.file_path, 'r')
-        for tup in enumerate(f):   
-            if 'excorr' in tup[1].lower():
-                excorr_header_line_num = tup[0] + 1
+        # (channel, values) in DataCache.CHANNELS order
+        columns = list()
+        width = 0
+        for kind, name, labels, num_samples, acquisition, region in _IterBlocks(_Tokenizer(contents)):
+            if not columns:
+                names = ['wavelengths', 'raw_data', 'cor_data'][:2 if len(num_samples) < 2 else 3]
+                values = _Columns(region, num_samples, [0, 1, 3][:len(names)])
+                width = values.shape[1]
+                columns = list(zip(names, values))
+            elif 'excorr' in ' '.join(labels).lower():
+                diode = _Columns(region, num_samples, [1])[0]
+                if diode.size == width:
+                    columns.append(('diode', diode))
+                else:
+                    self.diode = diode
                 break
-        
-        self.diode =  numpy.genfromtxt(self.file_path,
-                                      skip_header=excorr_header_line_num+1,
-                                      max_rows  = self.num_samples,
-                                      usecols = [1])
-        
 
-        f.close()
-    
-    def _ReadTraceData(self):
-        self.wavelengths = numpy.genfromtxt(self.file_path,
-                                      skip_header=4,
-                                      max_rows  = self.num_samples,
-                                      usecols = [0])        
-            
-        read_data = numpy.genfromtxt(self.file_path,
-                                      skip_header=4,
-                                      max_rows  = self.num_samples,
-                                      usecols = [1]) 
-        with open(self.file_path,'r') as thefile:
-            for i, line in enumerate(thefile):
-                if i == 2:
-                    if 'COR' in line:
-                        self.cor_data = read_data
-                    else:
-                        self.raw_data = read_data
+        buffer = numpy.empty((len(columns), width), dtype=numpy.float64)
+        for row, (name, column) in zip(buffer, columns):
+            row[:] = column
+        self._SetBuffer([name for name, column in columns], buffer)
+        self.step_size = self.wavelengths[1] - self.wavelengths[0]
 
+    def _ReadTraceData(self, contents=None):
+        if contents is None:
+            contents = self._ReadContents()
+
+        kind, name, labels, num_samples, acquisition, region = next(_IterBlocks(_Tokenizer(contents)))
+        buffer = _Columns(region, [self.num_samples])
+        # A trace holds the corrected or the raw signal, as its label says
+        self._SetBuffer(['wavelengths', 'cor_data' if 'COR' in labels[0] else 'raw_data'], buffer)
         return
 
-    def _ReadGroupData(self):
-        with open(self.file_path, 'r') as thefile:
-            for i, line in enumerate(thefile):
-                if i > 5 and i < (6 + self.num_samples):
-                    wrds = line.split()
-                    self.WL[i-6] = float(wrds[0])
-                    self.Trace[i-6] = float(wrds[1])
-                    self.UTrace[i-6] = abs(float(wrds[1]))**(0.5)
+    def _ReadGroupData(self, contents=None):
+        if contents is None:
+            contents = self._ReadContents()
+
+        kind, name, labels, num_samples, acquisition, region = next(_IterBlocks(_Tokenizer(contents)))
+        buffer = _Columns(region, [self.num_samples] * len(num_samples), [0, 1])
+        self._SetBuffer(['wavelengths', 'raw_data'], buffer)
+        self.step_size = self.wavelengths[1] - self.wavelengths[0]
         return
 
     def get_date(self, space="     "):
@@ -338,3 +648,10 @@ class PTIData(object):
         return new
             
         
+
+
+# Every member of PTIData, and those the pickled state replaces by the buffer
+_MEMBERS = tuple(name for name in PTIData.__slots__ if name != '__weakref__')
+_CHANNEL_MEMBERS = frozenset(DataCache.CHANNELS + ['_buffer', '_buffer_rows'])
+_GET_MEMBER = object.__getattribute__
+_SET_MEMBER = object.__setattr__
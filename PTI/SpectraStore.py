@@ -0,0 +1,242 @@
+'''
+A columnar store of parsed PTI data files.
+
+Every spectrum under one or more directories is parsed once and appended to
+a single raw little-endian float64 file per channel (wavelengths, raw_data,
+cor_data, diode); index.json records each spectrum's path, its offset and
+length in the channel files, which channels it has, and its header fields.
+Reading a spectrum back is a slice of the memory mapped channels, so the
+arrays of the returned PTIData objects share memory with the store:
+
+    python -m PTI.SpectraStore spectra_store Henry Noah "QY Data"
+
+    from PTI.SpectraStore import SpectraStore
+
+    store = SpectraStore("spectra_store")
+    data = store["Henry/Sphere/PPO_0x31/EmissionScan_PPO_0x31_ex310_2016-08-04.txt"]
+    paths = store.select(run_type='Emission', path_contains='Sphere')
+    spectra = store.stack(paths, 'cor_data')      # (len(paths) x samples)
+
+Channels a file does not have (e.g. cor_data of a single trace session) are
+stored as NaN and come back as None. The channels are mapped copy-on-write,
+so modifying the arrays of a PTIData object never changes the store.
+'''
+import argparse
+import json
+import os
+import numpy
+
+from PTI import DataCache
+from PTI.Loader import find_data_files, iter_load
+from PTI.ReadDataFiles import PTIData
+
+STORE_VERSION = 1
+INDEX_NAME = 'index.json'
+
+
+def _channel_path(store_dir, name):
+    return os.path.join(store_dir, name + '.f64')
+
+
+def ingest(roots, store_dir, processes=None):
+    '''
+    Parse every data file under roots (directories, glob patterns or file
+    paths) and write them to a new store in store_dir, replacing any store
+    already there. Returns the list of (path, error message) failures, each
+    of which is also printed.
+    '''
+    if isinstance(roots, (str, type(u''))):
+        roots = [roots]
+    paths = list()
+    for root in roots:
+        found = find_data_files(root) if not os.path.isfile(root) else [root]
+        paths += [os.path.normpath(path) for path in found]
+    # A file reached through two roots is only stored once
+    seen = set()
+    paths = [path for path in paths if not (path in seen or seen.add(path))]
+
+    DataCache._make_dirs(store_dir)
+    tmp_suffix = '.%d.tmp' % os.getpid()
+    channel_files = [open(_channel_path(store_dir, name) + tmp_suffix, 'wb')
+                     for name in DataCache.CHANNELS]
+
+    records = list()
+    failures = list()
+    offset = 0
+    try:
+        for path, data, error in iter_load(paths, processes):
+            if data is not None:
+                arrays = [getattr(data, name) for name in DataCache.CHANNELS]
+                if any(array is not None and array.size != data.num_samples for array in arrays):
+                    data, error = None, "channel lengths do not match the number of samples"
+            if data is None:
+                print("ERROR!! Could not store %s (%s)" % (path, error))
+                failures.append((path, error))
+                continue
+
+            empty = numpy.full(data.num_samples, numpy.nan, dtype=DataCache.DTYPE)
+            for thefile, array in zip(channel_files, arrays):
+                (empty if array is None else numpy.asarray(array, dtype=DataCache.DTYPE)).tofile(thefile)
+
+            record = {'path': path,
+                      'offset': offset,
+                      'channels': [name for name, array in zip(DataCache.CHANNELS, arrays)
+                                   if array is not None]}
+            record.update(DataCache.header_to_dict(data))
+            records.append(record)
+            offset += data.num_samples
+    finally:
+        for thefile in channel_files:
+            thefile.close()
+
+    for name in DataCache.CHANNELS:
+        DataCache.replace_file(_channel_path(store_dir, name) + tmp_suffix, _channel_path(store_dir, name))
+    # The index goes last; it is what makes the new channel files visible
+    index = {'version': STORE_VERSION,
+             'channels': DataCache.CHANNELS,
+             'total_samples': offset,
+             'spectra': records}
+    DataCache._write_json(os.path.join(store_dir, INDEX_NAME), index)
+    return failures
+
+
+class SpectraStore(object):
+    '''Read access to a store written by ingest().'''
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, INDEX_NAME), 'r') as thefile:
+            index = json.load(thefile)
+        if index.get('version') != STORE_VERSION:
+            raise ValueError("%s was written by a different version of SpectraStore; "
+                             "ingest the data again" % store_dir)
+
+        self.records = index['spectra']
+        self.paths = [record['path'] for record in self.records]
+        self._positions = dict((path, i) for i, path in enumerate(self.paths))
+        self.offsets = numpy.array([record['offset'] for record in self.records], dtype=int)
+        self.num_samples = numpy.array([record['num_samples'] for record in self.records], dtype=int)
+
+        self.channels = dict()
+        for name in index['channels']:
+            if index['total_samples'] == 0:
+                self.channels[name] = numpy.empty(0, dtype=DataCache.DTYPE)
+            else:
+                self.channels[name] = numpy.memmap(_channel_path(store_dir, name),
+                                                   dtype=DataCache.DTYPE, mode='c',
+                                                   shape=(index['total_samples'],))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, path):
+        return os.path.normpath(path) in self._positions
+
+    def position(self, key):
+        '''Position in the store of a spectrum given by position or file path.'''
+        if isinstance(key, (str, type(u''))):
+            try:
+                return self._positions[os.path.normpath(key)]
+            except KeyError:
+                raise KeyError("%s is not in the store %s" % (key, self.store_dir))
+        return range(len(self.records))[key]
+
+    def __getitem__(self, key):
+        '''A PTIData object whose arrays are views into the store.'''
+        i = self.position(key)
+        record = self.records[i]
+        start = self.offsets[i]
+        stop = start + self.num_samples[i]
+
+        data = PTIData.__new__(PTIData)
+        data._InitMembers()
+        data.file_path = record['path']
+        DataCache.header_from_dict(data, record)
+        for name in record['channels']:
+            setattr(data, name, self.channels[name][start:stop])
+        data.read_success = True
+        return data
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def load(self, paths):
+        '''
+        Same return value as PTI.Loader.load, with the spectra taken from the
+        store: (list_of_data with None for missing files, failures).
+        '''
+        list_of_data = list()
+        failures = list()
+        for path in paths:
+            if path in self:
+                list_of_data.append(self[path])
+            else:
+                error = "not in the store %s" % self.store_dir
+                print("ERROR!! Could not load %s (%s)" % (path, error))
+                list_of_data.append(None)
+                failures.append((path, error))
+        return list_of_data, failures
+
+    def select(self, run_type=None, file_type=None, pmt_mode=None,
+               ex_wavelength=None, em_wavelength=None, path_contains=None):
+        '''
+        Paths of the stored spectra matching every given filter; the filters
+        are those of PTI.ArchiveIndex.ArchiveIndex.query.
+        '''
+        selected = list()
+        for record in self.records:
+            if run_type is not None and record['RunType'] != run_type:
+                continue
+            if file_type is not None and record['file_type'] != file_type:
+                continue
+            if pmt_mode is not None and record['PMT_mode'] != pmt_mode:
+                continue
+            if path_contains is not None and path_contains not in record['path']:
+                continue
+            wavelength_ok = True
+            for value, scan_range in [(ex_wavelength, record['ex_range']),
+                                      (em_wavelength, record['em_range'])]:
+                scan_range = [val for val in scan_range if val >= 0]
+                if value is not None and not (scan_range and
+                                              min(scan_range) <= value <= max(scan_range)):
+                    wavelength_ok = False
+            if wavelength_ok:
+                selected.append(record['path'])
+        return selected
+
+    def stack(self, keys, channel='cor_data'):
+        '''
+        One channel of several spectra as a (len(keys) x samples) array.
+        The spectra must all have the same number of samples. A run of
+        spectra stored back to back is returned as a view of the store;
+        anything else is gathered into a new array.
+        '''
+        positions = numpy.array([self.position(key) for key in keys], dtype=int)
+        if positions.size == 0:
+            return numpy.empty((0, 0), dtype=DataCache.DTYPE)
+        lengths = set(self.num_samples[positions])
+        if len(lengths) != 1:
+            raise ValueError("Cannot stack spectra with different numbers of samples: %s"
+                             % sorted(lengths))
+        width = lengths.pop()
+        offsets = self.offsets[positions]
+
+        values = self.channels[channel]
+        if numpy.all(numpy.diff(offsets) == width):
+            return values[offsets[0]:offsets[0] + width * len(offsets)].reshape(len(offsets), width)
+        return values[offsets[:, None] + numpy.arange(width)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingest PTI data files into a columnar store.")
+    parser.add_argument('store_dir', help="directory to write the store to")
+    parser.add_argument('roots', nargs='+', help="directories, glob patterns or files to ingest")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="number of parsing processes (default: one per core)")
+    args = parser.parse_args()
+
+    failures = ingest(args.roots, args.store_dir, args.processes)
+    store = SpectraStore(args.store_dir)
+    print("Stored %d spectra (%d samples) in %s; %d files failed"
+          % (len(store), store.offsets[-1] + store.num_samples[-1] if len(store) else 0,
+             args.store_dir, len(failures)))
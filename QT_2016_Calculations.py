@@ -1,13 +1,10 @@
 itimport copy
-import matplotlib.pyplot as plt
 import numpy as np
-import scipy as sp
-import statsmodels.api as sm
 
 
 import PTI.Corrections as PTICorr
-from PTI.ReadDataFiles import PTIData
 import PTI.QuantumYield as PTIQY
+import PTI.Loader as PTILoad
 
 # <editor-fold desc="Importing">
 # The file paths for the blank LAB measurements
@@ -40,22 +37,12 @@ PPO_3x14_paths = ["Henry/Sphere/PPO_ETOH/EmissionScan_3x14gperL_PPOinETOH_ex310_
                   "Henry/Sphere/PPO_ETOH/EmissionScan_3x14gperL_PPOinETOH_ex330_2sec_160831.txt",
                   "Henry/Sphere/PPO_ETOH/EmissionScan_3x14gperL_PPOinETOH_ex340_2sec_160831.txt"]
 
-'''Requires: A list of file paths for PTI data files
-   Effect:   Takes each path and uses it to read into a PTIData instance
-   Returns:  A list of PTIData instances. Each element comes from the corresponding
-             path in the list argument.'''
-def convert_paths_to_PTIData_objs(list_of_paths):
-    list_of_PTIData = list()
-    for path in list_of_paths:
-        list_of_PTIData.append(PTIData(path))
-    return list_of_PTIData
-
-LAB = convert_paths_to_PTIData_objs(LAB_paths)
-bisMSB_4x47 = convert_paths_to_PTIData_objs(bisMSB_4x47_paths)
-
-ETOH = convert_paths_to_PTIData_objs(EtOH_paths)
-PPO_0x31 = convert_paths_to_PTIData_objs(PPO_0x31_paths)
-PPO_3x14 = convert_paths_to_PTIData_objs(PPO_3x14_paths)
+LAB = PTILoad.load(LAB_paths)[0]
+bisMSB_4x47 = PTILoad.load(bisMSB_4x47_paths)[0]
+
+ETOH = PTILoad.load(EtOH_paths)[0]
+PPO_0x31 = PTILoad.load(PPO_0x31_paths)[0]
+PPO_3x14 = PTILoad.load(PPO_3x14_paths)[0]
 # </editor-fold>
 
 def QY_analysis(ex_LUT_split, em_LUT_split,
@@ -0,0 +1,159 @@
+'''
+Regression checks for bugs fixed in the PTI package, on synthetic files
+(see synthetic.py), so they run without the data directories. Each check
+is a function registered with @check that raises AssertionError when the
+bug is back.
+
+Run from the repository root:
+    python benchmarks/checks.py
+Exits with status 1 when a check fails.
+'''
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+
+import numpy
+
+import common
+import synthetic
+import PTI.BaselineFitting as PTIBase
+import PTI.CorrectionLUTs as PTILUT
+import PTI.Corrections as PTICorr
+import PTI.QuantumYield as PTIQY
+import PTI.QYGrid as PTIGrid
+from PTI.ReadDataFiles import PTIData
+
+CHECKS = list()
+
+
+def check(function):
+    CHECKS.append(function)
+    return function
+
+
+def _baseline_fit_ranges(data):
+    return [[data.wavelengths[0], data.ex_range[0] - 5], [450, 600]]
+
+
+@check
+def inplace_decorrection_refits_offsets(directory):
+    '''shift_LUT=True after an inplace correction from the decorrected data fits the new raw data.'''
+    paths = synthetic.write_dataset(directory)
+    data = PTIData(paths['blank'][0])
+    before = PTICorr.monochromator_shifts(data, True)
+    PTICorr.correct_raw_to_cor(data, use_decorrected_as_raw=True, inplace=True,
+                               baseline_fit_ranges=_baseline_fit_ranges(data))
+    after = PTICorr.monochromator_shifts(data, True)
+    # A copy has no cached fits
+    expected = PTICorr.monochromator_shifts(copy.copy(data), True)
+    assert after != before, "the decorrected data have the offsets %s of the raw data" % (before,)
+    assert after == expected, "stale offsets %s, fitted %s" % (after, expected)
+
+
+@check
+def QY_grid_matches_corrections(directory):
+    '''QYGrid.QY_grid gives the QYs of correct_raw_to_cor and pair_quantum_yields exactly.'''
+    paths = synthetic.write_dataset(directory)
+    blanks = [PTIData(path) for path in paths['blank']]
+    fluors = [PTIData(path) for path in paths['fluor']]
+    grid = [('correction_region_start', [360, 366]),
+            ('shift_LUT', [False, True]),
+            ('use_baseline_se', [('none', 'none'), ('plus', 'minus')]),
+            (('ex_LUT_interpolation', 'em_LUT_interpolation'), [('linear', 'cubic'), ('cubic', 'quadratic')]),
+            (('ex_LUT_split', 'em_LUT_split'), [('none', 'odd'), ('even', 'none')]),
+            ('const_diode', [False, True])]
+    combinations, QYs = PTIGrid.QY_grid(blanks, fluors, grid,
+                                        baseline_fit_ranges=[_baseline_fit_ranges(data) for data in blanks],
+                                        ex_delta=5, em_int_range=[330, 450], ex_shift=0.8, em_shift=0.6)
+    for options, grid_QYs in zip(combinations, QYs):
+        options = dict(options)
+        start = options.pop('correction_region_start')
+        corrected = [[PTICorr.correct_raw_to_cor(data, baseline_fit_ranges=_baseline_fit_ranges(data),
+                                                 ex_shift=0.8, em_shift=0.6, **options)
+                      for data in datas] for datas in (blanks, fluors)]
+        expected = PTIQY.pair_quantum_yields(corrected[0], corrected[1], 5, [330, 450],
+                                             [start, 450])['corrected_QY']
+        assert list(grid_QYs) == list(expected), "%s: %s != %s" % (options, grid_QYs, expected)
+
+
+@check
+def baseline_fits_on_a_non_binary_step(directory):
+    '''The baseline fits take x from the spectrum's wavelengths for a 0.1 nm step and a range past its start.'''
+    paths = synthetic.write_dataset(directory, num_samples=2001, step=0.1, em_start=290)
+    data = PTIData(paths['blank'][0])
+    ranges = [[285, data.ex_range[0] - 5], [340, 360]]
+    selected = numpy.zeros(data.wavelengths.size, dtype=bool)
+    for start, end in ranges:
+        selected |= (data.wavelengths >= start) & (data.wavelengths <= end)
+    expected = numpy.polyfit(data.wavelengths[selected], data.raw_data[selected], 1)
+    params, _ = PTICorr.linear_baseline_params(data, ranges)
+    assert numpy.allclose(params[::-1], expected), "linear: %s != %s" % (params[::-1], expected)
+    params = PTIBase.polynomial_baseline_params(data, 1, ranges)
+    assert numpy.allclose(params, expected), "polynomial: %s != %s" % (params, expected)
+
+
+@check
+def emcorr_on_the_spectrum_grid(directory):
+    '''load_emcorr_file gives one value per wavelength for a 0.1 nm step and a grid starting before the LUT.'''
+    paths = synthetic.write_dataset(directory, num_samples=2001, step=0.1, em_start=290)
+    data = PTIData(paths['blank'][0])
+    for FS, table_name in [(False, 'emcorr-sphere-quanta'), (True, 'emcorri')]:
+        emcorr_wavelengths, _ = PTILUT.table(table_name, 'none')
+        # Outside the LUT the first/last value is held
+        x = numpy.clip(data.wavelengths, emcorr_wavelengths[0], emcorr_wavelengths[-1])
+        expected = PTILUT.interpolator(table_name, 'cubic', 'none')(x)
+        emcorr = PTICorr.load_emcorr_file(data, FS=FS)
+        assert emcorr.shape == data.wavelengths.shape, "FS=%s: %s values for %s wavelengths" % (
+            FS, emcorr.size, data.wavelengths.size)
+        assert numpy.allclose(emcorr, expected), "FS=%s: emcorr differs from the LUT" % FS
+
+
+@check
+def cumulative_integral_matches_simps(directory):
+    '''CumulativeIntegral equals integrate_between over windows of 1, 2 and odd and even numbers of points.'''
+    paths = synthetic.write_dataset(directory)
+    blank, fluor = [PTICorr.correct_raw_to_cor(data, baseline_fit_ranges=_baseline_fit_ranges(data))
+                    for data in [PTIData(paths['blank'][0]), PTIData(paths['fluor'][0])]]
+    integral = PTIQY.CumulativeIntegral(fluor, blank)
+    wavelengths = blank.wavelengths
+    windows = [(wavelengths[first], wavelengths[first + num_points - 1])
+               for num_points in [1, 2, 3, 4, 5, 6, 41, 42]
+               for first in [0, 17, wavelengths.size - num_points]]
+    lower, upper = numpy.array(windows).T
+    expected = numpy.array([PTIQY.integrate_between(fluor, blank, window) for window in windows])
+    tolerance = 1e-12 * numpy.max(abs(expected))
+    for i, (single, batch) in enumerate(zip([integral(*window) for window in windows],
+                                            integral(lower, upper))):
+        assert abs(single - expected[i]) <= tolerance and abs(batch - expected[i]) <= tolerance, \
+            "%s rule, window %s: %s and %s != %s" % (PTIQY._simps_even_rule(), windows[i],
+                                                      single, batch, expected[i])
+
+
+def run():
+    '''Run every check; returns the names of those that failed.'''
+    failures = list()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        with common.private_cache():
+            for function in CHECKS:
+                directory = os.path.join(tmp_dir, function.__name__)
+                os.makedirs(directory)
+                PTICorr.clear_stage_cache()
+                try:
+                    function(directory)
+                except Exception:
+                    print("ERROR!! %s failed:\n%s" % (function.__name__, traceback.format_exc()))
+                    failures.append(function.__name__)
+                else:
+                    print("ok      %s" % function.__name__)
+    finally:
+        shutil.rmtree(tmp_dir)
+    return failures
+
+
+if __name__ == '__main__':
+    if run():
+        sys.exit(1)
@@ -0,0 +1,115 @@
+'''
+Setup shared by the benchmark scripts: the repository on sys.path, the 2016
+sphere scans most of them time, timers and a data cache of their own.
+Import it before the PTI modules:
+
+    import common
+    import PTI.Corrections as PTICorr
+
+    with common.private_cache():
+        datas = [PTIData(path) for path in common.sphere_paths()]
+        seconds, result = common.timed(function, (datas,), repeats=5)
+
+Inside private_cache PTIData parses the text files (so parsing is timed
+rather than hits in the data cache), and whatever is cached goes to a
+temporary directory, never to the user's cache.
+'''
+import contextlib
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARKS_DIR)
+if REPOSITORY_DIR not in sys.path:
+    sys.path.insert(0, REPOSITORY_DIR)
+import PTI.DataCache as DataCache
+from PTI.ReadDataFiles import PTIData
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+SPHERE_ROOT = "Henry/Sphere"
+SPHERE_GLOB = SPHERE_ROOT + "/*/EmissionScan_*.txt"
+
+# The ethanol blanks and 0.31 mg/L PPO scans of the 2016 QY analysis
+EX_WAVELENGTHS = [310, 320, 330, 340]
+ETOH_BLANK = "Henry/Sphere/PPO_ETOH/EmissionScan_ETOH_ex%d_2sec_160830.txt"
+PPO_0x31 = "Henry/Sphere/PPO_ETOH/EmissionScan_0x31gperL_PPOinETOH_ex%d_2sec_160831.txt"
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def sphere_paths():
+    return sorted(glob.glob(SPHERE_GLOB))
+
+
+def sphere_emission_scans():
+    '''The sphere scans that read and whose range holds the second order of the excitation peak.'''
+    datas = list()
+    for path in sphere_paths():
+        data = PTIData(path)
+        if data.read_success and 2 * data.ex_range[0] < data.em_range[1]:
+            datas.append(data)
+    return datas
+
+
+def baseline_fit_ranges(ex_wavelength):
+    '''The baseline ranges of the 2016 QY analysis.'''
+    return [[300, ex_wavelength - 5], [450, 600]]
+
+
+@contextlib.contextmanager
+def private_cache(use_cache=False):
+    '''
+    PTIData.use_cache set to use_cache and DataCache.cache_dir to a new
+    temporary directory (yielded), both restored and the directory removed
+    on exit.
+    '''
+    cache_dir, DataCache.cache_dir = DataCache.cache_dir, tempfile.mkdtemp(prefix='PTI_cache_')
+    saved_use_cache, PTIData.use_cache = PTIData.use_cache, use_cache
+    try:
+        yield DataCache.cache_dir
+    finally:
+        # The cached channels may still be mapped; on Windows they cannot be removed
+        shutil.rmtree(DataCache.cache_dir, ignore_errors=True)
+        DataCache.cache_dir = cache_dir
+        PTIData.use_cache = saved_use_cache
+
+
+def timed(function, args=(), repeats=1):
+    '''(seconds per call, result of the last call) of function(*args) called repeats times.'''
+    start = clock()
+    for i in range(repeats):
+        result = function(*args)
+    return (clock() - start) / repeats, result
+
+
+def time_per_call(function, items, repeats=1):
+    '''Seconds per call of function(item) over the items, repeats times.'''
+    start = clock()
+    for i in range(repeats):
+        for item in items:
+            function(item)
+    return (clock() - start) / (repeats * len(items))
+
+
+def traced(function):
+    '''
+    (result, seconds, peak bytes allocated) of function(); the peak is nan
+    without tracemalloc (Python 2).
+    '''
+    if tracemalloc:
+        tracemalloc.start()
+    start = clock()
+    result = function()
+    elapsed = clock() - start
+    peak = tracemalloc.get_traced_memory()[1] if tracemalloc else float('nan')
+    if tracemalloc:
+        tracemalloc.stop()
+    return result, elapsed, peak
@@ -0,0 +1,32 @@
+'''
+Time per get_corrections call with the correction tables and interpolators
+held by PTI.CorrectionLUTs, compared with reading and interpolating the
+tables again on every call (the registry invalidated before each call).
+
+Run from the repository root:
+    python benchmarks/correction_luts.py
+'''
+import common
+import PTI.CorrectionLUTs as PTILUT
+import PTI.Corrections as PTICorr
+from PTI.ReadDataFiles import PTIData
+
+REPEATS = 5
+
+
+def reread_tables(data):
+    PTILUT.invalidate()
+    PTICorr.get_corrections(data)
+
+
+if __name__ == '__main__':
+    with common.private_cache():
+        datas = [PTIData(path) for path in common.sphere_paths()]
+
+    uncached = common.time_per_call(reread_tables, datas, REPEATS)
+    cached = common.time_per_call(PTICorr.get_corrections, datas, REPEATS)
+
+    print("%d session files, %d repeats" % (len(datas), REPEATS))
+    print("tables re-read each call: %.3f ms/call" % (uncached * 1e3))
+    print("registry:                 %.3f ms/call" % (cached * 1e3))
+    print("speedup:                  %.1fx" % (uncached / cached))
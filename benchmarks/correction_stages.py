@@ -0,0 +1,44 @@
+'''
+Time for a sweep of correct_raw_to_cor over the options varied by the 2016
+QY analyses, with the per-stage cache of PTI.Corrections compared with
+recomputing every stage (the cache cleared before each call).
+
+Run from the repository root:
+    python benchmarks/correction_stages.py
+'''
+import itertools
+
+import common
+import PTI.Corrections as PTICorr
+from PTI.ReadDataFiles import PTIData
+
+OPTIONS = list(itertools.product([False, True],                              # shift_LUT
+                                 [('none', 'none'), ('plus', 'minus')],      # use_baseline_se
+                                 ['linear', 'cubic'],                        # LUT interpolation
+                                 ['none', 'even', 'odd'],                    # LUT split
+                                 [False, True]))                             # const_diode
+
+
+def sweep(datas, clear):
+    for shift_LUT, use_baseline_se, interpolation, split, const_diode in OPTIONS:
+        for ex_wavelength, data in zip(common.EX_WAVELENGTHS, datas):
+            if clear:
+                PTICorr.clear_stage_cache()
+            PTICorr.correct_raw_to_cor(data, baseline_fit_ranges=common.baseline_fit_ranges(ex_wavelength),
+                                       use_baseline_se=use_baseline_se,
+                                       ex_LUT_interpolation=interpolation, em_LUT_interpolation=interpolation,
+                                       ex_LUT_split=split, em_LUT_split=split,
+                                       shift_LUT=shift_LUT, const_diode=const_diode)
+
+
+if __name__ == '__main__':
+    with common.private_cache():
+        datas = [PTIData(common.ETOH_BLANK % wl) for wl in common.EX_WAVELENGTHS]
+
+    uncached = common.timed(sweep, (datas, True))[0]
+    cached = common.timed(sweep, (datas, False))[0]
+
+    print("%d corrections" % (len(OPTIONS) * len(datas)))
+    print("every stage recomputed: %.3f s" % uncached)
+    print("stage cache:            %.3f s" % cached)
+    print("speedup:                %.1fx" % (uncached / cached))
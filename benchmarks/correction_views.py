@@ -0,0 +1,43 @@
+'''
+Time and memory of correct_raw_to_cor results held as copy.deepcopy copies
+of the spectrum (as before) and as result views sharing the spectrum's
+arrays, for a sweep of corrections of the 2016 ETOH blanks.
+
+Run from the repository root (the memory figures need Python 3):
+    python benchmarks/correction_views.py
+'''
+import copy
+import gc
+
+import common
+import PTI.Corrections as PTICorr
+from PTI.ReadDataFiles import PTIData
+
+OPTIONS = [(se, split) for se in [('none', 'none'), ('plus', 'minus'), ('minus', 'plus')]
+           for split in ['none', 'even', 'odd']] * 10
+
+
+def sweep(datas, deep_copies):
+    results = list()
+    for use_baseline_se, split in OPTIONS:
+        for ex_wavelength, data in zip(common.EX_WAVELENGTHS, datas):
+            result = PTICorr.correct_raw_to_cor(data,
+                                                baseline_fit_ranges=common.baseline_fit_ranges(ex_wavelength),
+                                                use_baseline_se=use_baseline_se,
+                                                ex_LUT_split=split, em_LUT_split=split)
+            if deep_copies:
+                # What every correction used to return
+                result = copy.deepcopy(result)
+            results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    with common.private_cache():
+        datas = [PTIData(common.ETOH_BLANK % wl) for wl in common.EX_WAVELENGTHS]
+    sweep(datas, False)     # fill the stage cache, so only the results are compared
+
+    for label, deep_copies in [('deep copies', True), ('result views', False)]:
+        gc.collect()
+        results, elapsed, peak = common.traced(lambda: sweep(datas, deep_copies))
+        print("%-12s %d results: %.3f s, peak %.1f MB" % (label, len(results), elapsed, peak / 1e6))
@@ -0,0 +1,27 @@
+'''
+Cold and warm load times for PTIData with the on-disk cache (PTI.DataCache),
+compared with parsing the text files directly.
+
+Run from the repository root:
+    python benchmarks/data_cache.py
+The cache is written to a temporary directory, not the user's cache.
+'''
+import common
+from PTI.ReadDataFiles import PTIData
+
+REPEATS = 20
+
+
+if __name__ == '__main__':
+    paths = common.sphere_paths()
+
+    with common.private_cache():
+        uncached = common.time_per_call(PTIData, paths, REPEATS)
+    with common.private_cache(use_cache=True):
+        cold = common.time_per_call(PTIData, paths)
+        warm = common.time_per_call(PTIData, paths, REPEATS)
+
+    print("%d session files" % len(paths))
+    print("no cache:           %.3f ms/file" % (uncached * 1e3))
+    print("cold (parse+store): %.3f ms/file" % (cold * 1e3))
+    print("warm (mmap):        %.3f ms/file" % (warm * 1e3))
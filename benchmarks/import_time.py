@@ -0,0 +1,71 @@
+'''
+Cold import time of the PTI modules, each in a fresh interpreter, checked
+against IMPORT_BUDGETS_MS. With Python 3.7 or later the time is the
+cumulative figure of python -X importtime (and the slowest imports under
+the module are listed); otherwise it is the wall time of the interpreter
+less that of an empty one.
+
+Run from the repository root:
+    python benchmarks/import_time.py
+Exits with status 1 when a module is over its budget.
+'''
+import subprocess
+import sys
+
+import common
+
+REPEATS = 5
+SLOWEST_SHOWN = 5
+
+# Modules imported by the analysis scripts and pool workers, and their budgets
+IMPORT_BUDGETS_MS = [('PTI.ReadDataFiles', 150),
+                     ('PTI.Loader', 150),
+                     ('PTI.Corrections', 200),
+                     ('PTI.QuantumYield', 200),
+                     ('PTI.ParameterSweep', 150),
+                     ('PTI.QYMonteCarlo', 200)]
+
+
+def importtime(module):
+    '''{imported module: (cumulative microseconds, nesting depth)} from python -X importtime.'''
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                               cwd=common.REPOSITORY_DIR, stderr=subprocess.PIPE)
+    report = process.communicate()[1].decode('utf-8')
+    times = dict()
+    for line in report.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            name = fields[2].rstrip()
+            times[name.strip()] = (int(fields[1]), (len(name) - len(name.lstrip()) - 1) // 2)
+    return times
+
+
+def wall_time(code):
+    return common.timed(lambda: subprocess.check_call([sys.executable, '-c', code], cwd=common.REPOSITORY_DIR))[0]
+
+
+if __name__ == '__main__':
+    use_importtime = sys.version_info >= (3, 7)
+    over_budget = list()
+    for module, budget in IMPORT_BUDGETS_MS:
+        if use_importtime:
+            runs = [importtime(module) for i in range(REPEATS)]
+            milliseconds = min(run[module][0] for run in runs) / 1e3
+            # The imports made by the module itself (the rest is nested in them)
+            slowest = sorted(((time_us, name) for name, (time_us, depth) in runs[-1].items()
+                              if depth == 1), reverse=True)
+        else:
+            empty = min(wall_time('pass') for i in range(REPEATS))
+            milliseconds = 1e3 * (min(wall_time('import ' + module) for i in range(REPEATS)) - empty)
+            slowest = list()
+
+        verdict = 'ok' if milliseconds <= budget else 'OVER BUDGET'
+        print("%-22s %7.1f ms (budget %d ms) %s" % (module, milliseconds, budget, verdict))
+        for time_us, name in slowest[:SLOWEST_SHOWN]:
+            print("    %-40s %7.1f ms" % (name, time_us / 1e3))
+        if milliseconds > budget:
+            over_budget.append(module)
+
+    if over_budget:
+        print("ERROR!! Over the import-time budget: %s" % ', '.join(over_budget))
+        sys.exit(1)
@@ -0,0 +1,33 @@
+'''
+Time for the monochromator offsets of the 2016 sphere emission scans in a
+fresh process: fitted to each spectrum's peaks (shift_LUT=True) compared
+with looked up in the calibration table (shift_LUT='calibration'), and the
+offsets both give.
+
+Run from the repository root:
+    python benchmarks/monochromator_calibration.py
+'''
+import os
+import numpy
+
+import common
+import PTI.MonochromatorCalibration as PTICal
+import PTI.PeakFitting as PTIPeaks
+
+
+if __name__ == '__main__':
+    with common.private_cache():
+        datas = common.sphere_emission_scans()
+
+    fit_time, fitted = common.timed(PTIPeaks.monochromator_offsets, (datas,))
+    fitted = numpy.column_stack(fitted)
+    lookup_time, table = common.timed(lambda: numpy.array([PTICal.offsets_at(data.acq_start, data.ex_range[0])
+                                                           for data in datas]))
+
+    print("%d spectra" % len(datas))
+    print("fitted:     %.2f ms" % (1e3 * fit_time))
+    print("table:      %.2f ms (first lookup reads the table)" % (1e3 * lookup_time))
+    print("%-68s %17s %17s" % ('', 'fitted ex / em', 'table ex / em'))
+    for data, (fit_ex, fit_em), (table_ex, table_em) in zip(datas, fitted, table):
+        print("%-68s %8.3f %8.3f %8.3f %8.3f" % (os.path.basename(data.file_path),
+                                                 fit_ex, fit_em, table_ex, table_em))
@@ -0,0 +1,48 @@
+'''
+Compares the single-pass session parser in PTIData against the previous
+genfromtxt-based reader on the 2016 integrating sphere scans.
+
+Run from the repository root:
+    python benchmarks/parse_sessions.py
+'''
+import numpy
+
+import common
+from PTI.ReadDataFiles import PTIData
+
+REPEATS = 20
+
+
+def genfromtxt_session(path):
+    '''The previous reader: a header scan followed by four genfromtxt passes.'''
+    with open(path, 'r') as thefile:
+        for i, line in enumerate(thefile):
+            if i == 5:
+                num_samples = int(line.split()[0])
+                break
+
+    columns = [numpy.genfromtxt(path, skip_header=8, max_rows=num_samples, usecols=[col])
+               for col in [0, 1, 3]]
+
+    excorr_header_line_num = -1
+    with open(path, 'r') as thefile:
+        for i, line in enumerate(thefile):
+            if 'excorr' in line.lower():
+                excorr_header_line_num = i + 1
+                break
+    diode = numpy.genfromtxt(path, skip_header=excorr_header_line_num + 1,
+                             max_rows=num_samples, usecols=[1])
+    return columns + [diode]
+
+
+if __name__ == '__main__':
+    paths = common.sphere_paths()
+
+    with common.private_cache():
+        old = common.time_per_call(genfromtxt_session, paths, REPEATS)
+        new = common.time_per_call(PTIData, paths, REPEATS)
+
+    print("%d session files, %d repeats" % (len(paths), REPEATS))
+    print("genfromtxt reader:  %.3f ms/file" % (old * 1e3))
+    print("single-pass reader: %.3f ms/file" % (new * 1e3))
+    print("speedup:            %.1fx" % (old / new))
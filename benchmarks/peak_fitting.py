@@ -0,0 +1,61 @@
+'''
+Time for the monochromator offsets of the 2016 sphere emission scans: the
+five curve_fit Gaussian fits per spectrum the offsets used to take,
+compared with one batch of PTI.PeakFitting (two fits per spectrum, all
+spectra iterated together).
+
+Run from the repository root:
+    python benchmarks/peak_fitting.py
+'''
+import warnings
+import numpy
+
+import common
+import PTI.Corrections as PTICorr
+import PTI.PeakFitting as PTIPeaks
+
+DX_AROUND_PEAK = 5
+
+
+def curve_fit_peak(data, centre):
+    peak_range = numpy.where((data.wavelengths >= centre - DX_AROUND_PEAK) &
+                             (data.wavelengths <= centre + DX_AROUND_PEAK))
+    y_data = data.raw_data[peak_range]
+    guess = (numpy.max(y_data), centre, 2 * DX_AROUND_PEAK / 2.35482, 0)
+    return PTICorr.gaussian_fit(data.wavelengths[peak_range], y_data, guess)[0][1]
+
+
+def curve_fit_offsets(data):
+    '''As get_excitation_monochromator_offset and get_emission_monochromator_shift did.'''
+    peak_wavelength = data.wavelengths[numpy.argmax(data.raw_data)]
+    true_excitation = [curve_fit_peak(data, 2 * peak_wavelength) - curve_fit_peak(data, peak_wavelength)
+                       for i in range(2)]
+    return (true_excitation[0] - data.ex_range[0],
+            true_excitation[1] - curve_fit_peak(data, peak_wavelength))
+
+
+def curve_fit_all(datas):
+    offsets = list()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for data in datas:
+            try:
+                offsets.append(curve_fit_offsets(data))
+            except RuntimeError:
+                offsets.append((numpy.nan, numpy.nan))
+    return offsets
+
+
+if __name__ == '__main__':
+    with common.private_cache():
+        datas = common.sphere_emission_scans()
+
+    curve_fit_time, old = common.timed(curve_fit_all, (datas,))
+    batch_time, (ex_offsets, em_shifts) = common.timed(PTIPeaks.monochromator_offsets, (datas, DX_AROUND_PEAK))
+
+    agree = numpy.isfinite(ex_offsets) & numpy.isfinite(numpy.array(old)[:, 0])
+    difference = numpy.max(abs(ex_offsets[agree] - numpy.array(old)[agree, 0]))
+    print("%d spectra" % len(datas))
+    print("curve_fit (5 fits each):  %.1f ms" % (1e3 * curve_fit_time))
+    print("batch (2 fits each):      %.1f ms" % (1e3 * batch_time))
+    print("largest offset difference %.1e nm over %d spectra fitted by both" % (difference, agree.sum()))
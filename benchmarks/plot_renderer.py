@@ -0,0 +1,70 @@
+'''
+Time to plot the 2016 sphere scans to PNG files: serially with
+PTIData.plot() and savefig as the plotting scripts did, with
+PTI.PlotRenderer on a fresh output directory (one SpectrumFigure redrawn
+for every spectrum), and with PTI.PlotRenderer
+again after one data file changed (only that file is drawn).
+
+Run from the repository root:
+    python benchmarks/plot_renderer.py
+'''
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import common
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib import pyplot as plt
+import PTI.PlotRenderer as PTIPlots
+from PTI.ReadDataFiles import PTIData
+
+
+def serial(paths, source_root, output_root):
+    for path in paths:
+        data = PTIData(path)
+        fig = data.plot()
+        fig.get_axes()[-1].axvline(x=data.ex_range[0], color='r', ls='--')
+        output = PTIPlots.mirror_path(path, source_root, output_root)
+        if not os.path.isdir(os.path.dirname(output)):
+            os.makedirs(os.path.dirname(output))
+        plt.savefig(output)
+        plt.close('all')
+
+
+if __name__ == '__main__':
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        # A copy of the data, so one file can be touched
+        sources = os.path.join(tmp_dir, 'data')
+        shutil.copytree(common.SPHERE_ROOT, sources)
+        paths = sorted(glob.glob(os.path.join(sources, '*', 'EmissionScan_*.txt')))
+        jobs = [PTIPlots.PlotJob(path, PTIPlots.mirror_path(path, sources, os.path.join(tmp_dir, 'plots')),
+                                 (-1,))
+                for path in paths]
+
+        # No entries for the copies in the user's cache (forked workers inherit this)
+        with common.private_cache():
+            serial_time = common.timed(serial, (paths, sources, os.path.join(tmp_dir, 'serial')))[0]
+
+            # The renderer's progress lines are not part of the benchmark output
+            stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+            try:
+                full_time = common.timed(PTIPlots.render, (jobs,))[0]
+
+                # Newer than its plot, as after a data drop
+                os.utime(paths[0], (time.time() + 10, time.time() + 10))
+                incremental_time = common.timed(PTIPlots.render, (jobs,))[0]
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+
+        print("%d spectra, %d processes" % (len(paths), PTIPlots.multiprocessing.cpu_count()))
+        print("serial, every plot:    %6.2f s" % serial_time)
+        print("renderer, every plot:  %6.2f s" % full_time)
+        print("renderer, one changed: %6.2f s" % incremental_time)
+    finally:
+        shutil.rmtree(tmp_dir)
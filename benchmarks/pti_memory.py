@@ -0,0 +1,57 @@
+'''
+Memory held by the whole 2016 corpus parsed into PTIData objects at once,
+and the time to pickle (as for a process pool), deep copy and shallow copy
+them.
+
+Run from the repository root (the memory figures need Python 3):
+    python benchmarks/pti_memory.py
+'''
+import copy
+import pickle
+
+import common
+from PTI.Loader import find_data_files
+from PTI.ReadDataFiles import PTIData
+
+ROOTS = ["Henry", "Noah", "QY Data"]
+
+
+def load_corpus(paths):
+    datas = list()
+    for path in paths:
+        try:
+            data = PTIData(path)
+        except Exception:
+            continue
+        if data.read_success:
+            datas.append(data)
+    return datas
+
+
+def timed(function, datas):
+    return common.timed(lambda: [function(data) for data in datas])
+
+
+if __name__ == '__main__':
+    paths = [path for root in ROOTS for path in find_data_files(root)]
+
+    with common.private_cache():
+        if common.tracemalloc:
+            common.tracemalloc.start()
+        datas = load_corpus(paths)
+        if common.tracemalloc:
+            held = common.tracemalloc.get_traced_memory()[0]
+            common.tracemalloc.stop()
+    samples = sum(data.num_samples for data in datas)
+    print("%d spectra, %d samples" % (len(datas), samples))
+    if common.tracemalloc:
+        print("memory held:  %.1f MB (%.0f bytes per sample)" % (held / 1e6, held / float(samples)))
+
+    elapsed, pickles = timed(lambda data: pickle.dumps(data, pickle.HIGHEST_PROTOCOL), datas)
+    print("pickle:       %.3f s, %.1f MB" % (elapsed, sum(len(p) for p in pickles) / 1e6))
+    elapsed, _ = timed(pickle.loads, pickles)
+    print("unpickle:     %.3f s" % elapsed)
+    elapsed, _ = timed(copy.deepcopy, datas)
+    print("deepcopy:     %.3f s" % elapsed)
+    elapsed, _ = timed(copy.copy, datas)
+    print("copy:         %.3f s" % elapsed)
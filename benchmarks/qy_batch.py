@@ -0,0 +1,61 @@
+'''
+Time for the QYs of the PPO 0.31 mM pairs over every correction region
+start of the 2016 sweep: the per-pair integrate_between loop of the QY
+scripts compared with one call of PTI.QuantumYield.quantum_yields over the
+stacked spectra (every start a row).
+
+Run from the repository root:
+    python benchmarks/qy_batch.py
+'''
+import numpy as np
+
+import common
+import PTI.Corrections as PTICorr
+import PTI.QuantumYield as PTIQY
+from PTI.ReadDataFiles import PTIData
+
+STARTS = np.arange(360, 372, 0.5)
+REPEATS = 20
+
+
+def corrected(path):
+    return [PTICorr.correct_raw_to_cor(PTIData(path % wl), baseline_fit_ranges=common.baseline_fit_ranges(wl))
+            for wl in common.EX_WAVELENGTHS]
+
+
+def loop(blanks, fluors):
+    QYs = list()
+    for start in STARTS:
+        for blank, fluor in zip(blanks, fluors):
+            ex_wavelength = blank.ex_range[0]
+            num_absorbed = PTIQY.integrate_between(blank, fluor, [ex_wavelength - 5, ex_wavelength + 5])
+            num_emitted = PTIQY.integrate_between(fluor, blank, [330, 450])
+            correction_area = PTIQY.integrate_between(fluor, blank, [start, 450])
+            QYs.append((num_emitted / num_absorbed, correction_area / num_emitted))
+    return QYs
+
+
+def batch(blanks, fluors):
+    ex = np.tile([blank.ex_range[0] for blank in blanks], STARTS.size)
+    return PTIQY.quantum_yields(blanks[0].wavelengths, blanks[0].step_size,
+                                np.tile([blank.cor_data for blank in blanks], (STARTS.size, 1)),
+                                np.tile([fluor.cor_data for fluor in fluors], (STARTS.size, 1)),
+                                np.column_stack([ex - 5, ex + 5]), [330, 450],
+                                np.column_stack([np.repeat(STARTS, len(blanks)),
+                                                 np.full(ex.size, 450.)]),
+                                normalize=False)
+
+
+if __name__ == '__main__':
+    with common.private_cache():
+        blanks = corrected(common.ETOH_BLANK)
+        fluors = corrected(common.PPO_0x31)
+
+    loop_time, looped = common.timed(loop, (blanks, fluors), REPEATS)
+    batch_time, batched = common.timed(batch, (blanks, fluors), REPEATS)
+    difference = np.max(abs(np.array(looped)[:, 0] - batched['QY']))
+
+    print("%d pairs" % len(looped))
+    print("integrate_between loop: %.2f ms" % (1e3 * loop_time))
+    print("quantum_yields:         %.2f ms" % (1e3 * batch_time))
+    print("speedup:                %.1fx (largest QY difference %.1e)" % (loop_time / batch_time, difference))
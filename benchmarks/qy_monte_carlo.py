@@ -0,0 +1,34 @@
+'''
+Throughput of the Monte Carlo QY uncertainty engine (PTI.QYMonteCarlo) on
+the 2016 ethanol / 0.31 mg/L PPO sphere scans (four excitation wavelengths).
+
+Run from the repository root:
+    python benchmarks/qy_monte_carlo.py
+'''
+import common
+import PTI.QYMonteCarlo as PTIMC
+from PTI.ReadDataFiles import PTIData
+
+NUM_REALIZATIONS = 100000
+
+
+def simulate(pairs):
+    return PTIMC.simulate_QY(pairs, em_int_range=[330, 450],
+                             baseline_fit_ranges=[common.baseline_fit_ranges(wl) for wl in common.EX_WAVELENGTHS],
+                             correction_region_starts=range(360, 372, 2),
+                             ex_shift=(0.83, 0.3), em_shift=(0.64, 0.3),
+                             counts_per_unit=2., num_realizations=NUM_REALIZATIONS, seed=0)
+
+
+if __name__ == '__main__':
+    with common.private_cache():
+        pairs = [(PTIData(common.ETOH_BLANK % wl), PTIData(common.PPO_0x31 % wl))
+                 for wl in common.EX_WAVELENGTHS]
+
+    elapsed, result = common.timed(simulate, (pairs,))
+
+    mean, std, lower, upper = PTIMC.confidence_interval(result['corrected_QY'])
+    print("%d realizations of %d spectrum pairs in %.2f s (%.0f realizations/s)"
+          % (NUM_REALIZATIONS, len(pairs), elapsed, NUM_REALIZATIONS / elapsed))
+    for wl, m, s, lo, hi in zip(common.EX_WAVELENGTHS, mean, std, lower, upper):
+        print("ex %d nm: QY = %.4f +- %.4f  (68%% interval %.4f - %.4f)" % (wl, m, s, lo, hi))
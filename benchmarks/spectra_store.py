@@ -0,0 +1,39 @@
+'''
+Time to get every 2016 integrating sphere scan as PTIData objects from the
+columnar store (PTI.SpectraStore) compared with parsing the text files.
+
+Run from the repository root:
+    python benchmarks/spectra_store.py
+The store is written to a temporary directory.
+'''
+import shutil
+import tempfile
+
+import common
+from PTI.ReadDataFiles import PTIData
+from PTI.SpectraStore import SpectraStore, ingest
+
+REPEATS = 20
+
+
+def read_store(store_dir, paths):
+    store = SpectraStore(store_dir)
+    return [store[path] for path in paths]
+
+
+if __name__ == '__main__':
+    paths = common.sphere_paths()
+    store_dir = tempfile.mkdtemp(prefix='PTI_store_')
+
+    try:
+        with common.private_cache():
+            ingest_time = common.timed(lambda: ingest(common.SPHERE_GLOB, store_dir, processes=1))[0]
+            parse_time = common.timed(lambda: [PTIData(path) for path in paths], repeats=REPEATS)[0]
+        store_time = common.timed(read_store, (store_dir, paths), REPEATS)[0]
+    finally:
+        shutil.rmtree(store_dir)
+
+    print("%d session files" % len(paths))
+    print("ingest:              %.1f ms" % (ingest_time * 1e3))
+    print("parse all files:     %.1f ms" % (parse_time * 1e3))
+    print("open store + slice:  %.1f ms" % (store_time * 1e3))
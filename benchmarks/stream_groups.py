@@ -0,0 +1,60 @@
+'''
+Peak memory of reading a long multi-group file: a synthetic session of
+many acquisitions (one detector group each) streamed group by group with
+iter_groups, compared with reading the whole file and then tokenizing it,
+as PTIData does for its single-acquisition files.
+
+Run from the repository root (the memory figures need Python 3):
+    python benchmarks/stream_groups.py
+'''
+import os
+import shutil
+import tempfile
+import numpy
+
+import common
+from PTI.ReadDataFiles import _IterBlocks, _Tokenizer, _Columns, iter_groups
+
+NUM_ACQUISITIONS = 200
+NUM_SAMPLES = 5001
+
+
+def write_session(path):
+    rng = numpy.random.RandomState(0)
+    wavelengths = numpy.linspace(250, 750, NUM_SAMPLES)
+    with open(path, 'w') as thefile:
+        thefile.write("<Session>\n")
+        for acquisition in range(NUM_ACQUISITIONS):
+            thefile.write("Acquisition %d 2016-08-30 15:%02d:%02d\n"
+                          % (acquisition + 1, acquisition // 60 % 60, acquisition % 60))
+            thefile.write("<Group>\nDetector1\n1\n%d\t\nD1 310:250-750\tT0\nX\tY\n" % NUM_SAMPLES)
+            for x, y in zip(wavelengths, rng.poisson(1000, NUM_SAMPLES)):
+                thefile.write("%g\t%d\n" % (x, y))
+            thefile.write("</Group>\n")
+        thefile.write("</Session>\n")
+
+
+def read_streamed(path):
+    return sum(group.columns[1].sum() for group in iter_groups(path))
+
+
+def read_whole(path):
+    with open(path, 'rb') as thefile:
+        contents = thefile.read()
+    return sum(_Columns(fields[5], fields[3])[1].sum() for fields in _IterBlocks(_Tokenizer(contents)))
+
+
+if __name__ == '__main__':
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'session.txt')
+        write_session(path)
+        print("%d acquisitions of %d samples, %.1f MB"
+              % (NUM_ACQUISITIONS, NUM_SAMPLES, os.path.getsize(path) / 1e6))
+        streamed = common.traced(lambda: read_streamed(path))
+        whole = common.traced(lambda: read_whole(path))
+        assert streamed[0] == whole[0]
+        print("whole file:  %6.3f s, peak %6.1f MB" % (whole[1], whole[2] / 1e6))
+        print("streamed:    %6.3f s, peak %6.1f MB" % (streamed[1], streamed[2] / 1e6))
+    finally:
+        shutil.rmtree(tmp_dir)
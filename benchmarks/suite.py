@@ -0,0 +1,311 @@
+'''
+Throughput of the analysis on synthetic data (see synthetic.py), for
+catching regressions: parsing session, trace and group files, loading
+through the data cache, the baseline fit, the excitation-peak fits, a full
+correction, the QY integrals and a small parameter sweep, run by
+ParameterSweep and by QYGrid. Nothing is read from the network or from
+the data directories.
+
+Alongside each benchmark a fixed workload of small numpy operations and
+Python calls (reference) is timed too, their timings alternating. The speed of a laptop or a
+shared machine drifts by tens of percent over a run, so benchmarks are
+compared by their time relative to the reference's.
+
+Every run is appended to HISTORY_PATH as one JSON line. With --save-baseline
+the run is also stored in BASELINE_PATH; later runs compare each benchmark
+with the baseline of the same sizes and flag the ones more than
+--tolerance slower. Both files belong to the machine they were measured
+on, so they are not committed.
+
+Run from the repository root:
+    python benchmarks/suite.py                      # 701 samples at 0.5 nm
+    python benchmarks/suite.py --samples 701 3501 --step 0.5 0.1
+    python benchmarks/suite.py --save-baseline
+    python benchmarks/suite.py --only parse correct
+Exits with status 1 when a benchmark regressed.
+'''
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy
+
+import common
+import synthetic
+import PTI.Corrections as PTICorr
+import PTI.ParameterSweep as PTISweep
+import PTI.PeakFitting as PTIPeaks
+import PTI.QYGrid as PTIGrid
+import PTI.QuantumYield as PTIQY
+from PTI.ReadDataFiles import PTIData
+
+HISTORY_PATH = os.path.join(common.BENCHMARKS_DIR, 'history.jsonl')
+BASELINE_PATH = os.path.join(common.BENCHMARKS_DIR, 'baseline.json')
+# A benchmark regressed when it is this much slower than its baseline
+TOLERANCE = 0.25
+# Timings of each benchmark; the fastest is kept
+REPEATS = 7
+# Each timing runs the benchmark for at least this long
+MIN_TIMING = 0.1
+
+SWEEP_GRID = [('shift_LUT', [False, True]),
+              ('use_baseline_se', [('none', 'none'), ('plus', 'minus')]),
+              (('ex_LUT_interpolation', 'em_LUT_interpolation'), [('linear', 'linear'), ('cubic', 'cubic')]),
+              (('ex_LUT_split', 'em_LUT_split'), [('none', 'none'), ('even', 'even')]),
+              ('const_diode', [False, True])]
+SWEEP_COLUMNS = [('Shift LUT?', 'shift_LUT'),
+                 ('Ex LUT Interpolation', 'ex_LUT_interpolation'),
+                 ('Ex LUT Split', 'ex_LUT_split'),
+                 ('Constant Diode', 'const_diode')]
+
+# The spectra of the sweep's analysis, set before it runs
+_sweep_data = dict()
+
+
+def _baseline_fit_ranges(data):
+    return [[data.wavelengths[0], data.ex_range[0] - 5], [450, 600]]
+
+
+def _correct(data, **options):
+    return PTICorr.correct_raw_to_cor(data, baseline_fit_ranges=_baseline_fit_ranges(data), **options)
+
+
+def sweep_QYs(**options):
+    '''The analysis of the sweep benchmark: QYs of the synthetic pairs, as the QY scripts'.'''
+    blanks = [_correct(data, **options) for data in _sweep_data['blank']]
+    fluors = [_correct(data, **options) for data in _sweep_data['fluor']]
+    result = PTIQY.pair_quantum_yields(blanks, fluors, ex_delta=5, em_int_range=[330, 450],
+                                       correction_int_range=[365, 450])
+    return list(result['corrected_QY'])
+
+
+def benchmarks(paths, tmp_dir):
+    '''[(name, function)] of every benchmark on the files of synthetic.write_dataset.'''
+    PTIData.use_cache = False
+    blanks = [PTIData(path) for path in paths['blank']]
+    fluors = [PTIData(path) for path in paths['fluor']]
+    blank = blanks[0]
+    corrected = [_correct(data) for data in blanks], [_correct(data) for data in fluors]
+    PTIData.use_cache = True
+
+    def parse(path):
+        def run():
+            PTIData.use_cache = False
+            try:
+                PTIData(path)
+            finally:
+                PTIData.use_cache = True
+        return run
+
+    def load_cached():
+        PTIData(paths['blank'][0])
+
+    def correct():
+        PTICorr.clear_stage_cache(blank)
+        _correct(blank, shift_LUT=True)
+
+    def integrate():
+        for blank_cor, fluor_cor in zip(*corrected):
+            PTIQY.integrate_between(fluor_cor, blank_cor, [330, 450])
+
+    def sweep():
+        PTICorr.clear_stage_cache()
+        _sweep_data.update(blank=blanks, fluor=fluors)
+        output_path = os.path.join(tmp_dir, 'sweep.txt')
+        PTISweep.run_sweep(sweep_QYs, SWEEP_GRID, output_path, columns=SWEEP_COLUMNS,
+                           result_headers=['%d nm' % wl for wl in synthetic.EX_WAVELENGTHS],
+                           processes=1)
+        os.remove(output_path)
+
+    def sweep_grid():
+        PTICorr.clear_stage_cache()
+        output_path = os.path.join(tmp_dir, 'sweep_grid.txt')
+        PTIGrid.write_QY_grid(blanks, fluors, SWEEP_GRID, output_path, columns=SWEEP_COLUMNS,
+                              result_headers=['%d nm' % wl for wl in synthetic.EX_WAVELENGTHS],
+                              baseline_fit_ranges=[_baseline_fit_ranges(data) for data in blanks],
+                              ex_delta=5, em_int_range=[330, 450], correction_region_end=450,
+                              correction_region_start=365)
+        os.remove(output_path)
+
+    return [('parse_session', parse(paths['blank'][0])),
+            ('parse_trace', parse(paths['trace'])),
+            ('parse_group', parse(paths['group'])),
+            ('load_cached', load_cached),
+            ('baseline_fit', lambda: PTICorr.linear_baseline(blank, _baseline_fit_ranges(blank))),
+            ('offset_fit', lambda: PTIPeaks.fit_excitation_peaks(blanks + fluors)),
+            ('correct', correct),
+            ('integrate', integrate),
+            ('quantum_yields', lambda: PTIQY.pair_quantum_yields(corrected[0], corrected[1], 5,
+                                                                 [330, 450], [365, 450])),
+            ('sweep', sweep),
+            ('sweep_grid', sweep_grid)]
+
+
+def reference():
+    x = numpy.linspace(0, 1, 701)
+    for i in range(20):
+        y = 3. * numpy.exp(-(x - 0.5) ** 2 / 0.01) + x
+        numpy.cumsum(y)
+        sorted(range(50), key=lambda value: -value)
+
+
+def _calls_per_timing(function):
+    '''Calls of function that take at least MIN_TIMING (after a first call to warm up).'''
+    function()
+    number = 1
+    while True:
+        start = common.clock()
+        for i in range(number):
+            function()
+        elapsed = common.clock() - start
+        if elapsed >= MIN_TIMING:
+            return number
+        number *= 2 if elapsed * 2 >= MIN_TIMING else 10
+
+
+def best_times(function, reference=reference):
+    '''
+    Seconds per call of function and of reference: the fastest of REPEATS
+    timings of each, each timing of at least MIN_TIMING. The timings of the
+    two alternate, so both see the same speed of the machine.
+    '''
+    numbers = [_calls_per_timing(function), _calls_per_timing(reference)]
+    best = [float('inf'), float('inf')]
+    for repeat in range(REPEATS):
+        for i, (measured, number) in enumerate(zip([function, reference], numbers)):
+            start = common.clock()
+            for call in range(number):
+                measured()
+            best[i] = min(best[i], (common.clock() - start) / number)
+    return best
+
+
+def size_key(num_samples, step):
+    return '%d samples, %g nm' % (num_samples, step)
+
+
+def run(sizes, only=None):
+    '''
+    {size_key: {benchmark: {'seconds': per call, 'reference': seconds per
+    call of reference() timed alongside}}} for each (num_samples, step)
+    of sizes.
+    '''
+    results = dict()
+    tmp_dir = tempfile.mkdtemp()
+    stdout = sys.stdout
+    try:
+        # load_cached times hits in a data cache of its own, not the user's
+        with common.private_cache(use_cache=True):
+            for num_samples, step in sizes:
+                data_dir = os.path.join(tmp_dir, size_key(num_samples, step).replace(' ', '_').replace(',', ''))
+                os.makedirs(data_dir)
+                paths = synthetic.write_dataset(data_dir, num_samples=num_samples, step=step)
+                times = dict()
+                for name, function in benchmarks(paths, tmp_dir):
+                    if only and not any(name.startswith(prefix) for prefix in only):
+                        continue
+                    # The sweep's progress lines are not part of the output
+                    sys.stdout = open(os.devnull, 'w')
+                    try:
+                        seconds, reference_seconds = best_times(function)
+                        times[name] = {'seconds': seconds, 'reference': reference_seconds}
+                    finally:
+                        sys.stdout.close()
+                        sys.stdout = stdout
+                results[size_key(num_samples, step)] = times
+    finally:
+        shutil.rmtree(tmp_dir)
+    return results
+
+
+def _git_commit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=common.REPOSITORY_DIR,
+                                         stderr=open(os.devnull, 'w'))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('ascii').strip()
+
+
+def make_record(results):
+    return {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': _git_commit(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'results': results}
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Print each time with its baseline and the ratio of their times relative
+    to the reference; returns the [(size, benchmark)] that regressed.
+    '''
+    regressions = list()
+    for key in sorted(results):
+        print(key)
+        base_times = baseline['results'].get(key, dict()) if baseline else dict()
+        for name, times in sorted(results[key].items()):
+            line = "    %-16s %10.3f ms" % (name, 1e3 * times['seconds'])
+            if name in base_times:
+                base = base_times[name]
+                ratio = (times['seconds'] / times['reference']) / (base['seconds'] / base['reference'])
+                line += "   baseline %10.3f ms  relative %5.2fx" % (1e3 * base['seconds'], ratio)
+                if ratio > 1 + tolerance:
+                    line += "  REGRESSION"
+                    regressions.append((key, name))
+            print(line)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the analysis on synthetic data and compare "
+                                                 "with the stored baseline.")
+    parser.add_argument('--samples', type=int, nargs='+', default=[701],
+                        help="samples per spectrum (default: %(default)s)")
+    parser.add_argument('--step', type=float, nargs='+', default=[0.5],
+                        help="wavelength steps in nm (default: %(default)s)")
+    parser.add_argument('--only', nargs='+', help="run only the benchmarks starting with these names")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="slowdown flagged as a regression (default: %(default)s)")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--history', default=HISTORY_PATH, help="history file (default: %(default)s)")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline file (default: %(default)s)")
+    args = parser.parse_args()
+
+    sizes = [(num_samples, step) for num_samples in args.samples for step in args.step]
+    record = make_record(run(sizes, args.only))
+
+    with open(args.history, 'a') as thefile:
+        thefile.write(json.dumps(record, sort_keys=True) + '\n')
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r') as thefile:
+            baseline = json.load(thefile)
+        print("Baseline: %s (commit %s, Python %s)" % (baseline['time'], baseline['commit'],
+                                                       baseline['python']))
+    regressions = compare(record['results'], baseline, args.tolerance)
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            # Keep the sizes this run did not measure
+            with open(args.baseline, 'r') as thefile:
+                old_results = json.load(thefile)['results']
+            old_results.update(record['results'])
+            record['results'] = old_results
+        with open(args.baseline, 'w') as thefile:
+            json.dump(record, thefile, indent=1, sort_keys=True)
+        print("Saved the baseline to %s" % args.baseline)
+    elif baseline is None:
+        print("No baseline yet; store one with --save-baseline")
+
+    if regressions:
+        print("ERROR!! Slower than the baseline by more than %d%%: %s"
+              % (100 * args.tolerance, ', '.join('%s (%s)' % (name, key) for key, name in regressions)))
+        sys.exit(1)
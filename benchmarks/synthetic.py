@@ -0,0 +1,145 @@
+'''
+Synthetic PTI text files for the benchmarks, laid out as the instrument
+writes them:
+- session files: <Session>, an Acquisition line, a Detector1 <Group> with
+  the raw and the [COR] trace and an RCQCSignal <Group> with the ExCorr
+  photodiode trace;
+- trace files: one <Trace>, as exported from a session;
+- group files: one <Group>, as the correction tables in PTI/correction_data.
+
+The spectra look like the 2016 sphere emission scans: a background falling
+from about 60 counts, the scattered excitation peak (about 700 counts) and
+its second order at twice the wavelength, shifted by the monochromator
+offsets EX_OFFSET and EM_SHIFT, an optional fluorescence band and Poisson
+noise. Any number of samples and any step can be asked for.
+
+    import synthetic
+
+    paths = synthetic.write_dataset(directory, num_samples=701, step=0.5)
+'''
+import os
+import numpy
+
+# Monochromator offsets built into the peaks (see PTI.PeakFitting.monochromator_offsets)
+EX_OFFSET = 0.8
+EM_SHIFT = 0.64
+# Excitation wavelengths of the 2016 scans
+EX_WAVELENGTHS = (310, 320, 330, 340)
+ACQ_START = '2016-08-30 15:12:20'
+
+
+def emission_scan(ex_wavelength=310, em_start=300, num_samples=701, step=0.5,
+                  fluorescence=0., seed=0):
+    '''
+    (wavelengths, raw_data, cor_data, diode) of a synthetic emission scan.
+    fluorescence is the height (counts) of an emission band at 370 nm;
+    light absorbed by the sample is taken from the excitation peak.
+    '''
+    rng = numpy.random.RandomState(seed)
+    wavelengths = em_start + step * numpy.arange(num_samples)
+    true_excitation = ex_wavelength + EX_OFFSET
+
+    background = 8. + 52. * numpy.exp(-(wavelengths - em_start) / 40.)
+    height = 700. - 2 * fluorescence
+    excitation = height * numpy.exp(-(wavelengths - (true_excitation - EM_SHIFT)) ** 2 / (2 * 1.7))
+    second_order = 0.15 * height * numpy.exp(-(wavelengths - (2 * true_excitation - EM_SHIFT)) ** 2 / 8.)
+    emission = fluorescence * numpy.exp(-(wavelengths - 370.) ** 2 / (2 * 20. ** 2))
+    raw_data = rng.poisson(background + excitation + second_order + emission).astype(float)
+
+    diode = 0.0816 + 0.0003 * rng.standard_normal(num_samples)
+    # The instrument's correction: the diode and a smooth emission LUT
+    cor_data = raw_data / diode * (1.44 + 0.0004 * (wavelengths - em_start))
+    return wavelengths, raw_data, cor_data, diode
+
+
+def _label(ex_wavelength, wavelengths):
+    return "D1 %g:%g-%g" % (ex_wavelength, wavelengths[0], wavelengths[-1])
+
+
+def write_session(path, ex_wavelength=310, em_start=300, num_samples=701, step=0.5,
+                  fluorescence=0., acq_start=ACQ_START, seed=0):
+    '''Write a session file of emission_scan(...) to path.'''
+    wavelengths, raw_data, cor_data, diode = emission_scan(ex_wavelength, em_start, num_samples,
+                                                           step, fluorescence, seed)
+    label = _label(ex_wavelength, wavelengths)
+    lines = ["<Session>",
+             "Acquisition 1 %s" % acq_start,
+             "<Group>",
+             "Detector1",
+             "2",
+             "%d\t\t%d\t" % (num_samples, num_samples),
+             "%s\tT636070406482221396\t%s [COR]\tT636070406482221398" % (label, label),
+             "X\tY\tX\tY"]
+    lines += ["%.9g\t%.9g\t%.9g\t%.9g" % row
+              for row in zip(wavelengths, raw_data, wavelengths, cor_data)]
+    lines += ["</Group>",
+              "<Group>",
+              "RCQCSignal",
+              "1",
+              "%d\t" % num_samples,
+              "ExCorr\tT636070406482221397",
+              "X\tY"]
+    lines += ["%.9g\t%.9g" % row for row in zip(wavelengths, diode)]
+    lines += ["</Group>", "</Session>"]
+    with open(path, 'w') as thefile:
+        thefile.write('\n'.join(lines) + '\n')
+    return path
+
+
+def write_trace(path, ex_wavelength=310, em_start=300, num_samples=701, step=0.5,
+                fluorescence=0., seed=0):
+    '''Write the [COR] trace of emission_scan(...) to path.'''
+    wavelengths, raw_data, cor_data, diode = emission_scan(ex_wavelength, em_start, num_samples,
+                                                           step, fluorescence, seed)
+    lines = ["<Trace>",
+             "%d" % num_samples,
+             "%s [COR]" % _label(ex_wavelength, wavelengths),
+             "X\tY\t"]
+    lines += ["%.9g\t%.9g" % row for row in zip(wavelengths, cor_data)]
+    lines += ["</Trace>"]
+    with open(path, 'w') as thefile:
+        thefile.write('\n'.join(lines) + '\n')
+    return path
+
+
+def write_group(path, name='excorr', start=250, num_samples=501, step=1., seed=0):
+    '''
+    Write a correction table with a smooth random curve to path. The file
+    name must contain excorr or emcorr, as PTIData tells the kind of table
+    by it.
+    '''
+    rng = numpy.random.RandomState(seed)
+    wavelengths = start + step * numpy.arange(num_samples)
+    values = (0.45 + 2.3 * ((wavelengths - start) / (step * num_samples)) ** 1.5 +
+              0.002 * rng.standard_normal(num_samples))
+    lines = ["<Group>",
+             "Detector1",
+             "1",
+             "%d\t" % num_samples,
+             "%s\tT634436666737984840" % name,
+             "X\tY"]
+    lines += ["%.9g\t%.9g" % row for row in zip(wavelengths, values)]
+    lines += ["</Group>"]
+    with open(path, 'w') as thefile:
+        thefile.write('\n'.join(lines) + '\n')
+    return path
+
+
+def write_dataset(directory, num_samples=701, step=0.5, em_start=300,
+                  ex_wavelengths=EX_WAVELENGTHS, fluorescence=150.):
+    '''
+    Write a blank and a fluor session at each excitation wavelength, a trace
+    and a correction table to directory. Returns {'blank': [paths],
+    'fluor': [paths], 'trace': path, 'group': path}.
+    '''
+    paths = {'blank': list(), 'fluor': list()}
+    for i, ex_wavelength in enumerate(ex_wavelengths):
+        for kind, height in [('blank', 0.), ('fluor', fluorescence)]:
+            path = os.path.join(directory, 'EmissionScan_%s_ex%d.txt' % (kind, ex_wavelength))
+            paths[kind].append(write_session(path, ex_wavelength, em_start, num_samples, step,
+                                             height, seed=2 * i + (kind == 'fluor')))
+    paths['trace'] = write_trace(os.path.join(directory, 'EmissionScan_trace.txt'),
+                                 ex_wavelengths[0], em_start, num_samples, step)
+    paths['group'] = write_group(os.path.join(directory, 'excorr_table.txt'),
+                                 num_samples=num_samples, step=step)
+    return paths
@@ -1,14 +1,13 @@
 import copy
 import itertools
-import matplotlib.pyplot as plt
 import numpy as np
-import scipy as sp
-import statsmodels.api as sm
 
 
 import PTI.Corrections as PTICorr
-from PTI.ReadDataFiles import PTIData
 import PTI.QuantumYield as PTIQY
+import PTI.Loader as PTILoad
+import PTI.QYGrid as PTIGrid
+import PTI.PeakFitting as PTIPeaks
 
 # <editor-fold desc="Importing">
 # The file paths for the blank LAB measurements
@@ -23,14 +22,12 @@ bisMSB_4x47_paths = ["Henry/Sphere/bisMSB_LAB/EmissionScan_bisMSBinLAB_4.47mgL_e
                      "Henry/Sphere/bisMSB_LAB/EmissionScan_bisMSBinLAB_4.47mgL_ex370_2sec_160824.txt",
                      "Henry/Sphere/bisMSB_LAB/EmissionScan_bisMSBinLAB_4.47mgL_ex380_2sec_160824.txt"]
 
-def convert_paths_to_PTIData_objs(list_of_paths):
-    list_of_PTIData = list()
-    for path in list_of_paths:
-        list_of_PTIData.append(PTIData(path))
-    return list_of_PTIData
+LAB = PTILoad.load(LAB_paths)[0]
+bisMSB_4x47 = PTILoad.load(bisMSB_4x47_paths)[0]
 
-LAB = convert_paths_to_PTIData_objs(LAB_paths)
-bisMSB_4x47 = convert_paths_to_PTIData_objs(bisMSB_4x47_paths)
+# Fit the excitation peaks of every spectrum together, once, up front; every
+# shift_LUT=True correction below reuses these fits
+PTIPeaks.cached_excitation_peaks(LAB + bisMSB_4x47)
 # </editor-fold>
 
 
@@ -66,38 +63,17 @@ def QY_analysis(correction_region_start = DEFAULT_CORRECTION_REGION_START,
                                                         use_baseline_se=use_baseline_se)
                              for data in bisMSB_4x47]
 
-    QYs = list()
-    correction_ratios = list()
-    for blank, fluor in zip(corrected_LAB, corrected_bisMSB_4x47):
-        # Define the emission region used for the quantum yield calculation
-        ex_wavelength = blank.ex_range[0]
-        ex_delta = 5
-        ex_int_range = [ex_wavelength - ex_delta, ex_wavelength + ex_delta]
-
-        em_int_range = [365, 525]
-        correction_int_range = [correction_region_start, 525]
-
-        # QY
-        num_absorbed = PTIQY.integrate_between(blank, fluor, ex_int_range)
-        num_emitted = PTIQY.integrate_between(fluor, blank, em_int_range)
-        correction_area = PTIQY.integrate_between(fluor, blank, correction_int_range)
-
-        QYs.append(num_emitted / num_absorbed)
-        correction_ratios.append(correction_area / num_emitted)
-
-    correction_ratios = np.array(correction_ratios)
-    first_ratio = correction_ratios[0]
-    ratio_accepted_error = 0.1
-    similar_ratios = correction_ratios[np.where(abs(correction_ratios - first_ratio) < ratio_accepted_error)]
-
-    corrected_QYs = [QYs[i] * correction_ratios[i] / np.mean(similar_ratios)
-                                 for i in range(len(QYs))]
+    # Absorption within ex_delta of each excitation wavelength, emission over em_int_range
+    result = PTIQY.pair_quantum_yields(corrected_LAB, corrected_bisMSB_4x47, ex_delta=5,
+                                       em_int_range=[365, 525],
+                                       correction_int_range=[correction_region_start, 525],
+                                       ratio_accepted_error=0.1)
+    corrected_QYs = list(result['corrected_QY'])
+    correction_ratios = result['correction_ratio']
 
     return corrected_QYs, correction_ratios
 
 
-QYs = list()
-
 LUT_interpolation_options = [(a,b) for a in ['linear', 'slinear', 'quadratic', 'cubic'] for b in ['linear', 'slinear', 'quadratic', 'cubic']]
 LUT_splitting_options = [(a,b) for a in ['none', 'even', 'odd'] for b in ['none', 'even', 'odd']]
 const_diode_options = [False, True]
@@ -188,33 +164,26 @@ def run_correction_region_options():
 
 
 def run_all_options():
-    f = open("QY Uncertainty Data/bisMSB_4x47/all_options.txt", 'w+')
-    f.write("InterceptSE,Slope SE,Constant Diode,Ex LUT Interpolation,Em LUT Interpolation," +
-            "Ex LUT Split,Em LUT Split,Shift LUT?,Start of Correction Region,350 nm,360 nm,370 nm,380 nm\n")
-    for start in correction_region_initial_wavelengths:
-        for shift_LUT in LUT_shifting_options:
-            for use_baseline_se in baseline_se_options:
-                for ex_LUT_interpolation, em_LUT_interpolation in LUT_interpolation_options:
-                    for ex_LUT_split, em_LUT_split in LUT_splitting_options:
-                        for const_diode in const_diode_options:
-                            f.write(use_baseline_se[0] + ',' + use_baseline_se[0] + ',')
-                            f.write(str(const_diode) + ',')
-                            f.write(ex_LUT_interpolation + ',' + em_LUT_interpolation + ',')
-                            f.write(ex_LUT_split + ',' + em_LUT_split + ',')
-                            f.write(str(shift_LUT) + ',')
-                            f.write(str(start))
-
-                            for item in QY_analysis(correction_region_start=start,
-                                                    use_baseline_se=use_baseline_se,
-                                                    ex_LUT_interpolation= ex_LUT_interpolation,
-                                                    em_LUT_interpolation=em_LUT_interpolation,
-                                                    shift_LUT=shift_LUT,
-                                                    ex_LUT_split=ex_LUT_split,
-                                                    em_LUT_split=em_LUT_split,
-                                                    const_diode=const_diode)[0]:
-                                f.write(',' + str(item))
-                            f.write('\n')
-    f.close()
+    grid = [('correction_region_start', correction_region_initial_wavelengths),
+            ('shift_LUT', LUT_shifting_options),
+            ('use_baseline_se', baseline_se_options),
+            (('ex_LUT_interpolation', 'em_LUT_interpolation'), LUT_interpolation_options),
+            (('ex_LUT_split', 'em_LUT_split'), LUT_splitting_options),
+            ('const_diode', const_diode_options)]
+    PTIGrid.write_QY_grid(LAB, bisMSB_4x47, grid, "QY Uncertainty Data/bisMSB_4x47/all_options.txt",
+                          baseline_fit_ranges=4 * [[[300, 325], [550, 650]]],
+                          ex_delta=5, em_int_range=[365, 525], correction_region_end=525,
+                          ex_shift=DEFAULT_EX_MONOCHROMATOR_SHIFT, em_shift=DEFAULT_EM_MONOCHROMATOR_SHIFT,
+                          columns=[('InterceptSE', 'use_baseline_se', 0),
+                                   ('Slope SE', 'use_baseline_se', 1),
+                                   ('Constant Diode', 'const_diode'),
+                                   ('Ex LUT Interpolation', 'ex_LUT_interpolation'),
+                                   ('Em LUT Interpolation', 'em_LUT_interpolation'),
+                                   ('Ex LUT Split', 'ex_LUT_split'),
+                                   ('Em LUT Split', 'em_LUT_split'),
+                                   ('Shift LUT?', 'shift_LUT'),
+                                   ('Start of Correction Region', 'correction_region_start')],
+                          result_headers=['350 nm', '360 nm', '370 nm', '380 nm'])
     print "Finished running all combinations of the options"
 
 print QY_analysis()[0]
@@ -1,26 +1,12 @@
-import matplotlib.pyplot as plt
-from PTI.ReadDataFiles import PTIData
-
-import glob, os
-
-all_paths = list()
-for root, dirs, files in os.walk("Noah/PTI System Check"):
-    for f in files:
-        fullpath = os.path.join(root, f)
-        if os.path.splitext(fullpath)[1] == '.txt':
-            all_paths.append(fullpath)
-
-for path in all_paths:
-    try:
-        data = PTIData(path)
-
-        fig = data.plot()
-
-        fname = path.split('/')[-1]
-        plt.savefig('Noah/PTI System Check/Plots/' + fname + '.png')
-        plt.close('all')
-
-    except KeyboardInterrupt:
-        break
-    except:
-        plt.close('all')
+import os
+import PTI.Loader as PTILoad
+import PTI.PlotRenderer as PTIPlots
+
+if __name__ == '__main__':
+    all_paths = PTILoad.find_data_files("Noah/PTI System Check")
+
+    # Only the files added or changed since the last run are drawn, in parallel;
+    # files that cannot be drawn are reported
+    jobs = [PTIPlots.PlotJob(path, 'Noah/PTI System Check/Plots/' + os.path.basename(path) + '.png', ())
+            for path in all_paths]
+    PTIPlots.render(jobs)